@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.02
+SILENCE_WINDOW_SECONDS = 0.4
+MIN_CHUNK_SECONDS = 30.0
+# a cut needs a pause at least this long, and quieter than SILENCE_RATIO times the median frame
+MIN_PAUSE_SECONDS = 0.3
+SILENCE_RATIO = 0.1
+
+
+def frame_energy(audio: np.ndarray, frame_samples: int) -> np.ndarray:
+    frame_count = len(audio) // frame_samples
+    if frame_count == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = audio[: frame_count * frame_samples].reshape(frame_count, frame_samples)
+    return np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+
+
+def pause_frames(energy: np.ndarray, min_frames: int) -> tuple[np.ndarray, np.ndarray]:
+    # runs of at least min_frames frames below a tenth of the median frame energy (-20 dB
+    # under typical speech), as (start, end) frame indices
+    silent = np.concatenate([[False], energy <= SILENCE_RATIO * float(np.median(energy)), [False]])
+    edges = np.flatnonzero(np.diff(silent.astype(np.int8)))
+    starts, ends = edges[::2], edges[1::2]
+    keep = ends - starts >= min_frames
+    return starts[keep], ends[keep]
+
+
+def split_on_silence(
+    audio: np.ndarray,
+    max_chunk_seconds: float,
+    sample_rate: int = SAMPLE_RATE,
+) -> list[tuple[int, int]]:
+    # cut in the middle of the last real pause late in each window, so chunks end between words;
+    # without one, look further back before settling for the quietest stretch. Ranges are
+    # contiguous and never overlap, so seams cannot duplicate words
+    total = len(audio)
+    max_samples = int(max_chunk_seconds * sample_rate)
+    if total <= max_samples:
+        return [(0, total)]
+
+    frame_samples = int(FRAME_SECONDS * sample_rate)
+    energy = frame_energy(audio, frame_samples)
+    window = max(1, int(SILENCE_WINDOW_SECONDS / FRAME_SECONDS))
+    smoothed = np.convolve(energy, np.ones(window, dtype=np.float32) / window, mode="same")
+    pause_starts, pause_ends = pause_frames(energy, max(1, int(MIN_PAUSE_SECONDS / FRAME_SECONDS)))
+
+    max_frames = max_samples // frame_samples
+    min_frames = max(1, int(min(max_chunk_seconds / 2, MIN_CHUNK_SECONDS) * sample_rate) // frame_samples)
+    ranges: list[tuple[int, int]] = []
+    start_frame = 0
+    while (len(energy) - start_frame) > max_frames:
+        lo = start_frame + min_frames
+        hi = start_frame + max_frames
+        # the last pause that starts before the window ends; one running past the end is cut at the end
+        last = int(np.searchsorted(pause_starts, hi)) - 1
+        cut_frame = None
+        if last >= 0:
+            cut_frame = min(hi, (int(pause_starts[last]) + int(pause_ends[last])) // 2)
+            if cut_frame < start_frame + max(1, min_frames // 2):
+                cut_frame = None
+        if cut_frame is None:
+            window_energy = smoothed[lo:hi]
+            floor = float(window_energy.min())
+            quiet = np.flatnonzero(window_energy <= floor + 0.1 * (float(np.median(window_energy)) - floor))
+            cut_frame = lo + int(quiet[-1])
+        ranges.append((start_frame * frame_samples, cut_frame * frame_samples))
+        start_frame = cut_frame
+    ranges.append((start_frame * frame_samples, total))
+    return ranges
+
+
+def target_chunk_seconds(duration_seconds: float, max_chunk_seconds: float, workers: int) -> float:
+    if workers <= 1:
+        return max_chunk_seconds
+    return min(max_chunk_seconds, max(MIN_CHUNK_SECONDS, duration_seconds / workers))
+
+
+def join_chunk_texts(texts: list[str]) -> str:
+    return " ".join(text.strip() for text in texts if text.strip())
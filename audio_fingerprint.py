@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from audio_chunks import SAMPLE_RATE
+
+# chromaprint-style sub-fingerprints: one 32-bit word per 32 ms hop, each bit the sign of how
+# the energy difference between two adjacent bands changed since the previous frame
+FINGERPRINT_FRAME_SAMPLES = 4096
+FINGERPRINT_HOP_SAMPLES = 512
+FINGERPRINT_BAND_EDGES_HZ = np.geomspace(300, 4000, 34)
+FINGERPRINT_BLOCK_FRAMES = 512
+# every 4th word is stored (~115 KB per hour); the file being checked keeps all of them, so
+# alignment is still found to within one hop
+STORED_FRAME_STRIDE = 4
+# unrelated audio sits near 0.5; re-encodes, gain changes and small offsets stay well below 0.15
+MAX_BIT_ERROR_RATE = 0.2
+DURATION_TOLERANCE_SECONDS = 2.0
+# the offset search scores every 8th stored word, then the best offset is scored on all of them
+ALIGNMENT_SAMPLE_STRIDE = 8
+MIN_OVERLAP = 0.9
+
+_FREQS = np.fft.rfftfreq(FINGERPRINT_FRAME_SAMPLES, 1.0 / SAMPLE_RATE)
+_BANDS = np.digitize(_FREQS, FINGERPRINT_BAND_EDGES_HZ) - 1
+_BAND_BINS = (_BANDS >= 0) & (_BANDS < len(FINGERPRINT_BAND_EDGES_HZ) - 1)
+_BAND_STARTS = np.searchsorted(_BANDS[_BAND_BINS], np.arange(len(FINGERPRINT_BAND_EDGES_HZ) - 1))
+_WINDOW = np.hanning(FINGERPRINT_FRAME_SAMPLES).astype(np.float32)
+
+
+@dataclass(frozen=True)
+class AudioFingerprint:
+    content_hash: str
+    duration_seconds: float
+    frames: np.ndarray
+
+
+def content_hash(audio: np.ndarray) -> str:
+    pcm = np.clip(audio * 32767.0, -32768, 32767).astype("<i2")
+    return hashlib.sha256(pcm.tobytes()).hexdigest()
+
+
+def frame_fingerprints(audio: np.ndarray) -> np.ndarray:
+    if len(audio) < FINGERPRINT_FRAME_SAMPLES + FINGERPRINT_HOP_SAMPLES:
+        return np.empty(0, dtype="<u4")
+    frames = np.lib.stride_tricks.sliding_window_view(audio, FINGERPRINT_FRAME_SAMPLES)[::FINGERPRINT_HOP_SAMPLES]
+    energies = []
+    # a block of frames at a time, so hour-long files stay within a few MB
+    for start in range(0, len(frames), FINGERPRINT_BLOCK_FRAMES):
+        power = np.abs(np.fft.rfft(frames[start : start + FINGERPRINT_BLOCK_FRAMES] * _WINDOW, axis=1)) ** 2
+        energies.append(np.add.reduceat(power[:, _BAND_BINS], _BAND_STARTS, axis=1))
+    differences = np.diff(np.concatenate(energies), axis=1)
+    bits = np.diff(differences, axis=0) > 0
+    return np.packbits(bits, axis=1, bitorder="little").view("<u4").ravel()
+
+
+def fingerprint_audio(audio: np.ndarray) -> AudioFingerprint:
+    return AudioFingerprint(
+        content_hash=content_hash(audio),
+        duration_seconds=len(audio) / SAMPLE_RATE,
+        frames=frame_fingerprints(audio),
+    )
+
+
+def _bit_error_rate(stored: np.ndarray, frames: np.ndarray, offset: int, sample_stride: int = 1) -> float | None:
+    # stored[k] lines up with frames[k * STORED_FRAME_STRIDE + offset]
+    first = max(0, (STORED_FRAME_STRIDE - 1 - offset) // STORED_FRAME_STRIDE)
+    last = min(len(stored), (len(frames) - 1 - offset) // STORED_FRAME_STRIDE + 1)
+    if last - first < MIN_OVERLAP * len(stored):
+        return None
+    indexes = np.arange(first, last, sample_stride)
+    errors = np.bitwise_xor(stored[indexes], frames[indexes * STORED_FRAME_STRIDE + offset])
+    return float(np.unpackbits(errors.view(np.uint8)).sum()) / (32 * len(indexes))
+
+
+def sequence_bit_error_rate(stored: np.ndarray, frames: np.ndarray) -> float:
+    # the lowest bit error rate over time offsets within the duration tolerance
+    if len(stored) == 0 or len(frames) == 0:
+        return 1.0
+    max_offset = round(DURATION_TOLERANCE_SECONDS * SAMPLE_RATE / FINGERPRINT_HOP_SAMPLES)
+    scored = [
+        (rate, offset)
+        for offset in range(-max_offset, max_offset + 1)
+        if (rate := _bit_error_rate(stored, frames, offset, ALIGNMENT_SAMPLE_STRIDE)) is not None
+    ]
+    if not scored:
+        return 1.0
+    _, offset = min(scored)
+    return _bit_error_rate(stored, frames, offset)
+
+
+class FingerprintIndex:
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(fingerprints)")}
+        if columns and "frames" not in columns:
+            # rows from the old 128-bit fingerprint keep only their exact hash
+            with self._db:
+                self._db.execute("ALTER TABLE fingerprints RENAME TO fingerprints_coarse")
+                self._create_tables()
+                self._db.execute(
+                    "INSERT INTO fingerprints (content_hash, duration, frames, transcript_name, audio_name, created_at) "
+                    "SELECT content_hash, duration, NULL, transcript_name, audio_name, created_at "
+                    "FROM fingerprints_coarse"
+                )
+                self._db.execute("DROP TABLE fingerprints_coarse")
+        self._create_tables()
+
+    def _create_tables(self) -> None:
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                id INTEGER PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                duration REAL NOT NULL,
+                frames BLOB,
+                transcript_name TEXT NOT NULL,
+                audio_name TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS fingerprints_hash ON fingerprints (content_hash)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS fingerprints_duration ON fingerprints (duration)")
+
+    def find_duplicates(self, fingerprint: AudioFingerprint) -> list[str]:
+        # exact decoded-audio matches first, then recordings of similar length whose frame
+        # sequences line up with few bit errors; both lookups are index range scans
+        with self._lock:
+            exact = self._db.execute(
+                "SELECT transcript_name FROM fingerprints WHERE content_hash = ? ORDER BY id DESC",
+                (fingerprint.content_hash,),
+            ).fetchall()
+            near = self._db.execute(
+                "SELECT transcript_name, frames FROM fingerprints "
+                "WHERE duration BETWEEN ? AND ? AND frames IS NOT NULL",
+                (
+                    fingerprint.duration_seconds - DURATION_TOLERANCE_SECONDS,
+                    fingerprint.duration_seconds + DURATION_TOLERANCE_SECONDS,
+                ),
+            ).fetchall()
+        names = [name for (name,) in exact]
+        ranked = sorted(
+            (sequence_bit_error_rate(np.frombuffer(frames, dtype="<u4"), fingerprint.frames), name)
+            for name, frames in near
+            if name not in names
+        )
+        names.extend(name for rate, name in ranked if rate <= MAX_BIT_ERROR_RATE and name not in names)
+        return names
+
+    def add(self, fingerprint: AudioFingerprint, transcript_name: str, audio_name: str) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO fingerprints "
+                "(content_hash, duration, frames, transcript_name, audio_name, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    fingerprint.content_hash,
+                    fingerprint.duration_seconds,
+                    fingerprint.frames[::STORED_FRAME_STRIDE].tobytes(),
+                    transcript_name,
+                    audio_name,
+                    time.time(),
+                ),
+            )
+
+    def close(self) -> None:
+        self._db.close()
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import difflib
+import json
+import resource
+import subprocess
+import sys
+import time
+from dataclasses import replace
+from pathlib import Path
+
+from transcribe_helpers import TRANSCRIBE_BACKEND_NAMES, load_backend_config
+
+
+def measure(engine: str, audio_path: Path, threads: int) -> dict[str, object]:
+    from audio_chunks import SAMPLE_RATE
+    from transcribe_backends import BACKENDS, load_backend
+
+    config = replace(load_backend_config(), engine=engine, language_routes=None)
+    started = time.perf_counter()
+    backend = load_backend(config, threads)
+    load_seconds = time.perf_counter() - started
+    audio = BACKENDS[engine].load_audio(audio_path)
+    started = time.perf_counter()
+    text = backend.transcribe(audio)
+    transcribe_seconds = time.perf_counter() - started
+    audio_seconds = len(audio) / SAMPLE_RATE
+    return {
+        "backend": engine,
+        "model": config.model_name,
+        "compute_type": config.compute_type if engine == "ctranslate2" else "fp32",
+        "threads": float(threads),
+        "audio_seconds": audio_seconds,
+        "load_seconds": load_seconds,
+        "transcribe_seconds": transcribe_seconds,
+        "realtime_factor": audio_seconds / transcribe_seconds if transcribe_seconds else 0.0,
+        # ru_maxrss is in KiB on Linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "text": text,
+    }
+
+
+def run_isolated(engine: str, audio_path: Path, threads: int) -> dict[str, object]:
+    # one process per backend, so peak RSS is that backend's alone
+    result = subprocess.run(
+        [sys.executable, "-m", "bench.backends", "--child", engine, "--threads", str(threads), str(audio_path)],
+        check=False,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        return {"backend": engine, "error": result.stderr.strip().splitlines()[-1:] or ["failed"]}
+    return json.loads(result.stdout)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure speed and peak RSS of each transcription backend.")
+    parser.add_argument("audio", type=Path, help="a real audio file (a few minutes long is enough)")
+    parser.add_argument(
+        "--backends",
+        default=",".join(TRANSCRIBE_BACKEND_NAMES),
+        help="comma-separated backends to compare",
+    )
+    parser.add_argument("--threads", type=int, default=0, help="CPU threads per backend (0 = library default)")
+    parser.add_argument("--child", choices=TRANSCRIBE_BACKEND_NAMES, help=argparse.SUPPRESS)
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    if args.child:
+        with contextlib.redirect_stdout(sys.stderr):
+            result = measure(args.child, args.audio, args.threads)
+        print(json.dumps(result))
+        return 0
+
+    results = {
+        engine: run_isolated(engine, args.audio, args.threads)
+        for engine in args.backends.split(",")
+        if engine.strip()
+    }
+    texts = [result["text"].split() for result in results.values() if "text" in result]
+    report: dict[str, object] = {
+        engine: {key: value for key, value in result.items() if key != "text"}
+        for engine, result in results.items()
+    }
+    if len(texts) == 2:
+        # word-level agreement between the two transcripts; quantization should barely move it
+        report["word_agreement"] = difflib.SequenceMatcher(None, texts[0], texts[1], autojunk=False).ratio()
+    print(json.dumps(report, indent=2, sort_keys=True))
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    return 0 if all("error" not in result for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
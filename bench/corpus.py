@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import random
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from audio_chunks import SAMPLE_RATE
+
+_VOCABULARY = (
+    "so basically the idea here is that we want to understand how the system behaves "
+    "when load increases and what that means for latency throughput and cost in practice "
+    "um you know there are a few key points first second and third let me explain each"
+).split()
+
+
+def make_transcripts(directory: Path, count: int, min_words: int, max_words: int, seed: int = 0) -> list[Path]:
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths: list[Path] = []
+    for index in range(count):
+        sentences: list[str] = []
+        remaining = rng.randint(min_words, max_words)
+        while remaining > 0:
+            length = min(remaining, rng.randint(6, 20))
+            sentences.append(" ".join(rng.choices(_VOCABULARY, k=length)).capitalize() + ".")
+            remaining -= length
+        path = directory / f"synthetic-{index:04d}.txt"
+        path.write_text(" ".join(sentences), encoding="utf-8")
+        paths.append(path)
+    return paths
+
+
+def read_wav(path: Path) -> np.ndarray:
+    # the corpus is already 16 kHz mono, so no ffmpeg or whisper is needed to decode it
+    with wave.open(str(path), "rb") as file:
+        pcm = np.frombuffer(file.readframes(file.getnframes()), dtype="<i2")
+    return pcm.astype(np.float32) / 32768.0
+
+
+def make_audio(directory: Path, count: int, min_seconds: float, max_seconds: float, seed: int = 0) -> list[Path]:
+    # speech-like bursts of band-limited noise separated by short pauses, as 16 kHz mono wav
+    rng = np.random.default_rng(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths: list[Path] = []
+    for index in range(count):
+        duration = float(rng.uniform(min_seconds, max_seconds))
+        samples = np.zeros(int(duration * SAMPLE_RATE), dtype=np.float32)
+        position = 0
+        while position < len(samples):
+            burst = int(rng.uniform(0.5, 4.0) * SAMPLE_RATE)
+            noise = rng.normal(0, 0.2, burst).astype(np.float32)
+            noise = np.convolve(noise, np.ones(8, dtype=np.float32) / 8, mode="same")
+            samples[position:position + burst] = noise[: len(samples) - position]
+            position += burst + int(rng.uniform(0.2, 0.8) * SAMPLE_RATE)
+        path = directory / f"synthetic-{index:04d}.wav"
+        with wave.open(str(path), "wb") as file:
+            file.setnchannels(1)
+            file.setsampwidth(2)
+            file.setframerate(SAMPLE_RATE)
+            file.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+        paths.append(path)
+    return paths
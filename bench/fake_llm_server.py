@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_TRANSCRIPT_ID_RE = re.compile(r'<<<begin_transcript id="([^"]+)"')
+
+
+@dataclass(frozen=True)
+class FakeServerConfig:
+    latency_seconds: float = 0.05
+    rate_limit_every: int = 0
+    retry_delay_seconds: int = 1
+    truncate_every: int = 0
+    summary_words: int = 60
+    stream_chunk_chars: int = 64
+
+
+@dataclass
+class FakeServerStats:
+    requests: int = 0
+    completions: int = 0
+    rate_limited: int = 0
+    truncated: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    max_in_flight: int = 0
+
+
+def fake_completion_text(prompt: str, summary_words: int) -> str:
+    body = " ".join(f"point{index}" for index in range(summary_words))
+    ids = _TRANSCRIPT_ID_RE.findall(prompt)
+    if not ids:
+        return f"summary: {body}"
+    return "\n".join(
+        f'<<<begin_summary id="{item_id}">>>\nsummary of {item_id}: {body}\n<<<end_summary>>>'
+        for item_id in ids
+    )
+
+
+class FakeLLMServer:
+    def __init__(self, config: FakeServerConfig, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.config = config
+        self.stats = FakeServerStats()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    def __enter__(self) -> FakeLLMServer:
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.stats = FakeServerStats()
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, like the real providers: clients reuse pooled connections; headers and
+            # body are separate writes, so Nagle would hold the body for the delayed ACK
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format: str, *args: object) -> None:
+                return
+
+            def do_POST(self) -> None:
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+                length = int(self.headers.get("Content-Length") or 0)
+                request = json.loads(self.rfile.read(length) or b"{}")
+                server._handle_completion(self, request)
+
+            def _send_json(self, status: int, payload: dict, headers: dict[str, str] | None = None) -> None:
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def _handle_completion(self, handler, request: dict) -> None:
+        with self._lock:
+            self.stats.requests += 1
+            number = self.stats.requests
+            self._in_flight += 1
+            self.stats.max_in_flight = max(self.stats.max_in_flight, self._in_flight)
+        try:
+            time.sleep(self.config.latency_seconds)
+            if self.config.rate_limit_every and number % self.config.rate_limit_every == 0:
+                with self._lock:
+                    self.stats.rate_limited += 1
+                delay = self.config.retry_delay_seconds
+                handler._send_json(
+                    429,
+                    {
+                        "error": {
+                            "code": 429,
+                            "status": "RESOURCE_EXHAUSTED",
+                            "message": f"Quota exceeded. Please retry in {delay}s.",
+                            "details": [{"retryDelay": f"{delay}s"}],
+                        }
+                    },
+                    # keep the SDK's own retry loop out of the measurement
+                    {"x-should-retry": "false"},
+                )
+                return
+
+            messages = request.get("messages") or []
+            prompt = "\n".join(str(message.get("content") or "") for message in messages)
+            content = fake_completion_text(prompt, self.config.summary_words)
+            if self.config.truncate_every and number % self.config.truncate_every == 0:
+                content = content[: len(content) // 2]
+                with self._lock:
+                    self.stats.truncated += 1
+            prompt_tokens = len(prompt) // 4
+            completion_tokens = len(content) // 4
+            with self._lock:
+                self.stats.completions += 1
+                self.stats.prompt_tokens += prompt_tokens
+                self.stats.completion_tokens += completion_tokens
+
+            model = request.get("model") or "fake-model"
+            if request.get("stream"):
+                self._stream(handler, model, content, prompt_tokens, completion_tokens)
+                return
+            handler._send_json(
+                200,
+                {
+                    "id": f"fake-{number}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                },
+            )
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def _stream(self, handler, model: str, content: str, prompt_tokens: int, completion_tokens: int) -> None:
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        # no length up front: the end of the stream is the end of the connection
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+        step = self.config.stream_chunk_chars
+        for start in range(0, len(content), step):
+            chunk = {
+                "id": "fake-stream",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [
+                    {"index": 0, "delta": {"content": content[start:start + step]}, "finish_reason": None}
+                ],
+            }
+            handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+        # what stream_options={"include_usage": true} asks for: a last chunk with usage and no choices
+        usage_chunk = {
+            "id": "fake-stream",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+        handler.wfile.write(f"data: {json.dumps(usage_chunk)}\n\n".encode("utf-8"))
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import hashlib
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+from audio_chunks import SAMPLE_RATE
+
+_WORDS = (
+    "the", "model", "audio", "pipeline", "summary", "lecture", "question", "answer",
+    "topic", "detail", "because", "however", "example", "result", "system", "data",
+)
+
+
+def wav_duration_seconds(path: Path) -> float:
+    with wave.open(str(path), "rb") as file:
+        return file.getnframes() / float(file.getframerate())
+
+
+class FakeWhisperModel:
+    # stands in for whisper.load_model(...) inside a WhisperBackend: same transcribe() contract,
+    # deterministic text derived from the input, and a configurable realtime factor
+    def __init__(self, realtime_factor: float = 200.0, words_per_second: float = 2.5) -> None:
+        self.realtime_factor = realtime_factor
+        self.words_per_second = words_per_second
+        self.calls = 0
+
+    def transcribe(self, audio, **kwargs) -> dict:
+        self.calls += 1
+        if isinstance(audio, np.ndarray):
+            duration = len(audio) / SAMPLE_RATE
+            seed = hashlib.sha256(audio[: SAMPLE_RATE].tobytes()).digest()
+        else:
+            duration = wav_duration_seconds(Path(audio))
+            seed = hashlib.sha256(Path(audio).name.encode("utf-8")).digest()
+        time.sleep(duration / self.realtime_factor)
+        word_count = max(1, int(duration * self.words_per_second))
+        words = [_WORDS[(seed[index % len(seed)] + index) % len(_WORDS)] for index in range(word_count)]
+        text = " ".join(words)
+        return {
+            "text": f" {text}.",
+            "segments": [{"start": 0.0, "end": duration, "text": f" {text}."}],
+            "language": "en",
+        }
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+from pathlib import Path
+from typing import Iterator
+
+from bench.corpus import make_audio, make_transcripts, read_wav
+from bench.fake_llm_server import FakeLLMServer, FakeServerConfig
+from bench.fake_whisper import FakeWhisperModel
+
+# metrics where a larger value is better; everything else compared is "lower is better"
+HIGHER_IS_BETTER = ("files_per_second", "audio_seconds_per_second")
+COMPARED_METRICS = HIGHER_IS_BETTER + ("requests_per_transcript", "failed")
+
+
+class Timers:
+    def __init__(self) -> None:
+        self.seconds: dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def wrap(self, name: str, fn):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(name, time.perf_counter() - started)
+
+        return wrapper
+
+
+@contextlib.contextmanager
+def workspace(env: dict[str, str]) -> Iterator[Path]:
+    previous_cwd = Path.cwd()
+    previous_env = {name: os.environ.get(name) for name in env}
+    directory = Path(tempfile.mkdtemp(prefix="transcribe-yt-bench-"))
+    os.environ.update(env)
+    os.chdir(directory)
+    try:
+        yield directory
+    finally:
+        os.chdir(previous_cwd)
+        for name, value in previous_env.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def patched(target, name: str, replacement) -> Iterator[None]:
+    original = getattr(target, name)
+    setattr(target, name, replacement)
+    try:
+        yield
+    finally:
+        setattr(target, name, original)
+
+
+def bench_transcription(files: int, realtime_factor: float) -> dict[str, object]:
+    import transcribe
+    from transcribe_backends import WhisperBackend
+
+    with workspace({"TRANSCRIBE_DEDUPE": "0", "TRANSCRIBE_BACKEND": "whisper"}), patched(
+        WhisperBackend, "load_audio", staticmethod(read_wav)
+    ):
+        make_audio(Path("audios"), files, 5.0, 40.0)
+        transcribe.ensure_output_dirs()
+        backend = WhisperBackend(FakeWhisperModel(realtime_factor=realtime_factor))
+        started = time.perf_counter()
+        outcomes = [transcribe.transcribe_file(path, backend) for path in transcribe.iter_audio_files()]
+        wall = time.perf_counter() - started
+    audio_seconds = sum(outcome.audio_seconds for outcome in outcomes)
+    return {
+        "files": float(len(outcomes)),
+        "failed": float(sum(1 for outcome in outcomes if not outcome.ok)),
+        "wall_seconds": wall,
+        "files_per_second": len(outcomes) / wall if wall else 0.0,
+        "audio_seconds_per_second": audio_seconds / wall if wall else 0.0,
+    }
+
+
+def bench_summarization(
+    server: FakeLLMServer,
+    transcripts: int,
+    env: dict[str, str],
+) -> dict[str, object]:
+    import summarize
+    import summarize_helpers
+
+    timers = Timers()
+    original_execute = summarize.execute_summary_request
+
+    def timed_execute(**kwargs):
+        # everything inside execute_summary_request that is not the request itself is
+        # cooldown waiting, retry bookkeeping and UsageState I/O
+        request_fn = kwargs["request_fn"]
+        kwargs["request_fn"] = timers.wrap("request", request_fn)
+        started = time.perf_counter()
+        try:
+            return original_execute(**kwargs)
+        finally:
+            timers.add("execute_summary_request", time.perf_counter() - started)
+
+    server.reset_stats()
+    base_env = {
+        "SUMMARY_PROVIDER": "openai",
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": server.base_url,
+        "SUMMARY_CACHE_MAX_MB": "0",
+        "SUMMARY_NEAR_DUPLICATE_THRESHOLD": "0",
+        "GEMINI_DAILY_REQUEST_CAP": "100000",
+        "GEMINI_QUOTA_RETRY_ATTEMPTS": "100",
+    }
+    with workspace({**base_env, **env}), patched(
+        summarize, "execute_summary_request", timed_execute
+    ), patched(
+        summarize_helpers.UsageState,
+        "_save_state",
+        timers.wrap("usage_state_io", summarize_helpers.UsageState._save_state),
+    ), patched(
+        summarize_helpers.UsageState,
+        "_load",
+        timers.wrap("usage_state_io", summarize_helpers.UsageState._load),
+    ):
+        make_transcripts(Path("transcriptions"), transcripts, 200, 4000)
+        started = time.perf_counter()
+        summarize.main()
+        wall = time.perf_counter() - started
+        summarized = len(list(Path("summaries").glob("*.md"))) if Path("summaries").is_dir() else 0
+
+    stats = server.stats
+    execute_seconds = timers.seconds.get("execute_summary_request", 0.0)
+    return {
+        "transcripts": float(transcripts),
+        "summarized": float(summarized),
+        "wall_seconds": wall,
+        "files_per_second": summarized / wall if wall else 0.0,
+        "requests": float(stats.requests),
+        "requests_per_transcript": stats.requests / summarized if summarized else 0.0,
+        "rate_limited": float(stats.rate_limited),
+        "truncated": float(stats.truncated),
+        "max_in_flight": float(stats.max_in_flight),
+        "retry_overhead_seconds": max(0.0, execute_seconds - timers.seconds.get("request", 0.0)),
+        "usage_state_io_seconds": timers.seconds.get("usage_state_io", 0.0),
+    }
+
+
+def run_suite(quick: bool) -> dict[str, dict[str, object]]:
+    scale = 1 if quick else 4
+    results: dict[str, dict[str, object]] = {}
+    results["transcribe_serial"] = bench_transcription(files=10 * scale, realtime_factor=400.0)
+
+    scenarios = {
+        "summarize_batched": (FakeServerConfig(latency_seconds=0.1), {}),
+        "summarize_single": (FakeServerConfig(latency_seconds=0.1), {"GEMINI_SUMMARY_BATCH_SIZE": "1"}),
+        "summarize_single_async": (
+            FakeServerConfig(latency_seconds=0.1),
+            {"GEMINI_SUMMARY_BATCH_SIZE": "1", "SUMMARY_MAX_IN_FLIGHT": "8"},
+        ),
+        "summarize_rate_limited": (
+            FakeServerConfig(latency_seconds=0.05, rate_limit_every=3, retry_delay_seconds=1),
+            {"GEMINI_SUMMARY_BATCH_SIZE": "4"},
+        ),
+        "summarize_truncated": (
+            FakeServerConfig(latency_seconds=0.05, truncate_every=2),
+            {"GEMINI_SUMMARY_BATCH_SIZE": "4"},
+        ),
+    }
+    for name, (config, env) in scenarios.items():
+        with FakeLLMServer(config) as server:
+            results[name] = bench_summarization(server, transcripts=12 * scale, env=env)
+        results[name]["server_config"] = asdict(config)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions: list[str] = []
+    for scenario, metrics in results.items():
+        for metric in COMPARED_METRICS:
+            old = (baseline.get(scenario) or {}).get(metric)
+            new = metrics.get(metric)
+            if old is None or new is None:
+                continue
+            if metric in HIGHER_IS_BETTER:
+                regressed = new < old * (1 - tolerance)
+            else:
+                regressed = new > old * (1 + tolerance)
+            if regressed:
+                regressions.append(f"{scenario}.{metric}: {old:.3f} -> {new:.3f}")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmarks.")
+    parser.add_argument("--quick", action="store_true", help="small corpora (for CI)")
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    parser.add_argument("--baseline", type=Path, help="compare against an earlier --output file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative regression")
+    args = parser.parse_args(argv)
+
+    # the pipeline's own progress logs go to stderr so stdout stays a clean report
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_suite(args.quick)
+
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    # failures finish instantly and would read as a speedup, so any failure fails the run
+    failures = [name for name, result in results.items() if result.get("failed")]
+    for name in failures:
+        print(f"failed: {name} had {results[name]['failed']:.0f} failed files", file=sys.stderr)
+    regressions: list[str] = []
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+    return 1 if failures or regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1 @@
+# keeps the repository root importable (bench/, summarize.py, ...) when tests run via plain `pytest`
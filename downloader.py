@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Callable, ContextManager, Iterator, Protocol
+
+import metrics
+from jobs import JobStore, get_job_store
+from transcribe_helpers import AUDIO_DIR, log
+
+
+@dataclass(frozen=True)
+class DownloadConfig:
+    parallel: int
+    retries: int
+    backoff_seconds: float
+    max_backoff_seconds: float
+    skip_known: bool
+
+
+class VideoArchive:
+    # yt-dlp's download_archive takes any container with "in" and add(): it checks ids before
+    # extracting each video (and each playlist entry) and adds them once downloaded
+    def __init__(self, store: JobStore, url: str, skip_known: bool = True) -> None:
+        self._store = store
+        self._url = url
+        self._skip_known = skip_known
+
+    def __contains__(self, archive_id: object) -> bool:
+        return self._skip_known and isinstance(archive_id, str) and self._store.has_video(archive_id)
+
+    def add(self, archive_id: str) -> None:
+        self._store.record_video(archive_id, self._url)
+
+
+@dataclass(frozen=True)
+class StreamSource:
+    url: str
+    archive_id: str
+    # the file name a regular download would get in audios/
+    name: str
+    # yields the native audio stream as it downloads
+    open: Callable[[], ContextManager[IO[bytes]]]
+
+
+class Extractor(Protocol):
+    def archive_id(self, url: str) -> str | None: ...
+
+    def download(self, url: str, archive: VideoArchive) -> list[Path]: ...
+
+    def resolve_stream(self, url: str, archive: VideoArchive) -> StreamSource | None: ...
+
+
+class YtDlpExtractor:
+    def __init__(self, output_dir: Path = AUDIO_DIR) -> None:
+        try:
+            from yt_dlp.extractor import gen_extractor_classes
+        except ImportError as exc:
+            raise RuntimeError("downloading needs yt-dlp (pip install yt-dlp)") from exc
+
+        self._output_dir = output_dir
+        self._extractors = list(gen_extractor_classes())
+
+    def archive_id(self, url: str) -> str | None:
+        # "<extractor> <id>" from the url alone, in yt-dlp's archive format; playlists and
+        # urls whose id needs a page fetch give None and go through extraction
+        from yt_dlp.utils import make_archive_id
+
+        for extractor in self._extractors:
+            if extractor.suitable(url):
+                video_id = extractor.get_temp_id(url)
+                return make_archive_id(extractor, video_id) if video_id else None
+        return None
+
+    def _params(self, archive: VideoArchive) -> dict[str, object]:
+        return {
+            # keep the native audio stream: no mp3 re-encode, Whisper decodes it anyway
+            "format": "bestaudio/best",
+            "outtmpl": str(self._output_dir / "%(title)s.%(ext)s"),
+            "noprogress": True,
+            "download_archive": archive,
+        }
+
+    def download(self, url: str, archive: VideoArchive) -> list[Path]:
+        import yt_dlp
+
+        paths: list[Path] = []
+        params = {
+            **self._params(archive),
+            "postprocessors": [{"key": "FFmpegExtractAudio", "preferredcodec": "best"}],
+            # called with the final path once every postprocessor is done
+            "post_hooks": [lambda filepath: paths.append(Path(filepath))],
+        }
+        with yt_dlp.YoutubeDL(params) as ydl:
+            ydl.download([url])
+        return paths
+
+    def resolve_stream(self, url: str, archive: VideoArchive) -> StreamSource | None:
+        # one video with a single audio-only format can be piped; playlists, merged formats
+        # and video-only fallbacks (which need ffmpeg's audio extraction) take the regular path
+        import yt_dlp
+        from yt_dlp.utils import make_archive_id
+
+        with yt_dlp.YoutubeDL(self._params(archive)) as ydl:
+            result = ydl.extract_info(url, download=False, process=False)
+            if result is None or result.get("_type", "video") not in {"video", "url", "url_transparent"}:
+                return None
+            info = ydl.process_ie_result(result, download=False)
+            if (
+                info is None
+                or info.get("_type", "video") != "video"
+                or info.get("requested_formats")
+                or info.get("vcodec") not in {None, "none"}
+            ):
+                return None
+            name = Path(ydl.prepare_filename(info)).name
+            info = ydl.sanitize_info(info)
+        return StreamSource(
+            url=url,
+            archive_id=make_archive_id(info["extractor_key"], info["id"]),
+            name=name,
+            open=lambda: _yt_dlp_stdout(info),
+        )
+
+
+@contextlib.contextmanager
+def _yt_dlp_stdout(info: dict[str, object]) -> Iterator[IO[bytes]]:
+    # yt-dlp's own downloader (chunked requests, fragments) writing the file to stdout; the
+    # resolved info is handed over so the page is not extracted a second time
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        info_path = Path(tmp_dir) / "info.json"
+        info_path.write_text(json.dumps(info), encoding="utf-8")
+        process = subprocess.Popen(
+            [
+                "yt-dlp",
+                "--quiet",
+                "--no-progress",
+                "--load-info-json",
+                str(info_path),
+                "-f",
+                "bestaudio/best",
+                "-o",
+                "-",
+            ],
+            stdout=subprocess.PIPE,
+        )
+        try:
+            yield process.stdout
+        except BaseException:
+            process.kill()
+            raise
+        finally:
+            # a reader that stops early closes the pipe, so yt-dlp exits instead of blocking
+            process.stdout.close()
+            returncode = process.wait()
+        if returncode != 0:
+            raise RuntimeError(f"yt-dlp exited with {returncode}")
+
+
+class Downloader:
+    # a bounded pool of in-process yt-dlp downloads; each finished file is handed to on_audio
+    # from the pool thread that downloaded it
+    def __init__(
+        self,
+        config: DownloadConfig,
+        on_audio: Callable[[Path], None],
+        extractor: Extractor | None = None,
+        store: JobStore | None = None,
+        stop: threading.Event | None = None,
+        on_stream: Callable[[StreamSource, VideoArchive], bool] | None = None,
+    ) -> None:
+        self._config = config
+        self._on_audio = on_audio
+        self._on_stream = on_stream
+        self._extractor = extractor
+        self._store = store or get_job_store()
+        self._stop = stop or threading.Event()
+        self._executor: ThreadPoolExecutor | None = None
+        self._futures: dict[str, Future] = {}
+        self._skipped: set[str] = set()
+
+    def start(self, urls: list[str]) -> None:
+        if not urls:
+            return
+        if self._extractor is None:
+            self._extractor = YtDlpExtractor()
+        claimed: set[str] = set()
+        pending: list[str] = []
+        for url in urls:
+            archive_id = self._extractor.archive_id(url) if self._config.skip_known else None
+            if archive_id is not None and (archive_id in claimed or self._store.has_video(archive_id)):
+                # no network, no decode: the same video under another url, now or in an earlier run
+                log(f"skipping {url} (already processed: {archive_id})")
+                self._store.forget_url(url)
+                self._skipped.add(url)
+                continue
+            if archive_id is not None:
+                claimed.add(archive_id)
+            self._store.add_url(url)
+            pending.append(url)
+        if not pending:
+            return
+        log(f"download: {len(pending)} pending urls ({self._config.parallel} in parallel)")
+        self._executor = ThreadPoolExecutor(max_workers=self._config.parallel, thread_name_prefix="download")
+        self._futures = {url: self._executor.submit(self._download, url) for url in pending}
+
+    def wait(self) -> set[str]:
+        # urls that need no further download: fetched now, or skipped as already processed
+        done = set(self._skipped)
+        for url, future in self._futures.items():
+            if future.result():
+                done.add(url)
+        if self._executor is not None:
+            self._executor.shutdown()
+        return done
+
+    def download_all(self, urls: list[str]) -> set[str]:
+        self.start(urls)
+        return self.wait()
+
+    def _download(self, url: str) -> bool:
+        attempts = self._config.retries + 1
+        for attempt in range(1, attempts + 1):
+            if self._stop.is_set():
+                return False
+            log(f"downloading: {url}")
+            started = time.monotonic()
+            archive = VideoArchive(self._store, url, self._config.skip_known)
+            try:
+                if self._on_stream is not None:
+                    source = self._extractor.resolve_stream(url, archive)
+                    if source is not None:
+                        if self._on_stream(source, archive):
+                            log(f"done: {url}")
+                            return True
+                        if self._stop.is_set():
+                            return False
+                        log(f"streaming {url} failed; downloading it instead")
+                paths = self._extractor.download(url, archive)
+            except Exception as exc:
+                error = str(exc).strip().splitlines()[-1:] or [type(exc).__name__]
+                self._store.record_url_failure(url, f"download: {error[0]}")
+                if attempt == attempts:
+                    log(f"failed: {url} after {attempts} attempts ({error[0]})")
+                    return False
+                delay = min(self._config.max_backoff_seconds, self._config.backoff_seconds * 2 ** (attempt - 1))
+                log(f"download failed: {url} ({error[0]}); retrying in {delay:g}s ({attempt}/{self._config.retries})")
+                if self._stop.wait(delay):
+                    return False
+                continue
+            seconds = time.monotonic() - started
+            log(f"done: {url}")
+            if paths:
+                self._store.record_download(url, [path.stem for path in paths], seconds)
+            else:
+                # every video behind the url was already in the archive
+                self._store.forget_url(url)
+            metrics.record(
+                "download",
+                url=url,
+                seconds=seconds,
+                bytes=sum(path.stat().st_size for path in paths if path.is_file()),
+                attempts=attempt,
+            )
+            for path in paths:
+                self._on_audio(path)
+            return True
+        return False
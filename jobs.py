@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from summarize_helpers import SUMMARIES_DIR
+from transcribe_helpers import (
+    ARCHIVE_TRANSCRIPTIONS_DIR,
+    AUDIO_DIR,
+    FINISHED_DIR,
+    STATE_DIR,
+    TRANSCRIPTIONS_DIR,
+    is_audio_file,
+    log,
+)
+
+JOB_STORE_PATH = STATE_DIR / "jobs.sqlite3"
+URLS_PATH = Path("urls.txt")
+
+JOB_QUEUED = "queued"
+JOB_DOWNLOADED = "downloaded"
+JOB_TRANSCRIBED = "transcribed"
+JOB_SUMMARIZED = "summarized"
+JOB_STATUSES = (JOB_QUEUED, JOB_DOWNLOADED, JOB_TRANSCRIBED, JOB_SUMMARIZED)
+
+
+class JobStore:
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY,
+                url TEXT UNIQUE,
+                stem TEXT UNIQUE,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                downloaded_at REAL,
+                download_seconds REAL,
+                transcribed_at REAL,
+                transcribe_seconds REAL,
+                summarized_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, updated_at);
+            CREATE TABLE IF NOT EXISTS videos (
+                archive_id TEXT PRIMARY KEY,
+                url TEXT,
+                recorded_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+    def add_url(self, url: str) -> None:
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs (url, status, created_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(url) DO NOTHING",
+                (url, JOB_QUEUED, now, now),
+            )
+
+    def record_download(self, url: str, stems: list[str], seconds: float) -> None:
+        now = time.time()
+        with self._lock, self._db:
+            for index, stem in enumerate(stems):
+                if index == 0:
+                    # the url's queued row becomes the audio's row, unless the audio is already known
+                    if self._stem_exists(stem):
+                        self._db.execute("DELETE FROM jobs WHERE url = ? AND stem IS NULL", (url,))
+                        self._db.execute(
+                            "UPDATE jobs SET url = ? WHERE stem = ? AND url IS NULL "
+                            "AND NOT EXISTS (SELECT 1 FROM jobs WHERE url = ?)",
+                            (url, stem, url),
+                        )
+                    else:
+                        self._db.execute(
+                            "INSERT INTO jobs (url, status, created_at, updated_at) VALUES (?, ?, ?, ?) "
+                            "ON CONFLICT(url) DO NOTHING",
+                            (url, JOB_QUEUED, now, now),
+                        )
+                        self._db.execute("UPDATE jobs SET stem = ? WHERE url = ?", (stem, url))
+                self._db.execute(
+                    "INSERT INTO jobs (stem, status, created_at, updated_at, downloaded_at, download_seconds) "
+                    "VALUES (?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(stem) DO UPDATE SET status = excluded.status, attempts = 0, "
+                    "last_error = NULL, updated_at = excluded.updated_at, "
+                    "downloaded_at = excluded.downloaded_at, download_seconds = excluded.download_seconds",
+                    (stem, JOB_DOWNLOADED, now, now, now, seconds),
+                )
+
+    def forget_url(self, url: str) -> None:
+        # a url that was skipped before it was ever downloaded
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM jobs WHERE url = ? AND stem IS NULL", (url,))
+
+    def has_video(self, archive_id: str) -> bool:
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM videos WHERE archive_id = ?", (archive_id,)).fetchone() is not None
+
+    def record_video(self, archive_id: str, url: str | None = None) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO videos (archive_id, url, recorded_at) VALUES (?, ?, ?) ON CONFLICT(archive_id) DO NOTHING",
+                (archive_id, url, time.time()),
+            )
+
+    def video_count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+
+    def record_audio(self, stem: str) -> None:
+        # audio that showed up in audios/ without a download (copied in by hand)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs (stem, status, created_at, updated_at, downloaded_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(stem) DO NOTHING",
+                (stem, JOB_DOWNLOADED, now, now, now),
+            )
+
+    def record_transcribed(self, stem: str, seconds: float | None = None) -> None:
+        self._upsert_stem(
+            stem,
+            JOB_TRANSCRIBED,
+            "transcribed_at = excluded.updated_at, transcribe_seconds = ?",
+            (seconds,),
+        )
+
+    def record_summarized(self, stem: str) -> None:
+        self._upsert_stem(stem, JOB_SUMMARIZED, "summarized_at = excluded.updated_at")
+
+    def record_url_failure(self, url: str, error: str) -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET attempts = attempts + 1, last_error = ?, updated_at = ? WHERE url = ?",
+                (error, time.time(), url),
+            )
+
+    def record_failure(self, stem: str, error: str) -> None:
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs (stem, status, attempts, last_error, created_at, updated_at) "
+                "VALUES (?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT(stem) DO UPDATE SET attempts = attempts + 1, "
+                "last_error = excluded.last_error, updated_at = excluded.updated_at",
+                (stem, JOB_DOWNLOADED, error, now, now),
+            )
+
+    def pending_stems(self, status: str) -> list[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT stem FROM jobs WHERE status = ? AND stem IS NOT NULL ORDER BY updated_at, id",
+                (status,),
+            ).fetchall()
+        return [stem for (stem,) in rows]
+
+    def pending_transcripts(self) -> list[Path]:
+        paths = (TRANSCRIPTIONS_DIR / f"{stem}.txt" for stem in self.pending_stems(JOB_TRANSCRIBED))
+        return [path for path in paths if path.is_file()]
+
+    def status_counts(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def recent_errors(self, limit: int = 10) -> list[tuple[str, str, int, str]]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COALESCE(stem, url), status, attempts, last_error FROM jobs "
+                "WHERE last_error IS NOT NULL ORDER BY updated_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+
+    def import_existing(self, force: bool = False) -> int:
+        # one-time migration from the directory layout; later runs keep the table current.
+        # A forced rescan also requeues transcripts copied into transcriptions/ by hand, even
+        # when their row is further along (an old download, or a summary since deleted)
+        with self._lock:
+            if not force and self._db.execute("SELECT 1 FROM meta WHERE name = 'imported'").fetchone():
+                return 0
+        found_stems, found_urls = scan_directories()
+        now = time.time()
+        with self._lock, self._db:
+            known = dict(self._db.execute("SELECT stem, status FROM jobs WHERE stem IS NOT NULL").fetchall())
+            for stem, status in found_stems.items():
+                current = known.get(stem)
+                requeue = force and status == JOB_TRANSCRIBED and current != status
+                if (
+                    current is not None
+                    and not requeue
+                    and JOB_STATUSES.index(current) >= JOB_STATUSES.index(status)
+                ):
+                    continue
+                self._db.execute(
+                    "INSERT INTO jobs (stem, status, created_at, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(stem) DO UPDATE SET status = excluded.status, updated_at = excluded.updated_at",
+                    (stem, status, now, now),
+                )
+            for url in found_urls:
+                self._db.execute(
+                    "INSERT INTO jobs (url, status, created_at, updated_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(url) DO NOTHING",
+                    (url, JOB_QUEUED, now, now),
+                )
+            self._db.execute(
+                "INSERT OR REPLACE INTO meta (name, value) VALUES ('imported', ?)",
+                (str(now),),
+            )
+        imported = len(found_stems) + len(found_urls)
+        log(f"job store: imported {imported} jobs from existing directories")
+        return imported
+
+    def _stem_exists(self, stem: str) -> bool:
+        return self._db.execute("SELECT 1 FROM jobs WHERE stem = ?", (stem,)).fetchone() is not None
+
+    def _upsert_stem(self, stem: str, status: str, extra: str, extra_args: tuple = ()) -> None:
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO jobs (stem, status, created_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(stem) DO UPDATE SET status = excluded.status, attempts = 0, "
+                f"last_error = NULL, updated_at = excluded.updated_at, {extra}",
+                (stem, status, now, now, *extra_args),
+            )
+
+
+def scan_directories() -> tuple[dict[str, str], list[str]]:
+    stems: dict[str, str] = {}
+
+    def mark(stem: str, status: str) -> None:
+        current = stems.get(stem)
+        if current is None or JOB_STATUSES.index(status) > JOB_STATUSES.index(current):
+            stems[stem] = status
+
+    for directory, status in ((AUDIO_DIR, JOB_DOWNLOADED), (FINISHED_DIR, JOB_TRANSCRIBED)):
+        if directory.is_dir():
+            for path in directory.iterdir():
+                if path.is_file() and is_audio_file(path):
+                    mark(path.stem, status)
+    if TRANSCRIPTIONS_DIR.is_dir():
+        for path in TRANSCRIPTIONS_DIR.glob("*.txt"):
+            mark(path.stem, JOB_TRANSCRIBED)
+    for directory in (ARCHIVE_TRANSCRIPTIONS_DIR, SUMMARIES_DIR):
+        if directory.is_dir():
+            for path in directory.iterdir():
+                if path.is_file() and path.suffix in {".txt", ".md"}:
+                    mark(path.stem, JOB_SUMMARIZED)
+
+    return stems, read_urls()
+
+
+def read_urls(path: Path = URLS_PATH) -> list[str]:
+    if not path.is_file():
+        return []
+    urls: list[str] = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        url = line.strip()
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+
+_stores: dict[Path, JobStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    # one connection per process and working directory, shared by its threads
+    # (pool workers open their own)
+    path = JOB_STORE_PATH.resolve()
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = JobStore(path)
+            store.import_existing()
+        return store
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Show pipeline job state.")
+    parser.add_argument(
+        "--rescan",
+        action="store_true",
+        help="re-import state from the directories (for files added outside the pipeline)",
+    )
+    args = parser.parse_args(argv)
+    store = get_job_store()
+    if args.rescan:
+        store.import_existing(force=True)
+    counts = store.status_counts()
+    for status in JOB_STATUSES:
+        print(f"{status}: {counts.get(status, 0)}")
+    print(f"known videos: {store.video_count()}")
+    for name, status, attempts, error in store.recent_errors():
+        print(f"error ({status}, {attempts} attempts) {name}: {error}")
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import atexit
+import fcntl
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+METRICS_JSONL_ENV = "PIPELINE_METRICS_JSONL"
+METRICS_PROM_ENV = "PIPELINE_METRICS_PROM"
+PROM_FLUSH_INTERVAL_SECONDS = 15.0
+
+_METRIC_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+# ratios do not add up across events; the textfile keeps their numerators and denominators
+_RATIO_FIELD_SUFFIXES = ("_rate", "_factor")
+
+
+class _Sink:
+    def __init__(self, jsonl_path: Path | None, prom_path: Path | None) -> None:
+        self._jsonl_path = jsonl_path
+        self._prom_path = prom_path
+        self._lock = threading.Lock()
+        self._counts: dict[str, float] = {}
+        self._sums: dict[tuple[str, str], float] = {}
+        self._last_flush = time.monotonic()
+        if prom_path is not None:
+            atexit.register(self.flush)
+
+    def record(self, stage: str, fields: dict[str, object]) -> None:
+        if self._jsonl_path is not None:
+            line = json.dumps(
+                {"ts": round(time.time(), 3), "stage": stage, "pid": os.getpid(), **fields},
+                ensure_ascii=True,
+                default=str,
+            )
+            # one O_APPEND write per event keeps lines intact across processes
+            fd = os.open(self._jsonl_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, (line + "\n").encode("utf-8"))
+            finally:
+                os.close(fd)
+
+        if self._prom_path is None:
+            return
+        with self._lock:
+            self._counts[stage] = self._counts.get(stage, 0.0) + 1
+            for name, value in fields.items():
+                if name.endswith(_RATIO_FIELD_SUFFIXES):
+                    continue
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    key = (stage, name)
+                    self._sums[key] = self._sums.get(key, 0.0) + float(value)
+            due = time.monotonic() - self._last_flush >= PROM_FLUSH_INTERVAL_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._prom_path is None:
+            return
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            sums, self._sums = self._sums, {}
+            self._last_flush = time.monotonic()
+        if not counts:
+            return
+        # totals from every process are merged under a lock, then the textfile is
+        # replaced atomically so a scraper never reads a half-written file
+        state_path = self._prom_path.with_name(self._prom_path.name + ".state.json")
+        lock_path = self._prom_path.with_name(self._prom_path.name + ".lock")
+        self._prom_path.parent.mkdir(parents=True, exist_ok=True)
+        with lock_path.open("a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                totals = json.loads(state_path.read_text(encoding="utf-8"))
+            except Exception:
+                totals = {}
+            for stage, count in counts.items():
+                name = f"pipeline_{_metric_name(stage)}_events_total"
+                totals[name] = totals.get(name, 0.0) + count
+            for (stage, field), value in sums.items():
+                name = f"pipeline_{_metric_name(stage)}_{_metric_name(field)}_total"
+                totals[name] = totals.get(name, 0.0) + value
+            _atomic_write(state_path, json.dumps(totals, indent=2, sort_keys=True) + "\n")
+            _atomic_write(
+                self._prom_path,
+                "".join(
+                    f"# TYPE {name} counter\n{name} {value:.6g}\n"
+                    for name, value in sorted(totals.items())
+                ),
+            )
+
+
+def _metric_name(raw: str) -> str:
+    return _METRIC_NAME_RE.sub("_", raw).lower()
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def _load_sink() -> _Sink | None:
+    jsonl = os.getenv(METRICS_JSONL_ENV, "").strip()
+    prom = os.getenv(METRICS_PROM_ENV, "").strip()
+    if not jsonl and not prom:
+        return None
+    return _Sink(Path(jsonl) if jsonl else None, Path(prom) if prom else None)
+
+
+_sink = _load_sink()
+
+
+def enabled() -> bool:
+    return _sink is not None
+
+
+def record(stage: str, **fields: object) -> None:
+    if _sink is None:
+        return
+    _sink.record(stage, fields)
+
+
+def flush() -> None:
+    if _sink is not None:
+        _sink.flush()
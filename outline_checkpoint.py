@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from summarize_helpers import MAP_OUTLINES_DIR, log
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class OutlineCheckpoint:
+    # ".state/map_outlines/<transcript hash>.jsonl": one fsynced line per map-reduce part
+    # outline, keyed by the part's own hash, so a failed map or reduce request resumes
+    # without paying again for the parts already outlined (even if the plan changes)
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._outlines: dict[str, str] = {}
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._outlines)
+
+    def _load(self) -> None:
+        try:
+            raw = self.path.read_bytes()
+        except FileNotFoundError:
+            return
+        # only newline-terminated lines are complete; a crash mid-append leaves a torn tail
+        for line in raw.split(b"\n")[:-1]:
+            try:
+                record = json.loads(line)
+                self._outlines[str(record["part"])] = str(record["outline"])
+            except (KeyError, TypeError, ValueError):
+                log(f"ignoring the rest of unreadable {self.path.name}")
+                break
+
+    def get(self, part: str) -> str | None:
+        return self._outlines.get(_digest(part))
+
+    def put(self, part: str, outline: str) -> None:
+        key = _digest(part)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a", encoding="utf-8") as file:
+            file.write(json.dumps({"part": key, "outline": outline}, ensure_ascii=False) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self._outlines[key] = outline
+
+    def discard(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+def open_outline_checkpoint(text: str) -> OutlineCheckpoint:
+    return OutlineCheckpoint(MAP_OUTLINES_DIR / f"{_digest(text)}.jsonl")
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from transcribe_helpers import PCM_CACHE_DIR, get_pcm_cache_max_mb, log
+
+
+def pcm_cache_path(audio_path: Path) -> Path:
+    # name, size and mtime identify the download; a re-downloaded file gets a fresh entry,
+    # and moving the file to finished/ keeps its key
+    stat = audio_path.stat()
+    key = hashlib.sha256(f"{audio_path.name}\0{stat.st_size}\0{stat.st_mtime_ns}".encode("utf-8")).hexdigest()
+    return PCM_CACHE_DIR / f"{key[:24]}.npy"
+
+
+def open_pcm(cache_path: Path) -> np.ndarray:
+    # copy-on-write map: pages come straight from the page cache, and consumers that
+    # need a writable array (torch.from_numpy) get one without copying the file
+    return np.load(cache_path, mmap_mode="c")
+
+
+def load_cached_pcm(audio_path: Path, decode: Callable[[Path], np.ndarray]) -> np.ndarray:
+    cache_path = pcm_cache_path(audio_path)
+    try:
+        audio = open_pcm(cache_path)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as exc:
+        log(f"discarding unreadable PCM cache for {audio_path.name}: {exc}")
+        cache_path.unlink(missing_ok=True)
+    else:
+        # mtime is the entry's last use, for eviction and for the age-based prune
+        try:
+            os.utime(cache_path)
+        except OSError:
+            pass
+        return audio
+
+    audio = np.ascontiguousarray(decode(audio_path), dtype=np.float32)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}.{id(audio):x}.tmp")
+    try:
+        with tmp_path.open("wb") as file:
+            np.save(file, audio)
+        os.replace(tmp_path, cache_path)
+    except OSError as exc:
+        tmp_path.unlink(missing_ok=True)
+        log(f"could not cache PCM for {audio_path.name}: {exc}")
+        return audio
+    evict_pcm_cache(get_pcm_cache_max_mb() * 1024 * 1024, keep=cache_path)
+    return open_pcm(cache_path)
+
+
+def evict_pcm_cache(max_bytes: int, keep: Path) -> None:
+    # least recently used entries go first; the entry just written stays even on its own
+    # over the cap, and a file still mapped elsewhere keeps its pages until it is unmapped
+    entries: list[tuple[float, int, Path]] = []
+    for cache_path in PCM_CACHE_DIR.glob("*.npy"):
+        try:
+            stat = cache_path.stat()
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, cache_path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, cache_path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if cache_path == keep:
+            continue
+        try:
+            cache_path.unlink()
+        except OSError:
+            continue
+        total -= size
+        log(f"evicted PCM cache entry {cache_path.name} ({size // (1024 * 1024)} MB)")
+
+
+def discard_cached_pcm(audio_path: Path) -> None:
+    try:
+        pcm_cache_path(audio_path).unlink(missing_ok=True)
+    except OSError:
+        pass
+
+
+def prune_pcm_cache(audio_paths: list[Path], max_age_seconds: float) -> None:
+    # entries are removed when their file is finished; this catches files that were deleted
+    # or replaced while a cached decode was waiting for a retry
+    if not PCM_CACHE_DIR.is_dir():
+        return
+    live: set[str] = set()
+    for audio_path in audio_paths:
+        try:
+            live.add(pcm_cache_path(audio_path).name)
+        except OSError:
+            continue
+    cutoff = time.time() - max_age_seconds
+    for cache_path in PCM_CACHE_DIR.iterdir():
+        try:
+            if cache_path.name not in live and cache_path.stat().st_mtime < cutoff:
+                cache_path.unlink()
+        except OSError:
+            continue
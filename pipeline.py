@@ -0,0 +1,332 @@
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from functools import partial
+from pathlib import Path
+
+import metrics
+from audio_chunks import MIN_CHUNK_SECONDS
+from downloader import DownloadConfig, Downloader, StreamSource, VideoArchive
+from jobs import URLS_PATH, get_job_store, read_urls
+from summarize import has_existing_summary, summarize_transcripts, summary_output_path
+from summarize_helpers import (
+    SUMMARIES_DIR,
+    load_batch_budget,
+    load_concurrency_config,
+    load_local_env,
+    load_map_reduce_config,
+    load_quota_config,
+)
+from summary_cache import open_summary_cache
+from stream_transcribe import transcribe_stream
+from summary_router import load_summary_router
+from transcribe import (
+    TranscriptionRuntime,
+    iter_audio_files,
+    start_transcription_runtime,
+    transcript_output_path,
+)
+from transcribe_backends import decode_audio
+from transcribe_helpers import (
+    get_non_negative_float_env,
+    get_non_negative_int_env,
+    get_pcm_cache_enabled,
+    get_positive_int_env,
+    log,
+)
+
+DEFAULT_DOWNLOAD_PARALLEL = 4
+DEFAULT_DOWNLOAD_RETRIES = 3
+DEFAULT_DOWNLOAD_BACKOFF_SECONDS = 5.0
+DEFAULT_DOWNLOAD_MAX_BACKOFF_SECONDS = 300.0
+DEFAULT_DOWNLOAD_SKIP_KNOWN = 1
+DEFAULT_AUDIO_QUEUE_SIZE = 8
+DEFAULT_TRANSCRIPT_QUEUE_SIZE = 64
+DEFAULT_SUMMARY_LINGER_SECONDS = 60.0
+DEFAULT_STREAM_WINDOW_SECONDS = 0.0
+QUEUE_POLL_SECONDS = 0.5
+
+# end-of-stream marker passed down each queue once its producers are done
+_DONE = None
+
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    download: DownloadConfig
+    audio_queue_size: int
+    transcript_queue_size: int
+    summary_linger_seconds: float
+    stream_window_seconds: float
+
+
+def load_pipeline_config() -> PipelineConfig:
+    stream_window_seconds = get_non_negative_float_env(
+        "PIPELINE_STREAM_WINDOW_SECONDS",
+        DEFAULT_STREAM_WINDOW_SECONDS,
+    )
+    if 0 < stream_window_seconds < MIN_CHUNK_SECONDS:
+        log(f"PIPELINE_STREAM_WINDOW_SECONDS below {MIN_CHUNK_SECONDS:g}s; using {MIN_CHUNK_SECONDS:g}")
+        stream_window_seconds = MIN_CHUNK_SECONDS
+    return PipelineConfig(
+        download=DownloadConfig(
+            parallel=get_positive_int_env("MAX_PARALLEL", DEFAULT_DOWNLOAD_PARALLEL),
+            retries=get_non_negative_int_env("DOWNLOAD_RETRIES", DEFAULT_DOWNLOAD_RETRIES),
+            backoff_seconds=get_non_negative_float_env(
+                "DOWNLOAD_BACKOFF_SECONDS",
+                DEFAULT_DOWNLOAD_BACKOFF_SECONDS,
+            ),
+            max_backoff_seconds=get_non_negative_float_env(
+                "DOWNLOAD_MAX_BACKOFF_SECONDS",
+                DEFAULT_DOWNLOAD_MAX_BACKOFF_SECONDS,
+            ),
+            skip_known=get_non_negative_int_env("DOWNLOAD_SKIP_KNOWN", DEFAULT_DOWNLOAD_SKIP_KNOWN) > 0,
+        ),
+        audio_queue_size=get_positive_int_env("PIPELINE_AUDIO_QUEUE_SIZE", DEFAULT_AUDIO_QUEUE_SIZE),
+        transcript_queue_size=get_positive_int_env(
+            "PIPELINE_TRANSCRIPT_QUEUE_SIZE",
+            DEFAULT_TRANSCRIPT_QUEUE_SIZE,
+        ),
+        summary_linger_seconds=get_non_negative_float_env(
+            "PIPELINE_SUMMARY_LINGER_SECONDS",
+            DEFAULT_SUMMARY_LINGER_SECONDS,
+        ),
+        stream_window_seconds=stream_window_seconds,
+    )
+
+
+def remove_downloaded_urls(done: set[str], path: Path = URLS_PATH) -> None:
+    # re-read instead of rewriting our snapshot: urls appended during the run must survive
+    if not done or not path.is_file():
+        return
+    remaining = [url for url in read_urls(path) if url not in done]
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text("".join(f"{url}\n" for url in remaining), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def warm_pcm_cache(audio_path: Path) -> None:
+    # decode on the download thread while the transcriber is busy with the previous file
+    started = time.monotonic()
+    try:
+        decode_audio(audio_path)
+    except Exception as exc:
+        log(f"could not pre-decode {audio_path.name}: {exc}")
+        return
+    metrics.record("pcm_decode", file=audio_path.name, seconds=time.monotonic() - started)
+
+
+class Pipeline:
+    def __init__(self, config: PipelineConfig) -> None:
+        self._config = config
+        self._audio_queue: queue.Queue[Path | None] = queue.Queue(config.audio_queue_size)
+        self._transcript_queue: queue.Queue[Path | None] = queue.Queue(config.transcript_queue_size)
+        self._stop = threading.Event()
+        self._queued_audio: set[Path] = set()
+        self._queued_lock = threading.Lock()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _put(self, target: queue.Queue, item: Path | None) -> bool:
+        # a full queue blocks the producer: this is the backpressure between stages
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=QUEUE_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source: queue.Queue, timeout: float | None = None) -> tuple[bool, Path | None]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stop.is_set():
+            wait = QUEUE_POLL_SECONDS
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return False, None
+            try:
+                return True, source.get(timeout=wait)
+            except queue.Empty:
+                continue
+        return True, _DONE
+
+    def _enqueue_audio(self, audio_path: Path) -> None:
+        with self._queued_lock:
+            if audio_path in self._queued_audio:
+                return
+            self._queued_audio.add(audio_path)
+        get_job_store().record_audio(audio_path.stem)
+        self._put(self._audio_queue, audio_path)
+
+    def _downloaded(self, audio_path: Path) -> None:
+        if get_pcm_cache_enabled():
+            warm_pcm_cache(audio_path)
+        self._enqueue_audio(audio_path)
+
+    def _streamed(self, runtime: TranscriptionRuntime, source: StreamSource, archive: VideoArchive) -> bool:
+        transcript_path = transcribe_stream(source, runtime, self._config.stream_window_seconds, self._stop)
+        if transcript_path is None:
+            return False
+        archive.add(source.archive_id)
+        self._put(self._transcript_queue, transcript_path)
+        return True
+
+    def run_downloads(self, transcriber_count: int, runtime: TranscriptionRuntime) -> None:
+        try:
+            on_stream = None
+            if self._config.stream_window_seconds > 0:
+                # the download thread feeds the model itself; the file never waits in audios/
+                on_stream = partial(self._streamed, runtime)
+            downloader = Downloader(self._config.download, self._downloaded, stop=self._stop, on_stream=on_stream)
+            downloader.start(read_urls())
+            # audio already on disk is transcribed while the downloads run
+            for audio_path in iter_audio_files():
+                self._enqueue_audio(audio_path)
+            remove_downloaded_urls(downloader.wait())
+            # files that landed in audios/ without passing through us (manual copies)
+            for audio_path in iter_audio_files():
+                self._enqueue_audio(audio_path)
+        finally:
+            for _ in range(transcriber_count):
+                self._put(self._audio_queue, _DONE)
+
+    def _take_queued_audio(self, audio_paths: list[Path], limit: int) -> bool:
+        # whatever else is already waiting joins the batch; True once the end marker was taken
+        while len(audio_paths) < limit:
+            try:
+                audio_path = self._audio_queue.get_nowait()
+            except queue.Empty:
+                return False
+            if audio_path is _DONE:
+                return True
+            audio_paths.append(audio_path)
+        return False
+
+    def run_transcriber(self, runtime: TranscriptionRuntime) -> None:
+        done = False
+        while not done:
+            _, audio_path = self._get(self._audio_queue)
+            if audio_path is _DONE:
+                return
+            audio_paths = [audio_path]
+            if runtime.batch_size > 1:
+                done = self._take_queued_audio(audio_paths, runtime.batch_files)
+                if runtime.executor is not None:
+                    outcomes = runtime.executor.submit(runtime.process_batch, audio_paths).result()
+                else:
+                    outcomes = runtime.process_batch(audio_paths)
+            elif runtime.executor is not None:
+                outcomes = [runtime.executor.submit(runtime.process_one, audio_path).result()]
+            else:
+                outcomes = [runtime.process_one(audio_path)]
+            for audio_path, outcome in zip(audio_paths, outcomes):
+                transcript_path = transcript_output_path(audio_path)
+                if outcome.ok and transcript_path.exists():
+                    self._put(self._transcript_queue, transcript_path)
+
+    def run_summarizer(self) -> None:
+        quota = load_quota_config()
+        budget = load_batch_budget()
+        concurrency = load_concurrency_config()
+        map_reduce = load_map_reduce_config()
+        router = load_summary_router(quota)
+        cache = open_summary_cache(router.models)
+        SUMMARIES_DIR.mkdir(exist_ok=True)
+        router.log_usage()
+
+        def summarize_held(held: list[Path]) -> bool:
+            while not self._stop.is_set():
+                held = [path for path in held if path.exists() and not summary_output_path(path).exists()]
+                if not held or not summarize_transcripts(
+                    held, router, quota, budget, concurrency, map_reduce, cache
+                ):
+                    return True
+                cooldown = router.remaining_cooldown_seconds()
+                if cooldown <= 0:
+                    log("summarize: daily request caps reached; remaining transcripts wait for a later run")
+                    return False
+                # not draining the queue while cooling down pushes back on transcription
+                log(f"summarize: quota cooldown, holding {len(held)} transcripts for {cooldown}s")
+                self._stop.wait(cooldown)
+            return False
+
+        try:
+            held = [path for path in get_job_store().pending_transcripts() if not has_existing_summary(path)]
+            active = summarize_held(held) if held else True
+            upstream_done = False
+            while not upstream_done:
+                got, transcript_path = self._get(self._transcript_queue)
+                if transcript_path is _DONE:
+                    break
+                held = [transcript_path]
+                # give batch requests a chance to fill up before spending a request on them
+                while len(held) < budget.max_items:
+                    got, transcript_path = self._get(
+                        self._transcript_queue,
+                        self._config.summary_linger_seconds,
+                    )
+                    if not got:
+                        break
+                    if transcript_path is _DONE:
+                        upstream_done = True
+                        break
+                    held.append(transcript_path)
+                if active:
+                    active = summarize_held(held)
+        finally:
+            router.log_run_usage()
+            if cache is not None:
+                cache.log_stats()
+                cache.close()
+
+    def run(self) -> None:
+        runtime = start_transcription_runtime()
+        transcriber_count = max(1, runtime.workers)
+        threads = [
+            threading.Thread(target=self.run_downloads, args=(transcriber_count, runtime), name="download"),
+            threading.Thread(target=self.run_summarizer, name="summarize"),
+        ]
+        transcribers = [
+            threading.Thread(target=self.run_transcriber, args=(runtime,), name=f"transcribe-{index}")
+            for index in range(transcriber_count)
+        ]
+        try:
+            for thread in threads + transcribers:
+                thread.start()
+            for thread in transcribers:
+                while thread.is_alive():
+                    thread.join(QUEUE_POLL_SECONDS)
+            self._put(self._transcript_queue, _DONE)
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(QUEUE_POLL_SECONDS)
+        except KeyboardInterrupt:
+            log("stopping pipeline...")
+            self.stop()
+            for thread in threads + transcribers:
+                thread.join()
+            raise
+        finally:
+            runtime.close()
+
+
+def main() -> int:
+    load_local_env()
+    if not read_urls() and not iter_audio_files() and not any(
+        not summary_output_path(path).exists() for path in get_job_store().pending_transcripts()
+    ):
+        log("nothing to do. urls/audios/transcriptions are already drained.")
+        return 0
+    try:
+        Pipeline(load_pipeline_config()).run()
+    except KeyboardInterrupt:
+        return 130
+    log("done.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
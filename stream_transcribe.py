@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+from typing import IO
+
+import numpy as np
+
+import metrics
+from audio_chunks import SAMPLE_RATE, join_chunk_texts, split_on_silence
+from downloader import StreamSource
+from jobs import get_job_store
+from transcribe import (
+    TranscriptionRuntime,
+    claim_audio_file,
+    release_audio_file,
+    transcript_output_path,
+    write_language_sidecar,
+    write_transcript,
+)
+from transcribe_backends import LANGUAGE_DETECTION_SAMPLES
+from transcribe_helpers import AUDIO_DIR, FINISHED_DIR, STREAM_DIR, LanguageDetection, log
+
+# one second of 16 kHz mono float32 per read
+PCM_READ_BYTES = 4 * SAMPLE_RATE
+STREAM_COPY_BYTES = 64 * 1024
+
+
+def _tee(stream: IO[bytes], sink: IO[bytes], copy_path: Path, errors: list[BaseException]) -> None:
+    # the native bytes go to the decoder and to the copy that ends up in finished/
+    try:
+        with copy_path.open("wb") as copy:
+            while chunk := stream.read(STREAM_COPY_BYTES):
+                copy.write(chunk)
+                sink.write(chunk)
+    except BrokenPipeError:
+        # the decoder stopped early; its exit code says why
+        pass
+    except BaseException as exc:
+        errors.append(exc)
+    finally:
+        try:
+            sink.close()
+        except BrokenPipeError:
+            pass
+
+
+def _start_decoder() -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            "ffmpeg",
+            "-nostdin",
+            "-loglevel",
+            "error",
+            "-i",
+            "pipe:0",
+            "-map",
+            "0:a:0",
+            "-f",
+            "f32le",
+            "-ac",
+            "1",
+            "-ar",
+            str(SAMPLE_RATE),
+            "pipe:1",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+    )
+
+
+def transcribe_stream(
+    source: StreamSource,
+    runtime: TranscriptionRuntime,
+    window_seconds: float,
+    stop: threading.Event,
+) -> Path | None:
+    # decode the download as it arrives and hand each silence-bounded window to the model while
+    # later bytes are still being fetched; None means the caller should download the file instead
+    audio_path = AUDIO_DIR / source.name
+    transcript_path = transcript_output_path(audio_path)
+    if not claim_audio_file(audio_path):
+        log(f"not streaming {source.name} (claimed by another worker)")
+        return None
+    started = time.monotonic()
+    copy_path = STREAM_DIR / source.name
+    windows: list[Future] = []
+    try:
+        if transcript_path.exists() and transcript_path.stat().st_size > 0:
+            log(f"skipping {source.name} (transcript exists)")
+            return transcript_path
+        STREAM_DIR.mkdir(parents=True, exist_ok=True)
+        log(f"streaming {source.name} into the transcriber ({window_seconds:g}s windows)")
+
+        window_samples = int(window_seconds * SAMPLE_RATE)
+        head = np.empty(0, dtype=np.float32)
+        pending = np.empty(0, dtype=np.float32)
+        detection: LanguageDetection | None = None
+        detected = False
+        samples = 0
+
+        def submit(audio: np.ndarray, final: bool) -> np.ndarray:
+            # everything up to the last pause goes out now; the tail waits for more audio
+            nonlocal detection, detected
+            if not detected:
+                detection = runtime.detect(head)
+                detected = True
+            ranges = split_on_silence(audio, window_seconds)
+            rest = np.empty(0, dtype=np.float32) if final else audio[ranges.pop()[0]:]
+            for start, end in ranges:
+                if end > start:
+                    windows.append(runtime.submit_window(audio[start:end], detection))
+            return rest
+
+        errors: list[BaseException] = []
+        decoder = _start_decoder()
+        with source.open() as stream:
+            feeder = threading.Thread(
+                target=_tee,
+                args=(stream, decoder.stdin, copy_path, errors),
+                name="stream-tee",
+                daemon=True,
+            )
+            feeder.start()
+            try:
+                while not stop.is_set() and (data := decoder.stdout.read(PCM_READ_BYTES)):
+                    chunk = np.frombuffer(data[: len(data) // 4 * 4], dtype="<f4")
+                    samples += len(chunk)
+                    if len(head) < LANGUAGE_DETECTION_SAMPLES:
+                        head = np.concatenate([head, chunk[: LANGUAGE_DETECTION_SAMPLES - len(head)]])
+                    pending = np.concatenate([pending, chunk])
+                    if len(pending) > window_samples:
+                        pending = submit(pending, final=False)
+            except BaseException:
+                decoder.kill()
+                raise
+            finally:
+                if stop.is_set():
+                    decoder.kill()
+                decoder.stdout.close()
+                returncode = decoder.wait()
+        feeder.join()
+        if stop.is_set():
+            return None
+        if errors:
+            raise errors[0]
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with {returncode}")
+        download_seconds = time.monotonic() - started
+        if samples == 0:
+            raise RuntimeError("no audio in stream")
+        submit(pending, final=True)
+        text = join_chunk_texts([window.result() for window in windows])
+
+        if detection is not None:
+            log(f"{source.name}: language {detection.language} ({detection.probability:.0%}), model {detection.model}")
+            write_language_sidecar(transcript_path, detection)
+        write_transcript(transcript_path, text)
+        shutil.move(str(copy_path), str(FINISHED_DIR / source.name))
+        total_seconds = time.monotonic() - started
+        audio_seconds = samples / SAMPLE_RATE
+        store = get_job_store()
+        store.record_download(source.url, [audio_path.stem], download_seconds)
+        store.record_transcribed(audio_path.stem, total_seconds)
+        log(
+            f"{source.name}: {audio_seconds:.0f}s streamed and transcribed in {total_seconds:.0f}s "
+            f"(download and decode took {download_seconds:.0f}s)"
+        )
+        metrics.record(
+            "transcribe_stream",
+            file=source.name,
+            audio_seconds=audio_seconds,
+            download_seconds=download_seconds,
+            total_seconds=total_seconds,
+            windows=len(windows),
+        )
+        return transcript_path
+    except Exception as exc:
+        log(f"streaming {source.name} failed: {exc}")
+        get_job_store().record_url_failure(source.url, f"stream: {exc}")
+        return None
+    finally:
+        for window in windows:
+            window.cancel()
+        copy_path.unlink(missing_ok=True)
+        release_audio_file(audio_path)
@@ -1,27 +1,52 @@
 import time
 
+from functools import lru_cache
 from pathlib import Path
 from typing import Callable
 
+import metrics
+from jobs import get_job_store
 from summarize_helpers import (
-    GEMINI_USAGE_PATH,
     SUMMARIES_DIR,
-    TRANSCRIPTIONS_DIR,
+    BatchBudget,
     BatchSummaryItem,
+    BatchSummaryStreamParser,
+    ConcurrencyConfig,
+    MapReduceConfig,
+    NormalizeConfig,
     QuotaConfig,
-    UsageState,
     archive_transcript,
     build_batch_prompt,
+    build_map_prompt,
+    build_outline_merge_prompt,
     build_prompt,
-    get_client,
-    get_summary_batch_size,
+    build_reduce_prompt,
+    estimate_file_tokens,
+    estimate_request_tokens,
+    estimate_tokens,
+    get_summary_stream_enabled,
     is_quota_error,
+    is_unsent_request_error,
+    load_batch_budget,
+    load_concurrency_config,
+    load_map_reduce_config,
+    load_normalize_config,
     log,
     load_quota_config,
+    pack_summary_batches,
+    plan_map_reduce,
+    plan_outline_merges,
     parse_batch_summaries,
     parse_retry_delay_seconds,
-    summarize_with_client,
+    read_transcript_language,
 )
+from outline_checkpoint import OutlineCheckpoint, open_outline_checkpoint
+from summary_cache import SummaryCache, open_summary_cache
+from summary_router import SummaryRoute, SummaryRouter, load_summary_router
+from transcript_minhash import get_transcript_index
+from transcript_normalize import normalize_transcript
+
+TRANSCRIPT_READ_CACHE_SIZE = 256
 
 
 def write_summary(out_path: Path, title: str, summary: str) -> None:
@@ -30,6 +55,16 @@ def write_summary(out_path: Path, title: str, summary: str) -> None:
         file.write(summary + "\n")
 
 
+def save_summary(transcript_path: Path, summary: str) -> None:
+    # the summary file, then the job row and the near-duplicate index that track it
+    write_summary(summary_output_path(transcript_path), transcript_path.stem, summary)
+    get_job_store().record_summarized(transcript_path.stem)
+    index = get_transcript_index()
+    # summaries are written before their transcript is archived, so it is still here
+    if index is not None and transcript_path.is_file():
+        index.add(transcript_path.stem, transcript_path)
+
+
 def maybe_archive(transcript_path: Path, warning_prefix: str) -> None:
     try:
         archive_path = archive_transcript(transcript_path)
@@ -42,6 +77,43 @@ def summary_output_path(transcript_path: Path) -> Path:
     return SUMMARIES_DIR / f"{transcript_path.stem}.md"
 
 
+@lru_cache(maxsize=TRANSCRIPT_READ_CACHE_SIZE)
+def _read_normalized(path: str, mtime_ns: int, config: NormalizeConfig | None, language: str | None) -> str:
+    text = Path(path).read_text(encoding="utf-8").strip()
+    if config is None or not text:
+        return text
+    result = normalize_transcript(text, config, language)
+    if result.tokens_saved > 0:
+        percent = 100 * result.tokens_saved / max(1, result.tokens_before)
+        log(f"normalized {Path(path).name}: ~{result.tokens_saved} tokens saved ({percent:.0f}%)")
+    metrics.record(
+        "summarize_normalize",
+        file=Path(path).name,
+        tokens_before=result.tokens_before,
+        tokens_after=result.tokens_after,
+        tokens_saved=result.tokens_saved,
+    )
+    return result.text
+
+
+def read_transcript(transcript_path: Path) -> str:
+    # keyed by mtime, settings and language so packing, cache lookup and the prompt share one
+    # normalization pass
+    return _read_normalized(
+        str(transcript_path),
+        transcript_path.stat().st_mtime_ns,
+        load_normalize_config(),
+        read_transcript_language(transcript_path),
+    )
+
+
+def estimate_transcript_tokens(transcript_path: Path) -> int:
+    try:
+        return estimate_tokens(read_transcript(transcript_path))
+    except OSError:
+        return estimate_file_tokens(transcript_path)
+
+
 def has_existing_summary(transcript_path: Path) -> bool:
     filename = transcript_path.name
     out_path = summary_output_path(transcript_path)
@@ -55,9 +127,60 @@ def has_existing_summary(transcript_path: Path) -> bool:
     return False
 
 
+def write_cached_summary(transcript_path: Path, text: str, cache: SummaryCache | None) -> bool:
+    if cache is None:
+        return False
+    summary = cache.get(text)
+    if not summary:
+        return False
+    log(f"summary cache hit for {transcript_path.name}; no request needed")
+    save_summary(transcript_path, summary)
+    maybe_archive(
+        transcript_path,
+        "warning: summary reused from cache, but failed to archive",
+    )
+    return True
+
+
+def read_summary_body(summary_path: Path) -> str:
+    text = summary_path.read_text(encoding="utf-8")
+    if text.startswith("# Summary: "):
+        text = text.partition("\n\n")[2]
+    return text.strip()
+
+
+def write_near_duplicate_summary(transcript_path: Path) -> bool:
+    # reposts and re-cuts transcribe to nearly, not exactly, the same text: the summary of
+    # the closest indexed transcript above the threshold is reused
+    index = get_transcript_index()
+    if index is None:
+        return False
+    for name, similarity in index.find_similar(transcript_path):
+        source = SUMMARIES_DIR / f"{name}.md"
+        if name == transcript_path.stem or not source.is_file():
+            continue
+        summary = read_summary_body(source)
+        if not summary:
+            continue
+        log(f"{transcript_path.name} is a near-duplicate of {name} ({similarity:.0%} similar); reusing its summary")
+        save_summary(transcript_path, summary)
+        metrics.record("summarize_near_duplicate", file=transcript_path.name, source=name)
+        maybe_archive(
+            transcript_path,
+            "warning: summary reused from a near-duplicate, but failed to archive",
+        )
+        return True
+    return False
+
+
+def reuse_summary(transcript_path: Path, text: str, cache: SummaryCache | None) -> bool:
+    return write_cached_summary(transcript_path, text, cache) or write_near_duplicate_summary(transcript_path)
+
+
 def handle_quota_exception(
     exc: Exception,
-    usage_state: UsageState,
+    route: SummaryRoute,
+    router: SummaryRouter,
     quota: QuotaConfig,
     file_quota_retries: int,
 ) -> tuple[bool, int]:
@@ -65,22 +188,28 @@ def handle_quota_exception(
         return False, file_quota_retries
 
     retry_delay = parse_retry_delay_seconds(exc)
-    cooldown = usage_state.set_quota_cooldown(
+    cooldown = route.usage_state.set_quota_cooldown(
         retry_delay if retry_delay is not None else quota.cooldown_seconds
     )
-
-    if retry_delay is not None and file_quota_retries < quota.retry_attempts:
+    if router.has_available_route():
+        # another key still has headroom: fail over now instead of sleeping
+        log(f"{route.name} reported quota/rate exhaustion; pausing it for {cooldown}s and failing over.")
+        return True, file_quota_retries
+
+    # 0 here means every key is out of daily requests, so waiting would not help
+    wait = router.remaining_cooldown_seconds()
+    if wait > 0 and retry_delay is not None and file_quota_retries < quota.retry_attempts:
         next_retry = file_quota_retries + 1
         log(
-            "gemini reported quota/rate exhaustion; "
-            f"pausing requests for {cooldown}s before retrying "
+            f"{route.name} reported quota/rate exhaustion; "
+            f"pausing requests for {wait}s before retrying "
             f"({next_retry}/{quota.retry_attempts})."
         )
-        time.sleep(cooldown)
+        time.sleep(wait)
         return True, next_retry
 
     log(
-        "gemini reported quota/rate exhaustion; "
+        f"{route.name} reported quota/rate exhaustion; "
         f"pausing requests for {cooldown}s."
     )
     return False, file_quota_retries
@@ -88,18 +217,39 @@ def handle_quota_exception(
 
 def execute_summary_request(
     *,
-    usage_state: UsageState,
+    router: SummaryRouter,
     quota: QuotaConfig,
     retry_target: str,
     request_log: str,
     failure_prefix: str,
-    request_fn: Callable[[], str],
-) -> tuple[str | None, bool]:
+    request_fn: Callable[[SummaryRoute], str],
+    estimated_tokens: int = 0,
+) -> tuple[str | None, str | None, bool]:
+    # (result, model that produced it, whether the run should stop)
     quota_retries = 0
+    slept_seconds = 0.0
+
+    def finish(result: str | None, stop: bool, model: str | None = None) -> tuple[str | None, str | None, bool]:
+        metrics.record(
+            "summarize_call",
+            target=retry_target,
+            ok=result is not None,
+            retries=quota_retries,
+            cooldown_seconds=slept_seconds,
+        )
+        return result, model, stop
+
     while True:
-        allowed, reason = usage_state.can_send_request()
-        if not allowed:
-            cooldown_remaining = usage_state.remaining_cooldown_seconds()
+        route, reason = router.reserve(estimated_tokens)
+        if route is None:
+            token_wait = router.token_wait_seconds(estimated_tokens)
+            if token_wait > 0:
+                # pacing to a tokens-per-minute budget, not a quota error: no retry is spent
+                log(f"tokens-per-minute budget full; waiting {token_wait}s before {retry_target}")
+                time.sleep(token_wait)
+                slept_seconds += token_wait
+                continue
+            cooldown_remaining = router.remaining_cooldown_seconds()
             if cooldown_remaining > 0 and quota_retries < quota.retry_attempts:
                 next_retry = quota_retries + 1
                 log(
@@ -108,48 +258,60 @@ def execute_summary_request(
                 )
                 quota_retries = next_retry
                 time.sleep(cooldown_remaining)
+                slept_seconds += cooldown_remaining
                 continue
             log(f"stopping summary run: {reason}")
-            return None, True
+            return finish(None, True)
 
-        usage_state.reserve_daily_request()
-        log(request_log)
+        log(request_log if len(router.routes) == 1 else f"{request_log} [{route.name}]")
         try:
-            return request_fn(), False
+            return finish(request_fn(route), False, route.model)
         except Exception as exc:
             log(f"{failure_prefix}: {exc}")
+            if is_unsent_request_error(exc):
+                route.usage_state.release_daily_request(estimated_tokens)
+            handling_started = time.monotonic()
             should_retry, quota_retries = handle_quota_exception(
                 exc,
-                usage_state,
+                route,
+                router,
                 quota,
                 quota_retries,
             )
+            slept_seconds += time.monotonic() - handling_started
             if should_retry:
                 continue
-            return None, is_quota_error(exc)
+            return finish(None, is_quota_error(exc))
 
 
 def summarize_transcript(
     transcript_path: Path,
-    client,
-    usage_state: UsageState,
+    router: SummaryRouter,
     quota: QuotaConfig,
+    budget: BatchBudget,
+    cache: SummaryCache | None = None,
 ) -> bool:
     filename = transcript_path.name
-    text = transcript_path.read_text(encoding="utf-8").strip()
+    text = read_transcript(transcript_path)
     if not text:
         return False
 
     if has_existing_summary(transcript_path):
         return False
 
-    summary, stop_run = execute_summary_request(
-        usage_state=usage_state,
+    if reuse_summary(transcript_path, text, cache):
+        return False
+
+    prompt = build_prompt(text, filename)
+    estimated_tokens = estimate_request_tokens(prompt, [text], budget)
+    summary, model, stop_run = execute_summary_request(
+        router=router,
         quota=quota,
         retry_target=filename,
         request_log=f"summarizing {filename}...",
         failure_prefix=f"failed to summarize {filename}",
-        request_fn=lambda: summarize_with_client(client, build_prompt(text, filename)),
+        request_fn=lambda route: route.complete(prompt, estimated_tokens),
+        estimated_tokens=estimated_tokens,
     )
     if stop_run:
         return True
@@ -159,7 +321,9 @@ def summarize_transcript(
         log(f"empty summary for {filename}; skipping write")
         return False
 
-    write_summary(summary_output_path(transcript_path), transcript_path.stem, summary)
+    if cache is not None:
+        cache.put(text, summary, model)
+    save_summary(transcript_path, summary)
     maybe_archive(
         transcript_path,
         "warning: summary generated, but failed to archive",
@@ -167,23 +331,216 @@ def summarize_transcript(
     return False
 
 
-def summarize_batch(
-    transcript_paths: list[Path],
-    client,
-    usage_state: UsageState,
+def merge_outlines_in_stages(
+    outlines: list[str],
+    filename: str,
+    router: SummaryRouter,
     quota: QuotaConfig,
+    budget: BatchBudget,
+    map_reduce: MapReduceConfig,
+    checkpoint: OutlineCheckpoint,
+) -> tuple[list[str] | None, bool]:
+    # outlines too long for one reduce request are merged group by group, stage by stage,
+    # until they fit; merged outlines are checkpointed like the parts. None: try again later
+    stage = 0
+    while groups := plan_outline_merges(outlines, budget, map_reduce):
+        if len(groups) == len(outlines):
+            log(f"warning: part outlines of {filename} cannot be merged further; reducing them as they are")
+            break
+        stage += 1
+        merges = [
+            group
+            for group in groups
+            if len(group) > 1 and checkpoint.get("\0".join(outlines[index] for index in group)) is None
+        ]
+        remaining = router.requests_remaining()
+        if len(merges) + 1 > remaining:
+            log(
+                f"not enough daily requests left to merge outlines of {filename} "
+                f"({len(merges)} merges + 1 reduce, {remaining} remaining); leaving transcript for a later run"
+            )
+            return None, False
+        log(f"{filename}: merging {len(outlines)} outlines into {len(groups)} (stage {stage})")
+        merged: list[str] = []
+        for group in groups:
+            group_outlines = [outlines[index] for index in group]
+            if len(group_outlines) == 1:
+                merged.extend(group_outlines)
+                continue
+            key = "\0".join(group_outlines)
+            outline = checkpoint.get(key)
+            if outline is None:
+                merge_prompt = build_outline_merge_prompt(group_outlines, filename)
+                merge_tokens = estimate_request_tokens(merge_prompt, group_outlines, budget)
+                raw, _, stop_run = execute_summary_request(
+                    router=router,
+                    quota=quota,
+                    retry_target=f"{filename} (merge stage {stage})",
+                    request_log=(
+                        f"merging outlines {group[0] + 1}-{group[-1] + 1} of {filename} (stage {stage})..."
+                    ),
+                    failure_prefix=f"failed to merge outlines for {filename}",
+                    request_fn=lambda route: route.complete(merge_prompt, merge_tokens, transcripts=0),
+                    estimated_tokens=merge_tokens,
+                )
+                if stop_run:
+                    return None, True
+                outline = (raw or "").strip()
+                if not outline:
+                    log(f"keeping the outlines of {filename} for the next run")
+                    return None, False
+                checkpoint.put(key, outline)
+            merged.append(outline)
+        outlines = merged
+    return outlines, False
+
+
+def summarize_long_transcript(
+    transcript_path: Path,
+    router: SummaryRouter,
+    quota: QuotaConfig,
+    budget: BatchBudget,
+    map_reduce: MapReduceConfig,
+    cache: SummaryCache | None = None,
 ) -> bool:
+    filename = transcript_path.name
+    text = read_transcript(transcript_path)
+    if not text:
+        return False
+
+    if has_existing_summary(transcript_path):
+        return False
+
+    if reuse_summary(transcript_path, text, cache):
+        return False
+
+    plan = plan_map_reduce(text, budget, map_reduce)
+    map_count = len(plan.map_batches)
+    # parts outlined by an earlier, interrupted run are not requested again
+    checkpoint = open_outline_checkpoint(text)
+    pending_batches = [
+        (map_number, chunk_indexes)
+        for map_number, chunk_indexes in enumerate(plan.map_batches, start=1)
+        if any(checkpoint.get(plan.chunks[index]) is None for index in chunk_indexes)
+    ]
+    request_count = len(pending_batches) + 1
+    remaining = router.requests_remaining()
+    log(
+        f"map-reduce for {filename}: {len(plan.chunks)} parts in {map_count} map requests "
+        f"+ 1 reduce = {plan.request_count} requests "
+        f"(usage today {router.requests_used}/{router.daily_cap})"
+    )
+    if len(pending_batches) < map_count:
+        log(f"resuming {filename}: {map_count - len(pending_batches)} map requests already outlined")
+    if request_count > remaining:
+        log(
+            f"not enough daily requests left for {filename} ({remaining} remaining); "
+            "leaving transcript for a later run"
+        )
+        return False
+
+    used_before = router.requests_used
+    for map_number, chunk_indexes in pending_batches:
+        items = [
+            BatchSummaryItem(
+                item_id=f"p{index + 1}",
+                source_name=f"{filename} part {index + 1}/{len(plan.chunks)}",
+                text=plan.chunks[index],
+                transcript_path=transcript_path,
+            )
+            for index in chunk_indexes
+        ]
+        map_prompt = build_map_prompt(items, filename)
+        map_tokens = estimate_request_tokens(map_prompt, [item.text for item in items], budget)
+        raw, _, stop_run = execute_summary_request(
+            router=router,
+            quota=quota,
+            retry_target=f"{filename} (map {map_number}/{map_count})",
+            request_log=f"summarizing {filename} parts (map {map_number}/{map_count})...",
+            failure_prefix=f"failed to summarize {filename} parts",
+            # parts are not transcripts: the reduce request counts this one
+            request_fn=lambda route: route.complete(map_prompt, map_tokens, transcripts=0),
+            estimated_tokens=map_tokens,
+        )
+        if stop_run:
+            return True
+        if raw is None:
+            return False
+        outlines_by_id = parse_batch_summaries(raw)
+        missing = False
+        for item in items:
+            outline = (outlines_by_id.get(item.item_id) or "").strip()
+            if outline:
+                checkpoint.put(item.text, outline)
+            else:
+                log(f"warning: missing outline for {item.source_name}; leaving transcript for retry")
+                missing = True
+        if missing:
+            return False
+
+    outlines, stop_run = merge_outlines_in_stages(
+        [checkpoint.get(chunk) or "" for chunk in plan.chunks],
+        filename,
+        router,
+        quota,
+        budget,
+        map_reduce,
+        checkpoint,
+    )
+    if stop_run:
+        return True
+    if outlines is None:
+        return False
+    reduce_prompt = build_reduce_prompt(outlines, filename)
+    reduce_tokens = estimate_request_tokens(reduce_prompt, [text], budget)
+    summary, model, stop_run = execute_summary_request(
+        router=router,
+        quota=quota,
+        retry_target=f"{filename} (reduce)",
+        request_log=f"merging {len(outlines)} part outlines for {filename} (reduce)...",
+        failure_prefix=f"failed to merge outlines for {filename}",
+        request_fn=lambda route: route.complete(reduce_prompt, reduce_tokens),
+        estimated_tokens=reduce_tokens,
+    )
+    log(f"map-reduce for {filename} spent {router.requests_used - used_before} requests")
+    if stop_run:
+        return True
+    if summary is None:
+        log(f"keeping {len(outlines)} part outlines of {filename} for the next run")
+        return False
+    if not summary:
+        log(f"empty summary for {filename}; skipping write")
+        return False
+
+    if cache is not None:
+        cache.put(text, summary, model)
+    save_summary(transcript_path, summary)
+    checkpoint.discard()
+    maybe_archive(
+        transcript_path,
+        "warning: summary generated, but failed to archive",
+    )
+    return False
+
+
+def prepare_batch_items(
+    transcript_paths: list[Path],
+    cache: SummaryCache | None = None,
+) -> list[BatchSummaryItem]:
     items: list[BatchSummaryItem] = []
 
     for transcript_path in transcript_paths:
         filename = transcript_path.name
-        text = transcript_path.read_text(encoding="utf-8").strip()
+        text = read_transcript(transcript_path)
         if not text:
             continue
 
         if has_existing_summary(transcript_path):
             continue
 
+        if reuse_summary(transcript_path, text, cache):
+            continue
+
         item_id = f"t{len(items) + 1}"
         items.append(
             BatchSummaryItem(
@@ -193,85 +550,219 @@ def summarize_batch(
                 transcript_path=transcript_path,
             )
         )
+    return items
+
+
+def write_item_summary(
+    item: BatchSummaryItem,
+    summary: str,
+    model: str,
+    cache: SummaryCache | None = None,
+) -> bool:
+    transcript_path = item.transcript_path
+    if has_existing_summary(transcript_path):
+        return True
+
+    summary = summary.strip()
+    if not summary:
+        log(f"warning: missing/empty summary for {transcript_path.name}; leaving transcript for retry")
+        get_job_store().record_failure(transcript_path.stem, "summarize: missing/empty summary in batch response")
+        return False
+
+    if cache is not None:
+        cache.put(item.text, summary, model)
+    save_summary(transcript_path, summary)
+    maybe_archive(
+        transcript_path,
+        "warning: summary generated, but failed to archive",
+    )
+    return True
+
+
+def write_batch_summaries(
+    items: list[BatchSummaryItem],
+    raw: str,
+    model: str,
+    cache: SummaryCache | None = None,
+) -> None:
+    summaries = parse_batch_summaries(raw)
+    written = sum(write_item_summary(item, summaries.get(item.item_id) or "", model, cache) for item in items)
+    record_batch_parse(len(items), written)
+
+
+def record_batch_parse(expected: int, parsed: int) -> None:
+    metrics.record(
+        "summarize_batch_parse",
+        expected=expected,
+        parsed=parsed,
+        hit_rate=parsed / expected if expected else 0.0,
+    )
+
 
+def stream_batch_summaries(
+    items: list[BatchSummaryItem],
+    route: SummaryRoute,
+    estimated_tokens: int,
+    cache: SummaryCache | None = None,
+) -> str:
+    # each summary is written (and its transcript archived) as soon as its block closes,
+    # so a stream that dies halfway keeps everything finished before the failure
+    pending = {item.item_id: item for item in items}
+    request_items = [item for item in items if not summary_output_path(item.transcript_path).exists()]
+    if not request_items:
+        return ""
+    parser = BatchSummaryStreamParser()
+    started = time.monotonic()
+    written = 0
+    for delta in route.stream(build_batch_prompt(request_items), estimated_tokens, len(request_items)):
+        for item_id, summary in parser.feed(delta):
+            item = pending.pop(item_id, None)
+            if item is None:
+                continue
+            if write_item_summary(item, summary, route.model, cache):
+                written += 1
+                if written == 1:
+                    log(f"first summary streamed after {time.monotonic() - started:.1f}s")
+    for item in pending.values():
+        if not summary_output_path(item.transcript_path).exists():
+            log(f"warning: missing/empty summary for {item.transcript_path.name}; leaving transcript for retry")
+    record_batch_parse(len(request_items), written)
+    return parser.pending_text
+
+
+def summarize_batch(
+    transcript_paths: list[Path],
+    router: SummaryRouter,
+    quota: QuotaConfig,
+    budget: BatchBudget,
+    cache: SummaryCache | None = None,
+    stream: bool = False,
+) -> bool:
+    items = prepare_batch_items(transcript_paths, cache)
     if not items:
         return False
 
-    raw, stop_run = execute_summary_request(
-        usage_state=usage_state,
+    prompt = build_batch_prompt(items)
+    # a streamed retry only asks for the unfinished items, so this stays an upper bound
+    estimated_tokens = estimate_request_tokens(prompt, [item.text for item in items], budget)
+
+    def request_fn(route: SummaryRoute) -> str:
+        if stream:
+            return stream_batch_summaries(items, route, estimated_tokens, cache)
+        return route.complete(prompt, estimated_tokens, len(items))
+
+    raw, model, stop_run = execute_summary_request(
+        router=router,
         quota=quota,
         retry_target="batch",
         request_log=f"summarizing batch ({len(items)} transcripts)...",
         failure_prefix="failed to summarize batch",
-        request_fn=lambda: summarize_with_client(client, build_batch_prompt(items)),
+        request_fn=request_fn,
+        estimated_tokens=estimated_tokens,
     )
     if stop_run:
         return True
-    if raw is None:
+    if raw is None or stream:
         return False
 
-    summaries = parse_batch_summaries(raw)
-    for item in items:
-        transcript_path = item.transcript_path
-        filename = transcript_path.name
-        if has_existing_summary(transcript_path):
-            continue
+    write_batch_summaries(items, raw, model, cache)
+    return False
 
-        summary = (summaries.get(item.item_id) or "").strip()
-        if not summary:
-            log(f"warning: missing/empty summary for {filename}; leaving transcript for retry")
-            continue
 
-        write_summary(summary_output_path(transcript_path), transcript_path.stem, summary)
-        maybe_archive(
-            transcript_path,
-            "warning: summary generated, but failed to archive",
+def summarize_pending(
+    pending: list[Path],
+    router: SummaryRouter,
+    quota: QuotaConfig,
+    budget: BatchBudget,
+    concurrency: ConcurrencyConfig,
+    cache: SummaryCache | None = None,
+) -> bool:
+    batch_size = budget.max_items
+    if concurrency.max_in_flight > 1:
+        from summarize_async import run_async_summaries
+
+        if batch_size <= 1:
+            units = [[path] for path in pending]
+        else:
+            units = pack_summary_batches(pending, budget, estimate_transcript_tokens)
+        return run_async_summaries(
+            router,
+            quota,
+            budget,
+            concurrency,
+            units,
+            batched=batch_size > 1,
+            cache=cache,
         )
 
+    if batch_size <= 1:
+        for transcript_path in pending:
+            if summarize_transcript(transcript_path, router, quota, budget, cache):
+                return True
+        return False
+
+    batches = pack_summary_batches(pending, budget, estimate_transcript_tokens)
+    if batches:
+        log(f"packed {len(pending)} transcripts into {len(batches)} requests")
+    stream = get_summary_stream_enabled()
+    for batch in batches:
+        if summarize_batch(batch, router, quota, budget, cache, stream):
+            return True
     return False
 
 
-def transcript_files() -> list[Path]:
-    if not TRANSCRIPTIONS_DIR.is_dir():
-        return []
-    return sorted(TRANSCRIPTIONS_DIR.glob("*.txt"), key=lambda path: path.name.lower())
+def summarize_transcripts(
+    pending: list[Path],
+    router: SummaryRouter,
+    quota: QuotaConfig,
+    budget: BatchBudget,
+    concurrency: ConcurrencyConfig,
+    map_reduce: MapReduceConfig,
+    cache: SummaryCache | None = None,
+) -> bool:
+    oversized = [path for path in pending if estimate_transcript_tokens(path) > map_reduce.threshold_tokens]
+    pending = [path for path in pending if path not in oversized]
+
+    # small transcripts first: they get the most summaries out of each request
+    if summarize_pending(pending, router, quota, budget, concurrency, cache):
+        return True
+    if oversized:
+        for transcript_path in oversized:
+            if summarize_long_transcript(
+                transcript_path,
+                router,
+                quota,
+                budget,
+                map_reduce,
+                cache,
+            ):
+                return True
+    return False
 
 
 def main():
-    client = get_client()
     quota = load_quota_config()
-    batch_size = get_summary_batch_size()
-    usage_state = UsageState(GEMINI_USAGE_PATH, quota.daily_request_cap)
+    budget = load_batch_budget()
+    concurrency = load_concurrency_config()
+    map_reduce = load_map_reduce_config()
+    batch_size = budget.max_items
+    router = load_summary_router(quota)
+    cache = open_summary_cache(router.models)
 
     SUMMARIES_DIR.mkdir(exist_ok=True)
+    router.log_usage()
     log(
-        "gemini request usage today: "
-        f"{usage_state.requests_used}/{quota.daily_request_cap}"
+        f"summary batch limits: {batch_size} transcripts, "
+        f"{budget.input_tokens} input / {budget.output_tokens} output tokens"
     )
-    log(f"summary batch size: {batch_size}")
-    cooldown_seconds = usage_state.remaining_cooldown_seconds()
-    if cooldown_seconds > 0:
-        log(f"gemini cooldown active: {cooldown_seconds}s")
 
-    if batch_size <= 1:
-        for transcript_path in transcript_files():
-            stop_run = summarize_transcript(transcript_path, client, usage_state, quota)
-            if stop_run:
-                break
-    else:
-        batch: list[Path] = []
-        stop_run = False
-        for transcript_path in transcript_files():
-            batch.append(transcript_path)
-            if len(batch) < batch_size:
-                continue
-            stop_run = summarize_batch(batch, client, usage_state, quota)
-            batch = []
-            if stop_run:
-                break
-        if not stop_run and batch:
-            summarize_batch(batch, client, usage_state, quota)
+    pending = [path for path in get_job_store().pending_transcripts() if not has_existing_summary(path)]
+    summarize_transcripts(pending, router, quota, budget, concurrency, map_reduce, cache)
 
+    router.log_run_usage()
+    if cache is not None:
+        cache.log_stats()
+        cache.close()
     log("done.")
 
 
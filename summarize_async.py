@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from pathlib import Path
+
+import metrics
+from summarize import (
+    maybe_archive,
+    prepare_batch_items,
+    save_summary,
+    write_batch_summaries,
+)
+from summarize_helpers import (
+    BatchBudget,
+    BatchSummaryItem,
+    ConcurrencyConfig,
+    QuotaConfig,
+    build_batch_prompt,
+    build_prompt,
+    estimate_request_tokens,
+    is_quota_error,
+    is_unsent_request_error,
+    log,
+    parse_retry_delay_seconds,
+)
+from summary_cache import SummaryCache
+from summary_router import SummaryRouter
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int) -> None:
+        self._capacity = float(per_minute)
+        self._rate = per_minute / 60.0
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        # requests larger than the bucket wait for a full bucket instead of forever
+        amount = min(float(amount), self._capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                await asyncio.sleep((amount - self._tokens) / self._rate)
+
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int) -> None:
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+
+    async def acquire(self, tokens: int) -> None:
+        if self._requests is not None:
+            await self._requests.acquire()
+        if self._tokens is not None:
+            await self._tokens.acquire(tokens)
+
+
+class AsyncSummaryEngine:
+    def __init__(
+        self,
+        router: SummaryRouter,
+        quota: QuotaConfig,
+        budget: BatchBudget,
+        concurrency: ConcurrencyConfig,
+        cache: SummaryCache | None = None,
+    ) -> None:
+        self._router = router
+        self._cache = cache
+        self._quota = quota
+        self._budget = budget
+        self._concurrency = concurrency
+        self._limiter = RateLimiter(concurrency.requests_per_minute, concurrency.tokens_per_minute)
+        self._stopped = False
+        self.requests_sent = 0
+
+    @property
+    def stopped(self) -> bool:
+        return self._stopped
+
+    async def run(self, units: list[list[Path]], batched: bool) -> None:
+        semaphore = asyncio.Semaphore(self._concurrency.max_in_flight)
+
+        async def guarded(unit: list[Path]) -> None:
+            async with semaphore:
+                if not self._stopped:
+                    await self._summarize_unit(unit, batched)
+
+        started = time.monotonic()
+        await asyncio.gather(*(guarded(unit) for unit in units))
+        log(
+            f"async summaries: {self.requests_sent} requests in {time.monotonic() - started:.1f}s "
+            f"(max {self._concurrency.max_in_flight} in flight)"
+        )
+
+    async def _summarize_unit(self, unit: list[Path], batched: bool) -> None:
+        items = prepare_batch_items(unit, self._cache)
+        if not items:
+            return
+        if batched:
+            prompt = build_batch_prompt(items)
+            target = f"batch ({len(items)} transcripts)"
+        else:
+            prompt = build_prompt(items[0].text, items[0].source_name)
+            target = items[0].source_name
+
+        expected_tokens = estimate_request_tokens(prompt, [item.text for item in items], self._budget)
+        raw, model = await self._execute(prompt, target, expected_tokens, len(items))
+        if raw is None:
+            return
+        if batched:
+            write_batch_summaries(items, raw, model, self._cache)
+        else:
+            self._write_single(items[0], raw, model)
+
+    def _write_single(self, item: BatchSummaryItem, summary: str, model: str) -> None:
+        if not summary:
+            log(f"empty summary for {item.source_name}; skipping write")
+            return
+        if self._cache is not None:
+            self._cache.put(item.text, summary, model)
+        transcript_path = item.transcript_path
+        save_summary(transcript_path, summary)
+        maybe_archive(
+            transcript_path,
+            "warning: summary generated, but failed to archive",
+        )
+
+    async def _execute(
+        self, prompt: str, target: str, expected_tokens: int, transcripts: int
+    ) -> tuple[str | None, str | None]:
+        # same cap/cooldown semantics as summarize.execute_summary_request, but waiting
+        # yields to the event loop instead of blocking every other in-flight request
+        quota_retries = 0
+        slept_seconds = 0.0
+
+        def finish(result: str | None, model: str | None = None) -> tuple[str | None, str | None]:
+            metrics.record(
+                "summarize_call",
+                target=target,
+                ok=result is not None,
+                retries=quota_retries,
+                cooldown_seconds=slept_seconds,
+            )
+            return result, model
+
+        while True:
+            if self._stopped:
+                return finish(None)
+            if not self._router.has_available_route(expected_tokens):
+                token_wait = self._router.token_wait_seconds(expected_tokens)
+                if token_wait > 0:
+                    # pacing to a tokens-per-minute budget, not a quota error: no retry is spent
+                    await asyncio.sleep(token_wait)
+                    slept_seconds += token_wait
+                    continue
+                cooldown_remaining = self._router.remaining_cooldown_seconds()
+                if cooldown_remaining > 0 and quota_retries < self._quota.retry_attempts:
+                    quota_retries += 1
+                    log(
+                        f"cooldown active; waiting {cooldown_remaining}s before retrying {target} "
+                        f"({quota_retries}/{self._quota.retry_attempts})"
+                    )
+                    await asyncio.sleep(cooldown_remaining)
+                    slept_seconds += cooldown_remaining
+                    continue
+                log(f"stopping summary run: {self._router.reserve(expected_tokens)[1]}")
+                self._stopped = True
+                return finish(None)
+
+            await self._limiter.acquire(expected_tokens)
+            # reserve after the limiter wait: another task (or process) may have used the last request
+            route, _ = self._router.reserve(expected_tokens)
+            if route is None:
+                continue
+            self.requests_sent += 1
+            log(f"summarizing {target}...")
+            try:
+                return finish(await route.complete_async(prompt, expected_tokens, transcripts), route.model)
+            except Exception as exc:
+                log(f"failed to summarize {target}: {exc}")
+                if is_unsent_request_error(exc):
+                    route.usage_state.release_daily_request(expected_tokens)
+                if not is_quota_error(exc):
+                    return finish(None)
+                retry_delay = parse_retry_delay_seconds(exc)
+                cooldown = route.usage_state.set_quota_cooldown(
+                    retry_delay if retry_delay is not None else self._quota.cooldown_seconds
+                )
+                if self._router.has_available_route():
+                    log(f"{route.name} reported quota/rate exhaustion; pausing it for {cooldown}s and failing over.")
+                    continue
+                wait = self._router.remaining_cooldown_seconds()
+                if wait > 0 and retry_delay is not None and quota_retries < self._quota.retry_attempts:
+                    quota_retries += 1
+                    log(
+                        f"{route.name} reported quota/rate exhaustion; "
+                        f"pausing requests for {wait}s before retrying "
+                        f"({quota_retries}/{self._quota.retry_attempts})."
+                    )
+                    await asyncio.sleep(wait)
+                    slept_seconds += wait
+                    continue
+                log(
+                    f"{route.name} reported quota/rate exhaustion; "
+                    f"pausing requests for {cooldown}s."
+                )
+                self._stopped = True
+                return finish(None)
+
+
+def run_async_summaries(
+    router: SummaryRouter,
+    quota: QuotaConfig,
+    budget: BatchBudget,
+    concurrency: ConcurrencyConfig,
+    units: list[list[Path]],
+    batched: bool,
+    cache: SummaryCache | None = None,
+) -> bool:
+    engine = AsyncSummaryEngine(router, quota, budget, concurrency, cache)
+
+    async def run() -> None:
+        try:
+            await engine.run(units, batched)
+        finally:
+            await router.close_async_clients()
+
+    asyncio.run(run())
+    return engine.stopped
@@ -1,14 +1,26 @@
 from __future__ import annotations
 
+import fcntl
+import hashlib
 import json
 import os
 import re
 import time
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
+from typing import Callable, Iterator
 
-from openai import OpenAI
+from openai import APIConnectionError, APITimeoutError, AsyncOpenAI, OpenAI
+
+import metrics
+from transcribe_helpers import (
+    get_non_negative_float_env,
+    get_non_negative_int_env,
+    get_positive_int_env,
+    get_probability_env,
+)
 
 
 def _human_timestamp() -> str:
@@ -46,15 +58,40 @@ DO NOT MISS ANYTHING. Expand on key details in the topic outline."""
 TRANSCRIPTIONS_DIR = Path("transcriptions")
 ARCHIVE_TRANSCRIPTIONS_DIR = TRANSCRIPTIONS_DIR / "archive"
 SUMMARIES_DIR = Path("summaries")
+LANGUAGE_SIDECAR_SUFFIX = ".lang.json"
 GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
 STATE_DIR = Path(".state")
 GEMINI_USAGE_PATH = STATE_DIR / "gemini_usage.json"
+SUMMARY_CACHE_PATH = STATE_DIR / "summary_cache.sqlite3"
+TRANSCRIPT_MINHASH_PATH = STATE_DIR / "transcript_minhash.sqlite3"
+MAP_OUTLINES_DIR = STATE_DIR / "map_outlines"
 
 DEFAULT_GEMINI_DAILY_REQUEST_CAP = 18
 DEFAULT_QUOTA_COOLDOWN_SECONDS = 3600
+DEFAULT_DAILY_TOKEN_CAP = 0
+DEFAULT_TOKENS_PER_MINUTE = 0
+DEFAULT_COST_PER_MTOK = 0.0
+TOKEN_WINDOW_SECONDS = 60.0
 DEFAULT_QUOTA_RETRY_ATTEMPTS = 3
-DEFAULT_SUMMARY_BATCH_SIZE = 5
+DEFAULT_SUMMARY_BATCH_SIZE = 20
+DEFAULT_BATCH_INPUT_TOKEN_BUDGET = 200_000
+DEFAULT_BATCH_OUTPUT_TOKEN_BUDGET = 60_000
+DEFAULT_SUMMARY_OUTPUT_TOKENS = 1_500
+SUMMARY_OUTPUT_TOKEN_RATIO = 0.25
+CHARS_PER_TOKEN_ESTIMATE = 4
+DEFAULT_MAP_REDUCE_THRESHOLD_TOKENS = 120_000
+DEFAULT_MAP_CHUNK_TOKENS = 30_000
 DEFAULT_SUMMARY_PROVIDER = "gemini"
+SUMMARY_PROVIDER_NAMES = ("gemini", "openai")
+DEFAULT_SUMMARY_MAX_IN_FLIGHT = 1
+DEFAULT_SUMMARY_RPM_LIMIT = 0
+DEFAULT_SUMMARY_TPM_LIMIT = 0
+DEFAULT_SUMMARY_CACHE_MAX_MB = 256
+DEFAULT_SUMMARY_NEAR_DUPLICATE_THRESHOLD = 0.9
+DEFAULT_SUMMARY_STREAM = 1
+DEFAULT_SUMMARY_NORMALIZE = 1
+DEFAULT_SUMMARY_NORMALIZE_MAX_NGRAM = 8
+DEFAULT_SUMMARY_FILLER_WORDS = "um,uh,uhm,umm,erm,er,ah,hmm,mm,mhm"
 QUOTA_ERROR_SNIPPETS = (
     "429",
     "quota",
@@ -69,11 +106,76 @@ RETRY_DELAY_PATTERNS = (
 )
 
 
+@dataclass(frozen=True)
+class TokenBudget:
+    # 0 = unlimited; costs are per million tokens, 0 = not priced
+    daily_tokens: int
+    tokens_per_minute: int
+    input_cost_per_mtok: float
+    output_cost_per_mtok: float
+
+    def cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (prompt_tokens * self.input_cost_per_mtok + completion_tokens * self.output_cost_per_mtok) / 1e6
+
+    @property
+    def priced(self) -> bool:
+        return self.input_cost_per_mtok > 0 or self.output_cost_per_mtok > 0
+
+
 @dataclass(frozen=True)
 class QuotaConfig:
     daily_request_cap: int
     cooldown_seconds: int
     retry_attempts: int
+    token_budget: TokenBudget
+
+
+@dataclass(frozen=True)
+class ConcurrencyConfig:
+    max_in_flight: int
+    requests_per_minute: int
+    tokens_per_minute: int
+
+
+@dataclass(frozen=True)
+class ProviderKey:
+    provider: str
+    api_key: str
+    base_url: str | None
+    model: str
+    daily_request_cap: int
+    usage_path: Path
+    token_budget: TokenBudget
+
+
+@dataclass(frozen=True)
+class BatchBudget:
+    max_items: int
+    input_tokens: int
+    output_tokens: int
+    summary_tokens: int
+
+
+@dataclass(frozen=True)
+class MapReduceConfig:
+    threshold_tokens: int
+    chunk_tokens: int
+
+
+@dataclass(frozen=True)
+class NormalizeConfig:
+    filler_words: frozenset[str]
+    max_ngram: int
+
+
+@dataclass(frozen=True)
+class MapReducePlan:
+    chunks: list[str]
+    map_batches: list[list[int]]
+
+    @property
+    def request_count(self) -> int:
+        return len(self.map_batches) + 1
 
 
 @dataclass(frozen=True)
@@ -85,96 +187,241 @@ class BatchSummaryItem:
 
 
 class UsageState:
-    def __init__(self, state_path: Path, daily_cap: int) -> None:
+    # the ledger is shared by every summarizer process (and host, on a shared filesystem):
+    # reads never write, and every change is a locked read-modify-write with an atomic rename
+    def __init__(
+        self,
+        state_path: Path,
+        daily_cap: int,
+        daily_token_cap: int = 0,
+        tokens_per_minute: int = 0,
+    ) -> None:
         self._state_path = state_path
+        self._lock_path = state_path.with_name(state_path.name + ".lock")
         self._daily_cap = daily_cap
-        self._state = self._init_state()
+        self._daily_token_cap = daily_token_cap
+        self._tokens_per_minute = tokens_per_minute
+        self._state = self._read()
 
     @property
     def requests_used(self) -> int:
-        return int(self._state.get("requests_used", 0))
+        self._state = self._read()
+        return int(self._state["requests_used"])
 
     @property
     def daily_cap(self) -> int:
         return self._daily_cap
 
-    def can_send_request(self) -> tuple[bool, str]:
-        cooldown_seconds = self.remaining_cooldown_seconds()
-        if cooldown_seconds > 0:
-            return False, f"gemini cooldown active ({cooldown_seconds}s remaining)"
-        if self.requests_used >= self._daily_cap:
-            return False, f"local daily request cap reached ({self._daily_cap})"
-        return True, ""
+    @property
+    def tokens_used(self) -> int:
+        self._state = self._read()
+        return int(self._state["tokens_used"])
 
-    def reserve_daily_request(self) -> None:
-        self._state["requests_used"] = self.requests_used + 1
-        self._save()
+    @property
+    def daily_token_cap(self) -> int:
+        return self._daily_token_cap
+
+    def can_send_request(self, estimated_tokens: int = 0) -> tuple[bool, str]:
+        return self._check(self._read(), estimated_tokens)
+
+    def is_exhausted(self) -> bool:
+        # out of requests or tokens for today: only tomorrow helps, not waiting
+        state = self._read()
+        if int(state["requests_used"]) >= self._daily_cap:
+            return True
+        return self._daily_token_cap > 0 and int(state["tokens_used"]) >= self._daily_token_cap
+
+    def reserve_daily_request(self, estimated_tokens: int = 0) -> tuple[bool, str]:
+        # check-and-increment happens under the lock, so two processes can't both take the last request;
+        # the token estimate is held against the budgets until the real usage replaces it
+        with self._locked() as state:
+            allowed, reason = self._check(state, estimated_tokens)
+            if allowed:
+                state["requests_used"] = int(state["requests_used"]) + 1
+                self._add_tokens(state, estimated_tokens)
+                if self._tokens_per_minute > 0 and estimated_tokens > 0:
+                    # a third field marks an estimate still waiting for the real usage
+                    state["token_window"] = [*state["token_window"], [time.time(), estimated_tokens, 1]]
+        return allowed, reason
+
+    def release_daily_request(self, estimated_tokens: int = 0) -> None:
+        # refund for a request that never reached the provider
+        with self._locked() as state:
+            state["requests_used"] = max(0, int(state["requests_used"]) - 1)
+            self._add_tokens(state, -estimated_tokens)
+            self._settle_reservation(state, estimated_tokens, None)
+
+    def record_token_usage(self, estimated_tokens: int, prompt_tokens: int, completion_tokens: int) -> None:
+        with self._locked() as state:
+            state["prompt_tokens"] = int(state["prompt_tokens"]) + prompt_tokens
+            state["completion_tokens"] = int(state["completion_tokens"]) + completion_tokens
+            self._add_tokens(state, prompt_tokens + completion_tokens - estimated_tokens)
+            self._settle_reservation(state, estimated_tokens, prompt_tokens + completion_tokens)
+
+    def token_wait_seconds(self, estimated_tokens: int) -> int:
+        return self._window_wait_seconds(self._read(), estimated_tokens)
 
     def set_quota_cooldown(self, seconds: float) -> int:
         delay = max(1, int(float(seconds) + 0.999))
-        self._state["cooldown_until_epoch"] = time.time() + delay
-        self._save()
+        with self._locked() as state:
+            state["cooldown_until_epoch"] = max(
+                float(state["cooldown_until_epoch"]),
+                time.time() + delay,
+            )
         return delay
 
     def remaining_cooldown_seconds(self) -> int:
-        cooldown_until = float(self._state.get("cooldown_until_epoch", 0.0) or 0.0)
+        self._state = self._read()
+        return self._cooldown_seconds(self._state)
+
+    def _check(self, state: dict[str, object], estimated_tokens: int = 0) -> tuple[bool, str]:
+        cooldown_seconds = self._cooldown_seconds(state)
+        if cooldown_seconds > 0:
+            return False, f"quota cooldown active ({cooldown_seconds}s remaining)"
+        if int(state["requests_used"]) >= self._daily_cap:
+            return False, f"local daily request cap reached ({self._daily_cap})"
+        tokens_used = int(state["tokens_used"])
+        if self._daily_token_cap > 0 and tokens_used + estimated_tokens > self._daily_token_cap:
+            return False, (
+                f"local daily token cap reached ({tokens_used}/{self._daily_token_cap} used, "
+                f"~{estimated_tokens} needed)"
+            )
+        wait = self._window_wait_seconds(state, estimated_tokens)
+        if wait > 0:
+            return False, f"tokens-per-minute budget full ({wait}s until ~{estimated_tokens} tokens fit)"
+        return True, ""
+
+    @staticmethod
+    def _add_tokens(state: dict[str, object], tokens: int) -> None:
+        state["tokens_used"] = max(0, int(state["tokens_used"]) + tokens)
+
+    def _settle_reservation(self, state: dict[str, object], estimated_tokens: int, actual_tokens: int | None) -> None:
+        # the real usage replaces the estimate where it was reserved, so it leaves the minute
+        # window when the request's own send time does; None drops a refunded reservation.
+        # Reservations of the same size are interchangeable, so the oldest one is taken
+        if self._tokens_per_minute <= 0:
+            return
+        window = state["token_window"]
+        for index, entry in enumerate(window):
+            if len(entry) > 2 and entry[1] == estimated_tokens:
+                if actual_tokens is None:
+                    del window[index]
+                else:
+                    window[index] = [entry[0], actual_tokens]
+                return
+        if estimated_tokens <= 0 and actual_tokens:
+            # nothing was reserved for this request, so its usage counts from now
+            window.append([time.time(), actual_tokens])
+
+    def _window_wait_seconds(self, state: dict[str, object], estimated_tokens: int) -> int:
+        if self._tokens_per_minute <= 0:
+            return 0
+        entries = sorted(state["token_window"])
+        in_window = sum(tokens for _, tokens, *_ in entries)
+        # a request larger than the whole budget goes out once the window is empty
+        needed = min(estimated_tokens, self._tokens_per_minute)
+        if in_window + needed <= self._tokens_per_minute:
+            return 0
+        now = time.time()
+        for sent_at, tokens, *_ in entries:
+            in_window -= tokens
+            if in_window + needed <= self._tokens_per_minute:
+                return max(1, int(sent_at + TOKEN_WINDOW_SECONDS - now + 0.999))
+        return max(1, int(entries[-1][0] + TOKEN_WINDOW_SECONDS - now + 0.999))
+
+    @staticmethod
+    def _cooldown_seconds(state: dict[str, object]) -> int:
+        cooldown_until = float(state["cooldown_until_epoch"])
         if cooldown_until <= 0:
             return 0
+        return max(0, int(cooldown_until - time.time() + 0.999))
 
-        remaining = int(cooldown_until - time.time() + 0.999)
-        if remaining <= 0:
-            self._state["cooldown_until_epoch"] = 0.0
-            self._save()
-            return 0
-        return remaining
+    @contextmanager
+    def _locked(self) -> Iterator[dict[str, object]]:
+        self._state_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock_path.open("a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            state = self._read()
+            yield state
+            self._save_state(state)
+            self._state = state
 
-    def _init_state(self) -> dict[str, object]:
+    def _read(self) -> dict[str, object]:
         today = local_day_iso()
         saved_state = self._load()
+        # the minute window spans midnight; the daily counters don't
+        token_window = self._read_token_window(saved_state.get("token_window"))
         if saved_state.get("date") != today:
-            state = {
+            return {
                 "date": today,
                 "requests_used": 0,
                 "cooldown_until_epoch": 0.0,
+                "tokens_used": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "token_window": token_window,
             }
-            self._save_state(state)
-            return state
 
         try:
             requests_used = int(saved_state.get("requests_used", 0))
         except (TypeError, ValueError):
-            requests_used = 0
-
-        state = {
+            requests_used = self._daily_cap
+        try:
+            cooldown_until = float(saved_state.get("cooldown_until_epoch", 0.0) or 0.0)
+        except (TypeError, ValueError):
+            cooldown_until = 0.0
+        counters: dict[str, int] = {}
+        for field in ("tokens_used", "prompt_tokens", "completion_tokens"):
+            try:
+                counters[field] = max(0, int(saved_state.get(field, 0) or 0))
+            except (TypeError, ValueError):
+                counters[field] = self._daily_token_cap if field == "tokens_used" else 0
+        return {
             "date": today,
-            "requests_used": max(0, requests_used),
-            "cooldown_until_epoch": float(saved_state.get("cooldown_until_epoch", 0.0) or 0.0),
+            "requests_used": min(max(0, requests_used), self._daily_cap),
+            "cooldown_until_epoch": cooldown_until,
+            **counters,
+            "token_window": token_window,
         }
 
-        if state["requests_used"] > self._daily_cap:
-            state["requests_used"] = self._daily_cap
-
-        self._save_state(state)
-        return state
+    @staticmethod
+    def _read_token_window(raw: object) -> list[list[float]]:
+        if not isinstance(raw, list):
+            return []
+        cutoff = time.time() - TOKEN_WINDOW_SECONDS
+        entries: list[list[float]] = []
+        for entry in raw:
+            try:
+                sent_at, tokens = float(entry[0]), int(entry[1])
+            except (TypeError, ValueError, IndexError):
+                continue
+            if sent_at > cutoff:
+                entries.append([sent_at, tokens, 1] if len(entry) > 2 and entry[2] else [sent_at, tokens])
+        return entries
 
     def _load(self) -> dict[str, object]:
-        if not self._state_path.is_file():
-            return {}
         try:
-            data = json.loads(self._state_path.read_text(encoding="utf-8"))
-        except Exception:
+            raw = self._state_path.read_text(encoding="utf-8")
+        except FileNotFoundError:
             return {}
-        return data if isinstance(data, dict) else {}
-
-    def _save(self) -> None:
-        self._save_state(self._state)
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            return data
+        # writes are atomic, so this is damage from outside; don't hand out a fresh day's quota
+        log(f"warning: unreadable {self._state_path}; treating today's request cap as used")
+        return {"date": local_day_iso(), "requests_used": self._daily_cap, "tokens_used": self._daily_token_cap}
 
     def _save_state(self, state: dict[str, object]) -> None:
         self._state_path.parent.mkdir(parents=True, exist_ok=True)
-        self._state_path.write_text(
-            json.dumps(state, ensure_ascii=True, indent=2) + "\n",
-            encoding="utf-8",
-        )
+        tmp_path = self._state_path.with_name(f".{self._state_path.name}.{os.getpid()}.tmp")
+        with tmp_path.open("w", encoding="utf-8") as file:
+            file.write(json.dumps(state, ensure_ascii=True, indent=2) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self._state_path)
 
 
 def build_prompt(text: str, source_name: str) -> str:
@@ -213,6 +460,200 @@ def build_batch_prompt(items: list[BatchSummaryItem]) -> str:
     return "\n".join(lines).strip() + "\n"
 
 
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN_ESTIMATE - 1) // CHARS_PER_TOKEN_ESTIMATE
+
+
+def estimate_file_tokens(path: Path) -> int:
+    # utf-8 byte count is close enough to the character count for packing purposes
+    try:
+        size = path.stat().st_size
+    except OSError:
+        return 0
+    return (size + CHARS_PER_TOKEN_ESTIMATE - 1) // CHARS_PER_TOKEN_ESTIMATE
+
+
+def estimate_summary_tokens(input_tokens: int, budget: BatchBudget) -> int:
+    return max(budget.summary_tokens, int(input_tokens * SUMMARY_OUTPUT_TOKEN_RATIO))
+
+
+def estimate_request_tokens(prompt: str, summarized_texts: list[str], budget: BatchBudget) -> int:
+    # pre-send estimate held against the token budgets: system and user prompt plus the
+    # expected output for each summarized text; the real usage replaces it afterwards
+    return (
+        estimate_tokens(SYSTEM_PROMPT)
+        + estimate_tokens(prompt)
+        + sum(estimate_summary_tokens(estimate_tokens(text), budget) for text in summarized_texts)
+    )
+
+
+_BATCH_PROMPT_OVERHEAD_TOKENS = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(SUMMARY_PROMPT) + 200
+_BATCH_ITEM_OVERHEAD_TOKENS = 40
+
+
+def pack_summary_batches(
+    transcript_paths: list[Path],
+    budget: BatchBudget,
+    estimate: Callable[[Path], int] = estimate_file_tokens,
+) -> list[list[Path]]:
+    # first-fit packing: each transcript goes into the first request with room left in
+    # both the input and the expected output budget; oversized transcripts go alone
+    batches: list[tuple[list[Path], int, int]] = []
+    for path in transcript_paths:
+        input_tokens = estimate(path) + _BATCH_ITEM_OVERHEAD_TOKENS
+        output_tokens = estimate_summary_tokens(input_tokens, budget)
+        for index, (paths, used_in, used_out) in enumerate(batches):
+            if (
+                len(paths) < budget.max_items
+                and used_in + input_tokens <= budget.input_tokens
+                and used_out + output_tokens <= budget.output_tokens
+            ):
+                paths.append(path)
+                batches[index] = (paths, used_in + input_tokens, used_out + output_tokens)
+                break
+        else:
+            batches.append(([path], _BATCH_PROMPT_OVERHEAD_TOKENS + input_tokens, output_tokens))
+    return [paths for paths, _, _ in batches]
+
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_into_sentence_chunks(text: str, max_tokens: int) -> list[str]:
+    max_chars = max_tokens * CHARS_PER_TOKEN_ESTIMATE
+    pieces: list[str] = []
+    for sentence in _SENTENCE_END_RE.split(text.strip()):
+        # whisper sometimes emits very long unpunctuated runs; fall back to word boundaries
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+        if sentence:
+            pieces.append(sentence)
+
+    chunks: list[str] = []
+    current: list[str] = []
+    current_chars = 0
+    for piece in pieces:
+        if current and current_chars + len(piece) + 1 > max_chars:
+            chunks.append(" ".join(current))
+            current = []
+            current_chars = 0
+        current.append(piece)
+        current_chars += len(piece) + 1
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def plan_map_reduce(text: str, budget: BatchBudget, config: MapReduceConfig) -> MapReducePlan:
+    chunk_tokens = min(config.chunk_tokens, budget.input_tokens - _BATCH_PROMPT_OVERHEAD_TOKENS)
+    chunks = split_into_sentence_chunks(text, max(1, chunk_tokens))
+    map_batches: list[list[int]] = []
+    used_in = used_out = 0
+    for index, chunk in enumerate(chunks):
+        input_tokens = estimate_tokens(chunk) + _BATCH_ITEM_OVERHEAD_TOKENS
+        output_tokens = estimate_summary_tokens(input_tokens, budget)
+        if (
+            map_batches
+            and len(map_batches[-1]) < budget.max_items
+            and used_in + input_tokens <= budget.input_tokens
+            and used_out + output_tokens <= budget.output_tokens
+        ):
+            map_batches[-1].append(index)
+            used_in += input_tokens
+            used_out += output_tokens
+            continue
+        map_batches.append([index])
+        used_in = _BATCH_PROMPT_OVERHEAD_TOKENS + input_tokens
+        used_out = output_tokens
+    return MapReducePlan(chunks=chunks, map_batches=map_batches)
+
+
+def plan_outline_merges(outlines: list[str], budget: BatchBudget, config: MapReduceConfig) -> list[list[int]]:
+    # consecutive outlines grouped up to the map chunk size, and in pairs at least while the
+    # request fits, so every stage shrinks the list; an empty plan means they already fit
+    # one reduce request together
+    input_tokens = max(1, budget.input_tokens - _BATCH_PROMPT_OVERHEAD_TOKENS)
+    max_tokens = min(config.chunk_tokens, input_tokens)
+    sizes = [estimate_tokens(outline) + _BATCH_ITEM_OVERHEAD_TOKENS for outline in outlines]
+    if sum(sizes) <= max_tokens:
+        return []
+    groups: list[list[int]] = []
+    used = 0
+    for index, size in enumerate(sizes):
+        if groups and (
+            used + size <= max_tokens or (len(groups[-1]) == 1 and used + size <= input_tokens)
+        ):
+            groups[-1].append(index)
+            used += size
+            continue
+        groups.append([index])
+        used = size
+    return groups
+
+
+def build_outline_merge_prompt(outlines: list[str], source_name: str) -> str:
+    parts = "\n\n".join(
+        f"Outline {index} of {len(outlines)}:\n{outline.strip()}"
+        for index, outline in enumerate(outlines, start=1)
+    )
+    return (
+        f"The transcript of {source_name} is too long to summarize in one pass. Below are "
+        "detailed outlines of some of its consecutive parts, in order. Merge them into one "
+        "detailed topic-wise outline, joining topics that span parts. DO NOT MISS ANYTHING: "
+        "keep every key detail, name, number, example and argument, since this outline will "
+        "be merged into the final summary without the transcript. Return only the outline.\n\n"
+        f"{parts}"
+    )
+
+
+def build_map_prompt(items: list[BatchSummaryItem], source_name: str) -> str:
+    lines: list[str] = []
+    lines.append(
+        f"The transcript of {source_name} is too long to summarize in one pass, "
+        "so it has been split into consecutive parts."
+    )
+    lines.append(
+        "For each part below, write a detailed topic-wise outline of everything it covers. "
+        "DO NOT MISS ANYTHING: keep every key detail, name, number, example and argument, "
+        "since these outlines will be merged into the final summary without the transcript."
+    )
+    lines.append("")
+    lines.append("Return ONLY blocks in this exact format, one per part, in the same order:")
+    lines.append('<<<begin_summary id="p1">>>')
+    lines.append("<outline text>")
+    lines.append("<<<end_summary>>>")
+    lines.append("")
+    lines.append("Do not add any other text outside these blocks.")
+    lines.append("")
+    lines.append("Parts:")
+    for item in items:
+        lines.append(
+            f'<<<begin_transcript id="{item.item_id}" source="{item.source_name}">>>'
+        )
+        lines.append(item.text.strip())
+        lines.append("<<<end_transcript>>>")
+        lines.append("")
+    return "\n".join(lines).strip() + "\n"
+
+
+def build_reduce_prompt(outlines: list[str], source_name: str) -> str:
+    parts = "\n\n".join(
+        f"Part {index} of {len(outlines)}:\n{outline.strip()}"
+        for index, outline in enumerate(outlines, start=1)
+    )
+    return (
+        f"{SUMMARY_PROMPT}\n\nSource: {source_name}\n\n"
+        "The transcript was too long to send at once. Below are detailed outlines of its "
+        "consecutive parts, in order. Treat them together as the full material and produce "
+        "one summary of the whole, merging topics that span parts.\n\n"
+        f"Part outlines:\n{parts}"
+    )
+
+
 _BATCH_SUMMARY_BLOCK_RE = re.compile(
     r"<<<\s*begin_summary\s+id\s*=\s*['\"](?P<id>[^'\"]+)['\"]\s*>>>\s*"
     r"(?P<content>.*?)\s*"
@@ -231,6 +672,28 @@ def parse_batch_summaries(text: str) -> dict[str, str]:
     return results
 
 
+class BatchSummaryStreamParser:
+    def __init__(self) -> None:
+        self._buffer = ""
+
+    def feed(self, text: str) -> list[tuple[str, str]]:
+        self._buffer += text
+        completed: list[tuple[str, str]] = []
+        consumed = 0
+        for match in _BATCH_SUMMARY_BLOCK_RE.finditer(self._buffer):
+            item_id = (match.group("id") or "").strip()
+            if item_id:
+                completed.append((item_id, (match.group("content") or "").strip()))
+            consumed = match.end()
+        # only the unfinished tail is kept, so each delta costs O(current block)
+        self._buffer = self._buffer[consumed:]
+        return completed
+
+    @property
+    def pending_text(self) -> str:
+        return self._buffer
+
+
 def archive_transcript(transcript_path: Path) -> Path:
     ARCHIVE_TRANSCRIPTIONS_DIR.mkdir(parents=True, exist_ok=True)
     archive_path = ARCHIVE_TRANSCRIPTIONS_DIR / transcript_path.name
@@ -240,9 +703,23 @@ def archive_transcript(transcript_path: Path) -> Path:
             f"{transcript_path.stem}-{suffix}{transcript_path.suffix}"
         )
     transcript_path.replace(archive_path)
+    # the language sidecar written by transcribe.py follows its transcript
+    sidecar_path = transcript_path.with_name(f"{transcript_path.stem}{LANGUAGE_SIDECAR_SUFFIX}")
+    if sidecar_path.is_file():
+        sidecar_path.replace(archive_path.with_name(f"{archive_path.stem}{LANGUAGE_SIDECAR_SUFFIX}"))
     return archive_path
 
 
+def read_transcript_language(transcript_path: Path) -> str | None:
+    # the language transcribe.py detected, or None when it did not route by language
+    sidecar_path = transcript_path.with_name(f"{transcript_path.stem}{LANGUAGE_SIDECAR_SUFFIX}")
+    try:
+        language = json.loads(sidecar_path.read_text(encoding="utf-8")).get("language")
+    except (OSError, ValueError, AttributeError):
+        return None
+    return str(language).lower() if language else None
+
+
 def local_day_iso() -> str:
     return datetime.now().astimezone().date().isoformat()
 
@@ -252,6 +729,24 @@ def load_quota_config() -> QuotaConfig:
         daily_request_cap=_get_daily_request_cap(),
         cooldown_seconds=_get_quota_cooldown_seconds(),
         retry_attempts=_get_quota_retry_attempts(),
+        token_budget=load_token_budget("gemini"),
+    )
+
+
+def load_token_budget(provider: str, fallback: TokenBudget | None = None) -> TokenBudget:
+    # a second provider inherits the primary budgets (like its request cap), but not its prices
+    prefix = provider.upper()
+    return TokenBudget(
+        daily_tokens=get_non_negative_int_env(
+            f"{prefix}_DAILY_TOKEN_CAP",
+            fallback.daily_tokens if fallback else DEFAULT_DAILY_TOKEN_CAP,
+        ),
+        tokens_per_minute=get_non_negative_int_env(
+            f"{prefix}_TOKENS_PER_MINUTE",
+            fallback.tokens_per_minute if fallback else DEFAULT_TOKENS_PER_MINUTE,
+        ),
+        input_cost_per_mtok=get_non_negative_float_env(f"{prefix}_INPUT_COST_PER_MTOK", DEFAULT_COST_PER_MTOK),
+        output_cost_per_mtok=get_non_negative_float_env(f"{prefix}_OUTPUT_COST_PER_MTOK", DEFAULT_COST_PER_MTOK),
     )
 
 
@@ -260,6 +755,11 @@ def is_quota_error(exc: Exception) -> bool:
     return any(snippet in message for snippet in QUOTA_ERROR_SNIPPETS)
 
 
+def is_unsent_request_error(exc: Exception) -> bool:
+    # a timeout may have reached the provider (and been billed); a refused connection has not
+    return isinstance(exc, APIConnectionError) and not isinstance(exc, APITimeoutError)
+
+
 def parse_retry_delay_seconds(exc: Exception) -> float | None:
     message_lc = str(exc).lower()
     for pattern in RETRY_DELAY_PATTERNS:
@@ -275,19 +775,44 @@ def parse_retry_delay_seconds(exc: Exception) -> float | None:
     return None
 
 
-def get_client() -> OpenAI:
+def load_provider_keys(quota: QuotaConfig) -> list[ProviderKey]:
     load_local_env()
-    provider = _get_summary_provider()
-    if provider == "gemini":
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise RuntimeError("GEMINI_API_KEY is not set")
-        return OpenAI(api_key=api_key, base_url=GEMINI_BASE_URL)
-
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is not set")
-    return OpenAI(api_key=api_key)
+    primary_provider = _get_summary_provider()
+    primary_key = os.getenv(f"{primary_provider.upper()}_API_KEY", "").strip()
+    keys: list[ProviderKey] = []
+    for provider in _get_summary_providers(primary_provider):
+        prefix = provider.upper()
+        raw_keys = os.getenv(f"{prefix}_API_KEYS", "").split(",") + [os.getenv(f"{prefix}_API_KEY", "")]
+        api_keys = list(dict.fromkeys(key.strip() for key in raw_keys if key.strip()))
+        if not api_keys:
+            log(f"warning: no {prefix}_API_KEY or {prefix}_API_KEYS set; skipping {provider}")
+            continue
+        daily_cap = quota.daily_request_cap
+        token_budget = quota.token_budget
+        if provider == "openai":
+            daily_cap = get_positive_int_env("OPENAI_DAILY_REQUEST_CAP", daily_cap)
+            token_budget = load_token_budget(provider, quota.token_budget)
+        for api_key in api_keys:
+            # the original single-key ledger keeps tracking the primary key
+            if provider == primary_provider and api_key == primary_key:
+                usage_path = GEMINI_USAGE_PATH
+            else:
+                digest = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+                usage_path = STATE_DIR / f"{provider}_usage_{digest}.json"
+            keys.append(
+                ProviderKey(
+                    provider=provider,
+                    api_key=api_key,
+                    base_url=GEMINI_BASE_URL if provider == "gemini" else None,
+                    model=MODEL_NAME if provider == "gemini" else os.getenv("OPENAI_SUMMARY_MODEL", MODEL_NAME),
+                    daily_request_cap=daily_cap,
+                    usage_path=usage_path,
+                    token_budget=token_budget,
+                )
+            )
+    if not keys:
+        raise RuntimeError(f"{primary_provider.upper()}_API_KEY is not set")
+    return keys
 
 
 def load_local_env() -> None:
@@ -303,74 +828,213 @@ def load_local_env() -> None:
         os.environ.setdefault(key.strip(), value.strip().strip('"').strip("'"))
 
 
-def summarize_with_client(client: OpenAI, prompt: str) -> str:
+def record_request_metrics(started: float, usage, model: str, **fields: object) -> None:
+    if not metrics.enabled():
+        return
+    metrics.record(
+        "summarize_request",
+        model=model,
+        latency_seconds=time.perf_counter() - started,
+        prompt_tokens=getattr(usage, "prompt_tokens", None) or 0,
+        completion_tokens=getattr(usage, "completion_tokens", None) or 0,
+        **fields,
+    )
+
+
+def summarize_with_client(
+    client: OpenAI,
+    prompt: str,
+    model: str = MODEL_NAME,
+    on_usage: Callable[[object], None] | None = None,
+) -> str:
+    started = time.perf_counter()
     response = client.chat.completions.create(
-        model=MODEL_NAME,
+        model=model,
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
             {"role": "user", "content": prompt},
         ],
     )
+    record_request_metrics(started, response.usage, model)
+    if on_usage is not None:
+        on_usage(response.usage)
+    return (response.choices[0].message.content or "").strip()
+
+
+def stream_with_client(
+    client: OpenAI,
+    prompt: str,
+    model: str = MODEL_NAME,
+    on_usage: Callable[[object], None] | None = None,
+) -> Iterator[str]:
+    started = time.perf_counter()
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    usage = None
+    first_token_seconds = 0.0
+    for chunk in stream:
+        # with include_usage the final chunk carries token counts and no choices
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        if chunk.choices and chunk.choices[0].delta.content:
+            if not first_token_seconds:
+                first_token_seconds = time.perf_counter() - started
+            yield chunk.choices[0].delta.content
+    record_request_metrics(started, usage, model, first_token_seconds=first_token_seconds)
+    if on_usage is not None:
+        on_usage(usage)
+
+
+async def summarize_with_async_client(
+    client: AsyncOpenAI,
+    prompt: str,
+    model: str = MODEL_NAME,
+    on_usage: Callable[[object], None] | None = None,
+) -> str:
+    started = time.perf_counter()
+    response = await client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+    )
+    record_request_metrics(started, response.usage, model)
+    if on_usage is not None:
+        on_usage(response.usage)
     return (response.choices[0].message.content or "").strip()
 
 
 def _get_summary_provider() -> str:
     raw = os.getenv("SUMMARY_PROVIDER", DEFAULT_SUMMARY_PROVIDER).strip().lower()
-    if raw in {"gemini", "openai"}:
+    if raw in SUMMARY_PROVIDER_NAMES:
         return raw
     log(f"invalid SUMMARY_PROVIDER={raw!r}; using {DEFAULT_SUMMARY_PROVIDER}")
     return DEFAULT_SUMMARY_PROVIDER
 
 
-def _get_positive_int_env(name: str, default: int) -> int:
-    raw = os.getenv(name, str(default))
-    try:
-        value = int(raw)
-    except ValueError:
-        log(f"invalid {name}={raw!r}; using {default}")
-        return default
-    if value <= 0:
-        log(f"{name} must be > 0 (got {raw!r}); using {default}")
-        return default
-    return value
-
-
-def _get_non_negative_int_env(name: str, default: int) -> int:
-    raw = os.getenv(name, str(default))
-    try:
-        value = int(raw)
-    except ValueError:
-        log(f"invalid {name}={raw!r}; using {default}")
-        return default
-    if value < 0:
-        log(f"{name} must be >= 0 (got {raw!r}); using {default}")
-        return default
-    return value
+def _get_summary_providers(primary_provider: str) -> list[str]:
+    raw = os.getenv("SUMMARY_PROVIDERS", "").strip().lower()
+    if not raw:
+        return [primary_provider]
+    providers: list[str] = []
+    for name in (part.strip() for part in raw.split(",")):
+        if name not in SUMMARY_PROVIDER_NAMES:
+            log(f"invalid provider {name!r} in SUMMARY_PROVIDERS; ignoring it")
+        elif name not in providers:
+            providers.append(name)
+    return providers or [primary_provider]
 
 
 def _get_daily_request_cap() -> int:
-    return _get_positive_int_env(
+    return get_positive_int_env(
         "GEMINI_DAILY_REQUEST_CAP",
         DEFAULT_GEMINI_DAILY_REQUEST_CAP,
     )
 
 
 def get_summary_batch_size() -> int:
-    return _get_positive_int_env(
+    return get_positive_int_env(
         "GEMINI_SUMMARY_BATCH_SIZE",
         DEFAULT_SUMMARY_BATCH_SIZE,
     )
 
 
+def load_batch_budget() -> BatchBudget:
+    return BatchBudget(
+        max_items=get_summary_batch_size(),
+        input_tokens=get_positive_int_env(
+            "GEMINI_BATCH_INPUT_TOKEN_BUDGET",
+            DEFAULT_BATCH_INPUT_TOKEN_BUDGET,
+        ),
+        output_tokens=get_positive_int_env(
+            "GEMINI_BATCH_OUTPUT_TOKEN_BUDGET",
+            DEFAULT_BATCH_OUTPUT_TOKEN_BUDGET,
+        ),
+        summary_tokens=get_positive_int_env(
+            "GEMINI_SUMMARY_OUTPUT_TOKENS",
+            DEFAULT_SUMMARY_OUTPUT_TOKENS,
+        ),
+    )
+
+
+def load_concurrency_config() -> ConcurrencyConfig:
+    return ConcurrencyConfig(
+        max_in_flight=get_positive_int_env(
+            "SUMMARY_MAX_IN_FLIGHT",
+            DEFAULT_SUMMARY_MAX_IN_FLIGHT,
+        ),
+        requests_per_minute=get_non_negative_int_env(
+            "SUMMARY_RPM_LIMIT",
+            DEFAULT_SUMMARY_RPM_LIMIT,
+        ),
+        tokens_per_minute=get_non_negative_int_env(
+            "SUMMARY_TPM_LIMIT",
+            DEFAULT_SUMMARY_TPM_LIMIT,
+        ),
+    )
+
+
+def get_summary_cache_max_mb() -> int:
+    return get_non_negative_int_env(
+        "SUMMARY_CACHE_MAX_MB",
+        DEFAULT_SUMMARY_CACHE_MAX_MB,
+    )
+
+
+def get_near_duplicate_threshold() -> float:
+    return get_probability_env(
+        "SUMMARY_NEAR_DUPLICATE_THRESHOLD",
+        DEFAULT_SUMMARY_NEAR_DUPLICATE_THRESHOLD,
+    )
+
+
+def load_map_reduce_config() -> MapReduceConfig:
+    return MapReduceConfig(
+        threshold_tokens=get_positive_int_env(
+            "SUMMARY_MAP_REDUCE_THRESHOLD_TOKENS",
+            DEFAULT_MAP_REDUCE_THRESHOLD_TOKENS,
+        ),
+        chunk_tokens=get_positive_int_env(
+            "SUMMARY_MAP_CHUNK_TOKENS",
+            DEFAULT_MAP_CHUNK_TOKENS,
+        ),
+    )
+
+
+def get_summary_stream_enabled() -> bool:
+    return get_non_negative_int_env("SUMMARY_STREAM", DEFAULT_SUMMARY_STREAM) > 0
+
+
+def load_normalize_config() -> NormalizeConfig | None:
+    if get_non_negative_int_env("SUMMARY_NORMALIZE", DEFAULT_SUMMARY_NORMALIZE) == 0:
+        return None
+    raw_filler = os.getenv("SUMMARY_FILLER_WORDS", DEFAULT_SUMMARY_FILLER_WORDS)
+    return NormalizeConfig(
+        filler_words=frozenset(word.strip().lower() for word in raw_filler.split(",") if word.strip()),
+        max_ngram=get_non_negative_int_env(
+            "SUMMARY_NORMALIZE_MAX_NGRAM",
+            DEFAULT_SUMMARY_NORMALIZE_MAX_NGRAM,
+        ),
+    )
+
+
 def _get_quota_cooldown_seconds() -> int:
-    return _get_positive_int_env(
+    return get_positive_int_env(
         "GEMINI_QUOTA_COOLDOWN_SECONDS",
         DEFAULT_QUOTA_COOLDOWN_SECONDS,
     )
 
 
 def _get_quota_retry_attempts() -> int:
-    return _get_non_negative_int_env(
+    return get_non_negative_int_env(
         "GEMINI_QUOTA_RETRY_ATTEMPTS",
         DEFAULT_QUOTA_RETRY_ATTEMPTS,
     )
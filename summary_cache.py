@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Iterable
+
+from summarize_helpers import (
+    SUMMARY_CACHE_PATH,
+    SUMMARY_PROMPT,
+    SYSTEM_PROMPT,
+    get_summary_cache_max_mb,
+    log,
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_transcript_text(text: str) -> str:
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def summary_cache_key(text: str, model: str) -> str:
+    # keyed by the model that wrote the summary, so switching models does not serve old output
+    digest = hashlib.sha256()
+    for part in (model, SYSTEM_PROMPT, SUMMARY_PROMPT, normalize_transcript_text(text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class SummaryCache:
+    def __init__(self, path: Path, max_bytes: int, models: Iterable[str]) -> None:
+        self._max_bytes = max_bytes
+        # a lookup accepts a summary from any model this run could send the request to
+        self._models = tuple(dict.fromkeys(models))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                summary TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS summaries_last_used ON summaries (last_used);
+            CREATE TABLE IF NOT EXISTS stats (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+
+    def get(self, text: str) -> str | None:
+        with self._db:
+            for model in self._models:
+                key = summary_cache_key(text, model)
+                row = self._db.execute("SELECT summary FROM summaries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self.hits += 1
+                    self._bump("hits")
+                    self._db.execute("UPDATE summaries SET last_used = ? WHERE key = ?", (time.time(), key))
+                    return row[0]
+            self.misses += 1
+            self._bump("misses")
+        return None
+
+    def put(self, text: str, summary: str, model: str) -> None:
+        now = time.time()
+        size = len(summary.encode("utf-8"))
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO summaries (key, summary, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (summary_cache_key(text, model), summary, size, now, now),
+            )
+            self._evict()
+
+    def log_stats(self) -> None:
+        totals = dict(self._db.execute("SELECT name, value FROM stats").fetchall())
+        entries, size = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM summaries"
+        ).fetchone()
+        lookups = self.hits + self.misses
+        rate = f"{self.hits / lookups:.0%}" if lookups else "n/a"
+        log(
+            f"summary cache: {self.hits} hits, {self.misses} misses ({rate}), "
+            f"{self.evictions} evictions this run; {entries} entries, {size} bytes; "
+            f"lifetime {totals.get('hits', 0)} hits / {totals.get('misses', 0)} misses"
+        )
+
+    def close(self) -> None:
+        self._db.close()
+
+    def _bump(self, name: str) -> None:
+        self._db.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def _evict(self) -> None:
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM summaries").fetchone()
+        if total <= self._max_bytes:
+            return
+        excess = total - self._max_bytes
+        freed = 0
+        victims: list[str] = []
+        for key, size in self._db.execute("SELECT key, size FROM summaries ORDER BY last_used"):
+            victims.append(key)
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany("DELETE FROM summaries WHERE key = ?", ((key,) for key in victims))
+        self.evictions += len(victims)
+
+
+def open_summary_cache(models: Iterable[str]) -> SummaryCache | None:
+    max_mb = get_summary_cache_max_mb()
+    if max_mb == 0:
+        return None
+    return SummaryCache(SUMMARY_CACHE_PATH, max_mb * 1024 * 1024, models)
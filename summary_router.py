@@ -0,0 +1,236 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterator
+
+from openai import AsyncOpenAI, OpenAI
+
+from summarize_helpers import (
+    ProviderKey,
+    QuotaConfig,
+    UsageState,
+    load_provider_keys,
+    log,
+    stream_with_client,
+    summarize_with_async_client,
+    summarize_with_client,
+)
+
+
+@dataclass
+class RunUsage:
+    # this process's spend, for the end-of-run report; the daily totals live in UsageState
+    requests: int = 0
+    transcripts: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    unreported: int = 0
+
+
+class SummaryRoute:
+    def __init__(self, key: ProviderKey) -> None:
+        self.provider = key.provider
+        self.model = key.model
+        self.name = f"{key.provider} key ...{key.api_key[-4:]}"
+        self.token_budget = key.token_budget
+        self.usage_state = UsageState(
+            key.usage_path,
+            key.daily_request_cap,
+            key.token_budget.daily_tokens,
+            key.token_budget.tokens_per_minute,
+        )
+        self.run_usage = RunUsage()
+        self._client_kwargs: dict[str, str] = {"api_key": key.api_key}
+        if key.base_url is not None:
+            self._client_kwargs["base_url"] = key.base_url
+        self._client: OpenAI | None = None
+        self._async_client: AsyncOpenAI | None = None
+
+    @property
+    def client(self) -> OpenAI:
+        if self._client is None:
+            self._client = OpenAI(**self._client_kwargs)
+        return self._client
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(**self._client_kwargs)
+        return self._async_client
+
+    async def close_async_client(self) -> None:
+        # the async client's connections belong to the event loop that opened them; each
+        # engine run has its own loop, so the next run starts with a fresh client
+        if self._async_client is not None:
+            client, self._async_client = self._async_client, None
+            await client.close()
+
+    def headroom(self) -> int:
+        return max(0, self.usage_state.daily_cap - self.usage_state.requests_used)
+
+    def complete(self, prompt: str, estimated_tokens: int, transcripts: int = 1) -> str:
+        return summarize_with_client(
+            self.client,
+            prompt,
+            self.model,
+            on_usage=lambda usage: self.record_usage(usage, estimated_tokens, transcripts),
+        )
+
+    def stream(self, prompt: str, estimated_tokens: int, transcripts: int = 1) -> Iterator[str]:
+        return stream_with_client(
+            self.client,
+            prompt,
+            self.model,
+            on_usage=lambda usage: self.record_usage(usage, estimated_tokens, transcripts),
+        )
+
+    async def complete_async(self, prompt: str, estimated_tokens: int, transcripts: int = 1) -> str:
+        return await summarize_with_async_client(
+            self.async_client,
+            prompt,
+            self.model,
+            on_usage=lambda usage: self.record_usage(usage, estimated_tokens, transcripts),
+        )
+
+    def record_usage(self, usage, estimated_tokens: int, transcripts: int) -> None:
+        self.run_usage.requests += 1
+        self.run_usage.transcripts += transcripts
+        if usage is None:
+            # nothing to reconcile: the pre-send estimate stays on the ledger
+            self.run_usage.unreported += 1
+            return
+        prompt_tokens = int(getattr(usage, "prompt_tokens", None) or 0)
+        completion_tokens = int(getattr(usage, "completion_tokens", None) or 0)
+        self.usage_state.record_token_usage(estimated_tokens, prompt_tokens, completion_tokens)
+        cost = self.token_budget.cost(prompt_tokens, completion_tokens)
+        self.run_usage.prompt_tokens += prompt_tokens
+        self.run_usage.completion_tokens += completion_tokens
+        self.run_usage.cost += cost
+        message = (
+            f"{self.name}: {prompt_tokens} prompt + {completion_tokens} completion tokens "
+            f"(estimated {estimated_tokens})"
+        )
+        if self.token_budget.priced:
+            message += f", ${cost:.4f}"
+            if transcripts > 1:
+                message += f" (${cost / transcripts:.4f} per transcript)"
+        log(message)
+
+
+class SummaryRouter:
+    def __init__(self, routes: list[SummaryRoute]) -> None:
+        if not routes:
+            raise ValueError("routes must be non-empty")
+        self._routes = routes
+
+    @property
+    def routes(self) -> list[SummaryRoute]:
+        return list(self._routes)
+
+    @property
+    def models(self) -> list[str]:
+        return list(dict.fromkeys(route.model for route in self._routes))
+
+    @property
+    def requests_used(self) -> int:
+        return sum(route.usage_state.requests_used for route in self._routes)
+
+    @property
+    def daily_cap(self) -> int:
+        return sum(route.usage_state.daily_cap for route in self._routes)
+
+    async def close_async_clients(self) -> None:
+        for route in self._routes:
+            await route.close_async_client()
+
+    def requests_remaining(self) -> int:
+        return sum(route.headroom() for route in self._routes)
+
+    def has_available_route(self, estimated_tokens: int = 0) -> bool:
+        return any(route.usage_state.can_send_request(estimated_tokens)[0] for route in self._routes)
+
+    def reserve(self, estimated_tokens: int = 0) -> tuple[SummaryRoute | None, str]:
+        # most headroom first spreads the day's requests evenly; a reservation can still lose
+        # a race with another process, so fall through to the next candidate
+        reasons: list[str] = []
+        ready: list[SummaryRoute] = []
+        for route in self._routes:
+            allowed, reason = route.usage_state.can_send_request(estimated_tokens)
+            if allowed:
+                ready.append(route)
+            else:
+                reasons.append(f"{route.name}: {reason}")
+        for route in sorted(ready, key=lambda candidate: candidate.headroom(), reverse=True):
+            allowed, reason = route.usage_state.reserve_daily_request(estimated_tokens)
+            if allowed:
+                return route, ""
+            reasons.append(f"{route.name}: {reason}")
+        return None, "; ".join(reasons)
+
+    def remaining_cooldown_seconds(self) -> int:
+        # how long until some key can send again; 0 when one can now, or when every key
+        # left is out of daily requests or tokens (waiting would not help)
+        cooldowns: list[int] = []
+        for route in self._routes:
+            usage_state = route.usage_state
+            if usage_state.is_exhausted():
+                continue
+            cooldown = usage_state.remaining_cooldown_seconds()
+            if cooldown <= 0:
+                return 0
+            cooldowns.append(cooldown)
+        return min(cooldowns, default=0)
+
+    def token_wait_seconds(self, estimated_tokens: int) -> int:
+        # how long until a key's tokens-per-minute window has room for this request; 0 when no
+        # key is held back by that window alone
+        waits: list[int] = []
+        for route in self._routes:
+            usage_state = route.usage_state
+            if usage_state.is_exhausted() or usage_state.remaining_cooldown_seconds() > 0:
+                continue
+            daily_token_cap = usage_state.daily_token_cap
+            if daily_token_cap > 0 and usage_state.tokens_used + estimated_tokens > daily_token_cap:
+                continue
+            waits.append(usage_state.token_wait_seconds(estimated_tokens))
+        return min(waits, default=0)
+
+    def log_usage(self) -> None:
+        for route in self._routes:
+            usage_state = route.usage_state
+            message = f"{route.name} usage today: {usage_state.requests_used}/{usage_state.daily_cap}"
+            tokens = f"{usage_state.tokens_used}"
+            if usage_state.daily_token_cap > 0:
+                tokens += f"/{usage_state.daily_token_cap}"
+            message += f" requests, {tokens} tokens"
+            cooldown = usage_state.remaining_cooldown_seconds()
+            if cooldown > 0:
+                message += f" (cooldown {cooldown}s)"
+            log(message)
+
+    def log_run_usage(self) -> None:
+        requests = sum(route.run_usage.requests for route in self._routes)
+        if not requests:
+            return
+        transcripts = sum(route.run_usage.transcripts for route in self._routes)
+        prompt_tokens = sum(route.run_usage.prompt_tokens for route in self._routes)
+        completion_tokens = sum(route.run_usage.completion_tokens for route in self._routes)
+        message = (
+            f"run usage: {requests} requests, {prompt_tokens} prompt + {completion_tokens} completion tokens "
+            f"for {transcripts} transcripts"
+        )
+        if transcripts:
+            message += f" (~{(prompt_tokens + completion_tokens) // transcripts} tokens per transcript"
+            if any(route.token_budget.priced for route in self._routes):
+                cost = sum(route.run_usage.cost for route in self._routes)
+                message += f", ${cost:.4f} total, ${cost / transcripts:.4f} per transcript"
+            message += ")"
+        unreported = sum(route.run_usage.unreported for route in self._routes)
+        if unreported:
+            message += f"; {unreported} requests reported no usage"
+        log(message)
+
+
+def load_summary_router(quota: QuotaConfig) -> SummaryRouter:
+    return SummaryRouter([SummaryRoute(key) for key in load_provider_keys(quota)])
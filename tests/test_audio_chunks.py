@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import numpy as np
+
+from audio_chunks import SAMPLE_RATE, split_on_silence
+
+
+def syllables(seconds: float, seed: int) -> np.ndarray:
+    # noise bursts of 0.2 s with 0.1 s dips between them: quiet moments inside words, no pauses
+    rng = np.random.default_rng(seed)
+    samples = int(seconds * SAMPLE_RATE)
+    envelope = np.where(np.arange(samples) % int(0.3 * SAMPLE_RATE) < 0.2 * SAMPLE_RATE, 1.0, 0.15)
+    return (rng.standard_normal(samples) * envelope * 0.1).astype(np.float32)
+
+
+def pause(seconds: float) -> np.ndarray:
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.float32)
+
+
+def test_cut_lands_in_a_pause_found_by_widening_the_search():
+    # 60 s windows search 30-60 s first; the only pause is at 24 s
+    audio = np.concatenate([syllables(24.0, 0), pause(0.5), syllables(60.0, 1)])
+    (start, end), *_ = split_on_silence(audio, 60.0)
+    assert start == 0
+    assert 24.0 * SAMPLE_RATE <= end <= 24.5 * SAMPLE_RATE
+
+
+def test_last_pause_in_the_window_wins():
+    audio = np.concatenate([syllables(35.0, 0), pause(0.4), syllables(15.0, 1), pause(0.4), syllables(30.0, 2)])
+    ranges = split_on_silence(audio, 60.0)
+    assert 50.4 * SAMPLE_RATE <= ranges[0][1] <= 50.8 * SAMPLE_RATE
+    assert ranges[-1][1] == len(audio)
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+
+
+def test_audio_without_pauses_still_splits_within_the_limit():
+    audio = syllables(200.0, 0)
+    ranges = split_on_silence(audio, 60.0)
+    assert all(0 < end - start <= 60 * SAMPLE_RATE for start, end in ranges)
+    assert ranges[-1][1] == len(audio)
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import numpy as np
+
+from audio_chunks import SAMPLE_RATE
+from audio_fingerprint import FingerprintIndex, fingerprint_audio
+
+SECONDS = 30
+
+
+def speech_like(seed: int) -> np.ndarray:
+    # pink-ish noise (the spectral tilt of speech) under a random syllable-rate envelope:
+    # every recording has the same long-term spectrum, only the content differs
+    rng = np.random.default_rng(seed)
+    samples = SECONDS * SAMPLE_RATE
+    spectrum = np.fft.rfft(rng.standard_normal(samples))
+    spectrum /= np.maximum(np.fft.rfftfreq(samples, 1.0 / SAMPLE_RATE), 100.0) ** 0.5
+    audio = np.fft.irfft(spectrum, samples)
+    gates = np.repeat(rng.random(samples // 800 + 1) > 0.3, 800)[:samples]
+    syllables = np.abs(np.sin(np.arange(samples) / SAMPLE_RATE * 2 * np.pi * rng.uniform(3.0, 5.0)))
+    audio *= np.convolve(gates * syllables, np.ones(400) / 400, "same")
+    return (audio / np.abs(audio).max() * 0.5).astype(np.float32)
+
+
+def test_different_recordings_with_similar_spectra_are_not_merged(tmp_path):
+    index = FingerprintIndex(tmp_path / "fingerprints.sqlite3")
+    recordings = [speech_like(seed) for seed in range(6)]
+    for number, audio in enumerate(recordings):
+        fingerprint = fingerprint_audio(audio)
+        assert index.find_duplicates(fingerprint) == []
+        index.add(fingerprint, f"talk-{number}.txt", f"talk-{number}.wav")
+    index.close()
+
+
+def test_reencoded_copy_is_a_duplicate(tmp_path):
+    index = FingerprintIndex(tmp_path / "fingerprints.sqlite3")
+    original = speech_like(0)
+    index.add(fingerprint_audio(original), "talk.txt", "talk.wav")
+    index.add(fingerprint_audio(speech_like(1)), "other.txt", "other.wav")
+
+    assert index.find_duplicates(fingerprint_audio(original)) == ["talk.txt"]
+    # quieter, noisier and 44 ms late, as a re-encoded upload of the same audio would be
+    rng = np.random.default_rng(7)
+    copy = np.concatenate([np.zeros(700, dtype=np.float32), original * 0.6])[: len(original)]
+    copy += rng.standard_normal(len(copy)).astype(np.float32) * 0.005
+    assert index.find_duplicates(fingerprint_audio(copy)) == ["talk.txt"]
+    index.close()
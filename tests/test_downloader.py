@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from downloader import DownloadConfig, Downloader, VideoArchive
+from jobs import JobStore
+
+
+class FakeExtractor:
+    # urls map to archive ids without a network; download() writes a file or raises
+    def __init__(self, output_dir: Path, ids: dict[str, str], failures: int = 0) -> None:
+        self._output_dir = output_dir
+        self._ids = ids
+        self._failures = failures
+        self.downloads: list[str] = []
+        self.called = threading.Event()
+
+    def archive_id(self, url: str) -> str | None:
+        return self._ids.get(url)
+
+    def download(self, url: str, archive: VideoArchive) -> list[Path]:
+        self.downloads.append(url)
+        self.called.set()
+        if len(self.downloads) <= self._failures:
+            raise RuntimeError("ERROR: HTTP Error 503: Service Unavailable")
+        path = self._output_dir / f"{self._ids[url].split()[-1]}.m4a"
+        path.write_bytes(b"audio")
+        archive.add(self._ids[url])
+        return [path]
+
+    def resolve_stream(self, url: str, archive: VideoArchive) -> None:
+        return None
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    yield store
+    store.close()
+
+
+def make_downloader(store, extractor, audio: list[Path], stop=None, **config) -> Downloader:
+    defaults = {"parallel": 2, "retries": 2, "backoff_seconds": 0.01, "max_backoff_seconds": 0.05, "skip_known": True}
+    return Downloader(DownloadConfig(**{**defaults, **config}), audio.append, extractor, store, stop)
+
+
+def test_known_video_is_skipped_without_downloading(tmp_path, store):
+    store.record_video("youtube known", "https://youtu.be/known")
+    extractor = FakeExtractor(tmp_path, {"https://www.youtube.com/watch?v=known": "youtube known"})
+    audio: list[Path] = []
+
+    done = make_downloader(store, extractor, audio).download_all(["https://www.youtube.com/watch?v=known"])
+
+    assert done == {"https://www.youtube.com/watch?v=known"}
+    assert extractor.downloads == []
+    assert audio == []
+
+
+def test_same_video_twice_in_a_batch_is_downloaded_once(tmp_path, store):
+    urls = ["https://www.youtube.com/watch?v=abc", "https://youtu.be/abc"]
+    extractor = FakeExtractor(tmp_path, dict.fromkeys(urls, "youtube abc"))
+    audio: list[Path] = []
+
+    done = make_downloader(store, extractor, audio).download_all(urls)
+
+    assert done == set(urls)
+    assert extractor.downloads == urls[:1]
+    assert audio == [tmp_path / "abc.m4a"]
+    assert store.has_video("youtube abc")
+
+
+def test_failures_are_retried_with_backoff_then_recorded(tmp_path, store):
+    url = "https://youtu.be/flaky"
+    audio: list[Path] = []
+
+    extractor = FakeExtractor(tmp_path, {url: "youtube flaky"}, failures=2)
+    assert make_downloader(store, extractor, audio).download_all([url]) == {url}
+    assert extractor.downloads == [url] * 3
+    assert audio == [tmp_path / "flaky.m4a"]
+
+    url = "https://youtu.be/gone"
+    extractor = FakeExtractor(tmp_path, {url: "youtube gone"}, failures=10)
+    assert make_downloader(store, extractor, audio).download_all([url]) == set()
+    assert extractor.downloads == [url] * 3
+    assert store.recent_errors()[0] == (url, "queued", 3, "download: ERROR: HTTP Error 503: Service Unavailable")
+
+
+def test_stop_interrupts_the_backoff_wait(tmp_path, store):
+    url = "https://youtu.be/slow"
+    extractor = FakeExtractor(tmp_path, {url: "youtube slow"}, failures=10)
+    stop = threading.Event()
+    downloader = make_downloader(store, extractor, [], stop, backoff_seconds=60.0, max_backoff_seconds=60.0)
+
+    started = time.monotonic()
+    downloader.start([url])
+    assert extractor.called.wait(5)
+    stop.set()
+    assert downloader.wait() == set()
+    assert time.monotonic() - started < 5
+    assert extractor.downloads == [url]
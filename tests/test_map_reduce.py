@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from bench.fake_llm_server import FakeLLMServer, FakeServerConfig
+
+CHUNK_TOKENS = 300
+
+
+@pytest.fixture
+def server():
+    with FakeLLMServer(FakeServerConfig(latency_seconds=0.0)) as server:
+        yield server
+
+
+def test_outlines_too_long_for_one_reduce_are_merged_in_stages(server, tmp_path, monkeypatch):
+    import summarize
+    from summarize_helpers import (
+        estimate_tokens,
+        load_batch_budget,
+        load_map_reduce_config,
+        load_quota_config,
+    )
+    from summary_router import load_summary_router
+
+    for name, value in {
+        "SUMMARY_PROVIDER": "openai",
+        "OPENAI_API_KEY": "test",
+        "OPENAI_BASE_URL": server.base_url,
+        "SUMMARY_NEAR_DUPLICATE_THRESHOLD": "0",
+        "SUMMARY_MAP_CHUNK_TOKENS": str(CHUNK_TOKENS),
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.chdir(tmp_path)
+    Path("transcriptions").mkdir()
+    Path("summaries").mkdir()
+    transcript_path = Path("transcriptions/lecture.txt")
+    # about 20 parts, each outlined in ~100 tokens: far more than one 300-token reduce can take
+    transcript_path.write_text(
+        " ".join(f"Sentence number {index} of the lecture covers one more idea." for index in range(400)),
+        encoding="utf-8",
+    )
+    reduced: list[list[str]] = []
+    build_reduce_prompt = summarize.build_reduce_prompt
+
+    def record_reduce(outlines: list[str], source_name: str) -> str:
+        reduced.append(outlines)
+        return build_reduce_prompt(outlines, source_name)
+
+    monkeypatch.setattr(summarize, "build_reduce_prompt", record_reduce)
+    quota = load_quota_config()
+    stopped = summarize.summarize_long_transcript(
+        transcript_path,
+        load_summary_router(quota),
+        quota,
+        load_batch_budget(),
+        load_map_reduce_config(),
+    )
+
+    assert not stopped
+    assert Path("summaries/lecture.md").is_file()
+    [outlines] = reduced
+    assert len(outlines) < 20
+    assert sum(estimate_tokens(outline) for outline in outlines) <= CHUNK_TOKENS
+    # one map request, then at least ten pairwise merges before the reduce
+    assert server.stats.completions > 11
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+from pcm_cache import load_cached_pcm, pcm_cache_path
+
+
+def test_least_recently_used_entry_is_evicted_over_the_cap(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TRANSCRIBE_PCM_CACHE_MAX_MB", "1")
+    decoded: list[str] = []
+
+    def decode(audio_path: Path) -> np.ndarray:
+        decoded.append(audio_path.name)
+        return np.zeros(100_000, dtype=np.float32)
+
+    # 400 KB each, so the third entry takes the cache over 1 MB
+    first, second, third = (Path(f"talk-{number}.mp3") for number in range(3))
+    for number, audio_path in enumerate((first, second, third)):
+        audio_path.write_bytes(bytes(number + 1))
+    load_cached_pcm(first, decode)
+    load_cached_pcm(second, decode)
+    os.utime(pcm_cache_path(first), (1000, 1000))
+    os.utime(pcm_cache_path(second), (2000, 2000))
+    # a hit makes the first entry the most recently used
+    load_cached_pcm(first, decode)
+    load_cached_pcm(third, decode)
+
+    assert pcm_cache_path(first).exists()
+    assert not pcm_cache_path(second).exists()
+    assert pcm_cache_path(third).exists()
+    assert decoded == ["talk-0.mp3", "talk-1.mp3", "talk-2.mp3"]
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import time
+from pathlib import Path
+
+import pytest
+
+from bench.corpus import make_transcripts
+from bench.fake_llm_server import FakeLLMServer, FakeServerConfig
+
+TRANSCRIPTS = 8
+LATENCY_SECONDS = 0.2
+
+
+@pytest.fixture
+def server():
+    with FakeLLMServer(FakeServerConfig(latency_seconds=LATENCY_SECONDS)) as server:
+        yield server
+
+
+def summarize_all(server: FakeLLMServer, directory: Path, monkeypatch, max_in_flight: int) -> float:
+    import summarize
+    from summarize_helpers import (
+        load_batch_budget,
+        load_concurrency_config,
+        load_quota_config,
+    )
+    from summary_router import load_summary_router
+
+    # one transcript per request, so the serial path pays the latency once per transcript
+    for name, value in {
+        "SUMMARY_PROVIDER": "openai",
+        "OPENAI_API_KEY": "test",
+        "OPENAI_BASE_URL": server.base_url,
+        "SUMMARY_CACHE_MAX_MB": "0",
+        "SUMMARY_NEAR_DUPLICATE_THRESHOLD": "0",
+        "GEMINI_DAILY_REQUEST_CAP": "1000",
+        "GEMINI_SUMMARY_BATCH_SIZE": "1",
+        "SUMMARY_MAX_IN_FLIGHT": str(max_in_flight),
+    }.items():
+        monkeypatch.setenv(name, value)
+    directory.mkdir()
+    monkeypatch.chdir(directory)
+    pending = make_transcripts(Path("transcriptions"), TRANSCRIPTS, 200, 400)
+    Path("summaries").mkdir()
+    quota = load_quota_config()
+    router = load_summary_router(quota)
+    server.reset_stats()
+    started = time.perf_counter()
+    stopped = summarize.summarize_pending(pending, router, quota, load_batch_budget(), load_concurrency_config())
+    wall = time.perf_counter() - started
+    assert not stopped
+    assert len(list(Path("summaries").glob("*.md"))) == TRANSCRIPTS
+    return wall
+
+
+def test_async_summaries_overlap_requests(server, tmp_path, monkeypatch):
+    serial_wall = summarize_all(server, tmp_path / "serial", monkeypatch, max_in_flight=1)
+    assert server.stats.max_in_flight == 1
+
+    async_wall = summarize_all(server, tmp_path / "async", monkeypatch, max_in_flight=4)
+    assert server.stats.max_in_flight > 1
+    assert server.stats.completions == TRANSCRIPTS
+    # 8 requests of 0.2 s: about 1.6 s one at a time, about 0.4 s four at a time
+    assert async_wall < serial_wall / 2
+
+
+def test_async_summaries_run_twice_with_one_router(server, tmp_path, monkeypatch):
+    # the pipeline keeps one router for the whole run and starts an engine per round
+    from summarize_async import run_async_summaries
+    from summarize_helpers import load_batch_budget, load_concurrency_config, load_quota_config
+    from summary_router import load_summary_router
+
+    for name, value in {
+        "SUMMARY_PROVIDER": "openai",
+        "OPENAI_API_KEY": "test",
+        "OPENAI_BASE_URL": server.base_url,
+        "SUMMARY_CACHE_MAX_MB": "0",
+        "SUMMARY_NEAR_DUPLICATE_THRESHOLD": "0",
+        "SUMMARY_MAX_IN_FLIGHT": "2",
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.chdir(tmp_path)
+    first, second = make_transcripts(Path("transcriptions"), 2, 200, 400)
+    Path("summaries").mkdir()
+    quota = load_quota_config()
+    router = load_summary_router(quota)
+    for path in (first, second):
+        stopped = run_async_summaries(
+            router, quota, load_batch_budget(), load_concurrency_config(), [[path]], batched=False
+        )
+        assert not stopped
+    assert len(list(Path("summaries").glob("*.md"))) == 2
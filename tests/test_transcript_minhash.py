@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import random
+from pathlib import Path
+
+VOCABULARY = [f"word{number}" for number in range(400)]
+
+
+def sentences(seed: int, count: int) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(VOCABULARY, k=rng.randint(8, 15))) + "." for _ in range(count)]
+
+
+def write_transcript(stem: str, lines: list[str]) -> Path:
+    path = Path("transcriptions") / f"{stem}.txt"
+    path.write_text(" ".join(lines), encoding="utf-8")
+    return path
+
+
+def test_recut_reuses_the_summary_but_a_related_talk_does_not(tmp_path, monkeypatch):
+    import summarize
+    from transcript_minhash import get_transcript_index
+
+    monkeypatch.delenv("SUMMARY_NEAR_DUPLICATE_THRESHOLD", raising=False)
+    monkeypatch.chdir(tmp_path)
+    Path("transcriptions").mkdir()
+    Path("summaries").mkdir()
+    talk = sentences(1, 150)
+    write_transcript("talk", talk)
+    Path("summaries/talk.md").write_text("# Summary: talk\n\nThe talk.\n", encoding="utf-8")
+    assert get_transcript_index() is not None
+
+    # the same talk with its intro trimmed and a few words heard differently
+    recut = talk[3:]
+    for line in (10, 50, 90, 130):
+        recut[line] = "misheard " + recut[line].split(" ", 1)[1]
+    recut_path = write_transcript("talk-recut", recut)
+    assert summarize.write_near_duplicate_summary(recut_path)
+    assert summarize.read_summary_body(Path("summaries/talk-recut.md")) == "The talk."
+
+    # the next part of a series: same speaker, same intro, four fifths of the lines reused
+    related_path = write_transcript("talk-part-2", talk[:120] + sentences(2, 30))
+    assert not summarize.write_near_duplicate_summary(related_path)
+    assert not Path("summaries/talk-part-2.md").exists()
@@ -0,0 +1,18 @@
+from __future__ import annotations
+
+from summarize_helpers import NormalizeConfig
+from transcript_normalize import normalize_transcript
+
+CONFIG = NormalizeConfig(filler_words=frozenset({"um", "uh", "er", "ah"}), max_ngram=8)
+
+
+def test_filler_words_are_dropped_from_english_and_undetected_transcripts():
+    for language in ("en", None):
+        assert normalize_transcript("So, um, it works, uh.", CONFIG, language).text == "So, it works."
+
+
+def test_filler_words_are_kept_in_other_languages():
+    # German "er" is "he"
+    text = "Er sagt, er kommt morgen."
+    assert normalize_transcript(text, CONFIG, "de").text == text
+    assert normalize_transcript("Er sagt ja ja ja ja, er kommt.", CONFIG, "de").text == "Er sagt ja, er kommt."
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import summarize_helpers
+from summarize_helpers import UsageState
+
+
+def test_real_usage_replaces_the_reservation_in_the_minute_window(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(summarize_helpers.time, "time", lambda: now[0])
+    usage = UsageState(tmp_path / "usage.json", daily_cap=100, tokens_per_minute=10000)
+
+    assert usage.reserve_daily_request(10000)[0]
+    now[0] += 1
+    usage.record_token_usage(10000, 1500, 500)
+    # the 2000 tokens really used stay in the window until the request is a minute old
+    now[0] += 30
+    assert usage.reserve_daily_request(8000)[0]
+    assert not usage.reserve_daily_request(1)[0]
+
+    # once it has aged out, only the 8000 reserved since then is still counted
+    now[0] += 29.5
+    assert usage.reserve_daily_request(2000)[0]
+    assert not usage.reserve_daily_request(1)[0]
+
+
+def test_expired_reservation_is_not_corrected_twice(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(summarize_helpers.time, "time", lambda: now[0])
+    usage = UsageState(tmp_path / "usage.json", daily_cap=100, tokens_per_minute=10000)
+
+    assert usage.reserve_daily_request(10000)[0]
+    now[0] += 1
+    usage.record_token_usage(10000, 1500, 500)
+    now[0] += 59.5
+    assert usage.reserve_daily_request(10000)[0]
+    assert not usage.reserve_daily_request(8000)[0]
+
+
+def test_refund_drops_the_reservation(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(summarize_helpers.time, "time", lambda: now[0])
+    usage = UsageState(tmp_path / "usage.json", daily_cap=100, tokens_per_minute=10000)
+
+    assert usage.reserve_daily_request(6000)[0]
+    assert not usage.reserve_daily_request(6000)[0]
+    usage.release_daily_request(6000)
+    assert usage.reserve_daily_request(6000)[0]
+    assert usage.requests_used == 1
@@ -1,22 +1,64 @@
+from __future__ import annotations
+
+import argparse
+import fcntl
+import json
+import multiprocessing
+import os
 import shutil
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from itertools import repeat
 from pathlib import Path
+from typing import Callable
 
-import whisper
-
-
-def _human_timestamp() -> str:
-    return datetime.now().astimezone().strftime("%Y-%m-%d %H:%M:%S %z")
-
+import numpy as np
 
-def log(*args: object, **kwargs: object) -> None:
-    print(f"[{_human_timestamp()}]", *args, **kwargs)
-
-
-AUDIO_DIR = Path("audios")
-FINISHED_DIR = Path("finished")
-TRANSCRIPTIONS_DIR = Path("transcriptions")
-AUDIO_SUFFIXES = (".mp3", ".wav", ".m4a", ".flac", ".ogg")
+import metrics
+from audio_chunks import SAMPLE_RATE, join_chunk_texts, split_on_silence, target_chunk_seconds
+from audio_fingerprint import AudioFingerprint, FingerprintIndex, fingerprint_audio
+from jobs import get_job_store
+from pcm_cache import discard_cached_pcm, open_pcm, prune_pcm_cache
+from transcribe_backends import (
+    LANGUAGE_DETECTION_SAMPLES,
+    WINDOW_SECONDS,
+    decode_audio,
+    decodes_lazily,
+    detect_route,
+    load_backend,
+)
+from transcript_checkpoint import TranscriptCheckpoint, open_checkpoint
+from transcribe_helpers import (
+    ARCHIVE_TRANSCRIPTIONS_DIR,
+    AUDIO_DIR,
+    FINGERPRINT_INDEX_PATH,
+    FINISHED_DIR,
+    PCM_CACHE_MAX_AGE_SECONDS,
+    TRANSCRIPTIONS_DIR,
+    BackendConfig,
+    LanguageDetection,
+    TranscriptionOutcome,
+    TranscriptSegment,
+    get_batch_files,
+    get_batch_max_file_seconds,
+    get_batch_size,
+    get_chunk_seconds,
+    get_dedupe_enabled,
+    get_threads_per_worker,
+    get_transcribe_workers,
+    get_watch_poll_seconds,
+    is_audio_file,
+    language_sidecar_path,
+    load_backend_config,
+    load_serial_realtime_factor,
+    log,
+    partial_transcript_path,
+    realtime_factor,
+    save_serial_realtime_factor,
+)
 
 
 def ensure_output_dirs() -> None:
@@ -28,11 +70,7 @@ def iter_audio_files() -> list[Path]:
     if not AUDIO_DIR.is_dir():
         return []
     return sorted(
-        (
-            path
-            for path in AUDIO_DIR.iterdir()
-            if path.is_file() and path.suffix.lower() in AUDIO_SUFFIXES
-        ),
+        (path for path in AUDIO_DIR.iterdir() if path.is_file() and is_audio_file(path)),
         key=lambda path: path.name.lower(),
     )
 
@@ -41,33 +79,829 @@ def transcript_output_path(audio_path: Path) -> Path:
     return TRANSCRIPTIONS_DIR / f"{audio_path.stem}.txt"
 
 
+def transcript_lock_path(audio_path: Path) -> Path:
+    return TRANSCRIPTIONS_DIR / f".{audio_path.stem}.lock"
+
+
 def move_to_finished(audio_path: Path) -> None:
+    discard_cached_pcm(audio_path)
     destination = FINISHED_DIR / audio_path.name
-    shutil.move(str(audio_path), str(destination))
+    try:
+        shutil.move(str(audio_path), str(destination))
+    except FileNotFoundError:
+        if not destination.exists():
+            raise
+
+
+def write_transcript(transcript_path: Path, text: str) -> None:
+    tmp_path = transcript_path.with_name(f".{transcript_path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("w", encoding="utf-8") as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, transcript_path)
+
+
+def discard_partial_transcript(transcript_path: Path) -> None:
+    partial_transcript_path(transcript_path).unlink(missing_ok=True)
+
+
+# lock file -> the descriptor holding its flock, for the files this process has claimed
+_held_locks: dict[Path, int] = {}
+
+
+def claim_audio_file(audio_path: Path) -> bool:
+    # the flock goes away with its holder, so a crashed worker's lock file is simply locked again;
+    # release unlinks the file, so a lock taken on an inode no longer at the path is retried
+    lock_path = transcript_lock_path(audio_path)
+    while True:
+        fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        try:
+            current = os.stat(lock_path)
+        except FileNotFoundError:
+            current = None
+        locked = os.fstat(fd)
+        if current is not None and (current.st_dev, current.st_ino) == (locked.st_dev, locked.st_ino):
+            break
+        os.close(fd)
+    # the pid is only for people looking at the directory; the flock is the claim
+    os.ftruncate(fd, 0)
+    os.write(fd, str(os.getpid()).encode())
+    _held_locks[lock_path] = fd
+    return True
+
+
+def release_audio_file(audio_path: Path) -> None:
+    lock_path = transcript_lock_path(audio_path)
+    fd = _held_locks.pop(lock_path, None)
+    if fd is None:
+        return
+    # unlink while still holding the flock, so nobody locks the old inode after we let go of it
+    lock_path.unlink(missing_ok=True)
+    os.close(fd)
+
+
+def transcribe_whole(
+    audio_path: Path,
+    backend,
+    audio=None,
+    checkpoint: TranscriptCheckpoint | None = None,
+) -> tuple[str, float, LanguageDetection | None]:
+    if audio is None:
+        audio = decode_audio(audio_path)
+    detection = detect_route(backend, audio)
+    if checkpoint is None:
+        return backend.transcribe(audio, detection), len(audio) / SAMPLE_RATE, detection
+
+    offset = checkpoint.resume_sample
+    if decodes_lazily(backend, detection):
+        # one pass over the rest of the file, so the decoder keeps its context from window to
+        # window; each segment is checkpointed as soon as it is decoded
+        resume_seconds = offset / SAMPLE_RATE
+        for segment in backend.transcribe_segments(audio[offset:], detection, checkpoint.prompt()):
+            checkpoint.append(
+                TranscriptSegment(resume_seconds + segment.start, resume_seconds + segment.end, segment.text)
+            )
+        checkpoint.complete_through(len(audio) / SAMPLE_RATE)
+        return checkpoint.text(), (len(audio) - offset) / SAMPLE_RATE, detection
+
+    # openai-whisper hands segments back only once its input is decoded: go window by window,
+    # cut at pauses and prompted with the text so far. A window's last segment can still stop
+    # mid-word at the cut, so it is decoded again at the start of the next window
+    window_samples = int(checkpoint.window_seconds * SAMPLE_RATE)
+    start = offset
+    while start < len(audio):
+        _, end = split_on_silence(audio[start : start + 2 * window_samples], checkpoint.window_seconds)[0]
+        end += start
+        window_start = start / SAMPLE_RATE
+        segments = list(backend.transcribe_segments(audio[start:end], detection, checkpoint.prompt()))
+        resume = end
+        if end < len(audio) and len(segments) > 1 and segments[-1].start * 2 > (end - start) / SAMPLE_RATE:
+            resume = start + round(segments[-1].start * SAMPLE_RATE)
+            segments.pop()
+        for segment in segments:
+            checkpoint.append(
+                TranscriptSegment(window_start + segment.start, window_start + segment.end, segment.text)
+            )
+        checkpoint.complete_through(resume / SAMPLE_RATE)
+        start = resume
+    return checkpoint.text(), (len(audio) - offset) / SAMPLE_RATE, detection
+
+
+def transcribe_chunked(
+    audio_path: Path,
+    audio=None,
+    *,
+    backend,
+    pool: ProcessPoolExecutor | None,
+    chunk_seconds: float,
+    workers: int,
+    detect_language: bool = False,
+    checkpoint: TranscriptCheckpoint | None = None,
+) -> tuple[str, float, LanguageDetection | None]:
+    if audio is None:
+        audio = decode_audio(audio_path)
+    offset = checkpoint.resume_sample if checkpoint is not None else 0
+    duration = (len(audio) - offset) / SAMPLE_RATE
+    # one detection per file: every chunk goes to the same model in the same language
+    if pool is None:
+        detection = detect_route(backend, audio)
+    elif detect_language:
+        detection = pool.submit(_detect_route_in_worker, np.array(audio[:LANGUAGE_DETECTION_SAMPLES])).result()
+    else:
+        detection = None
+    ranges = [
+        (offset + start, offset + end)
+        for start, end in split_on_silence(audio[offset:], target_chunk_seconds(duration, chunk_seconds, workers))
+    ]
+    log(f"{audio_path.name}: {duration:.0f}s split into {len(ranges)} chunks")
+    if pool is None:
+        texts = (backend.transcribe(audio[start:end], detection) for start, end in ranges)
+    elif isinstance(audio, np.memmap) and audio.filename:
+        # workers map the cached PCM themselves instead of receiving a pickled copy of each chunk
+        texts = pool.map(
+            _transcribe_cached_range_in_worker,
+            repeat(audio.filename),
+            ranges,
+            repeat(detection),
+        )
+    else:
+        texts = pool.map(
+            _transcribe_chunk_in_worker,
+            [audio[start:end] for start, end in ranges],
+            repeat(detection),
+        )
+    if checkpoint is None:
+        return join_chunk_texts(list(texts)), duration, detection
+
+    # one checkpoint entry per chunk: results arrive in order, each as soon as it and every
+    # earlier chunk are done
+    for (start, end), text in zip(ranges, texts):
+        checkpoint.append(TranscriptSegment(start / SAMPLE_RATE, end / SAMPLE_RATE, text))
+    return checkpoint.text(), duration, detection
 
 
-def transcribe_file(audio_path: Path, model) -> None:
+def write_language_sidecar(transcript_path: Path, detection: LanguageDetection) -> None:
+    sidecar_path = language_sidecar_path(transcript_path)
+    write_transcript(
+        sidecar_path,
+        json.dumps(
+            {
+                "language": detection.language,
+                "probability": round(detection.probability, 4),
+                "model": detection.model,
+            },
+            ensure_ascii=True,
+        )
+        + "\n",
+    )
+
+
+def find_transcript(transcript_name: str) -> Path | None:
+    for directory in (TRANSCRIPTIONS_DIR, ARCHIVE_TRANSCRIPTIONS_DIR):
+        candidate = directory / transcript_name
+        if candidate.is_file() and candidate.stat().st_size > 0:
+            return candidate
+    return None
+
+
+def reuse_duplicate_transcript(
+    audio_path: Path,
+    transcript_path: Path,
+    fingerprint: AudioFingerprint,
+    fingerprints: FingerprintIndex,
+) -> bool:
+    for transcript_name in fingerprints.find_duplicates(fingerprint):
+        source = find_transcript(transcript_name)
+        if source is None or source.resolve() == transcript_path.resolve():
+            continue
+        log(f"skipping {audio_path.name} (duplicate audio of {source.name}; copying transcript)")
+        write_transcript(transcript_path, source.read_text(encoding="utf-8"))
+        source_sidecar = language_sidecar_path(source)
+        if source_sidecar.is_file():
+            write_transcript(language_sidecar_path(transcript_path), source_sidecar.read_text(encoding="utf-8"))
+        fingerprints.add(fingerprint, transcript_path.name, audio_path.name)
+        return True
+    return False
+
+
+@dataclass(frozen=True)
+class DecodedAudio:
+    audio: np.ndarray
+    decode_seconds: float
+    fingerprint: AudioFingerprint | None
+
+
+def retire_audio(audio_path: Path, transcript_path: Path, seconds: float | None = None) -> None:
+    # the transcript is in place: the checkpoint goes, the audio moves on, the job is done
+    discard_partial_transcript(transcript_path)
+    move_to_finished(audio_path)
+    get_job_store().record_transcribed(audio_path.stem, seconds)
+
+
+def decode_pending_audio(
+    audio_path: Path,
+    transcript_path: Path,
+    fingerprints: FingerprintIndex | None,
+) -> DecodedAudio | None:
+    # None: nothing left for the model (transcript exists, or copied from a duplicate)
+    if transcript_path.exists() and transcript_path.stat().st_size > 0:
+        log(f"skipping {audio_path.name} (transcript exists)")
+        retire_audio(audio_path, transcript_path)
+        return None
+
+    # decode once: the same samples feed the fingerprint, the chunker and the model
+    decode_started = time.perf_counter()
+    audio = decode_audio(audio_path)
+    decode_seconds = time.perf_counter() - decode_started
+    fingerprint = None
+    if fingerprints is not None:
+        fingerprint = fingerprint_audio(audio)
+        if reuse_duplicate_transcript(audio_path, transcript_path, fingerprint, fingerprints):
+            retire_audio(audio_path, transcript_path)
+            return None
+    return DecodedAudio(audio, decode_seconds, fingerprint)
+
+
+def finish_transcript(
+    audio_path: Path,
+    transcript_path: Path,
+    decoded: DecodedAudio,
+    text: str,
+    audio_seconds: float,
+    detection: LanguageDetection | None,
+    transcribe_seconds: float,
+    elapsed_seconds: float,
+    fingerprints: FingerprintIndex | None,
+    **metric_fields: object,
+) -> TranscriptionOutcome:
+    language_fields = {}
+    if detection is not None:
+        log(f"{audio_path.name}: language {detection.language} ({detection.probability:.0%}), model {detection.model}")
+        language_fields = {"language": detection.language, "model": detection.model}
+    metrics.record(
+        "transcribe_file",
+        file=audio_path.name,
+        audio_seconds=audio_seconds,
+        decode_seconds=decoded.decode_seconds,
+        transcribe_seconds=transcribe_seconds,
+        realtime_factor=audio_seconds / transcribe_seconds if transcribe_seconds > 0 else 0.0,
+        **language_fields,
+        **metric_fields,
+    )
+    if detection is not None:
+        write_language_sidecar(transcript_path, detection)
+    # the .txt appears only once the whole file is done; the checkpoint goes after it
+    write_transcript(transcript_path, text)
+    if fingerprints is not None and decoded.fingerprint is not None:
+        fingerprints.add(decoded.fingerprint, transcript_path.name, audio_path.name)
+    retire_audio(audio_path, transcript_path, elapsed_seconds)
+    return TranscriptionOutcome(ok=True, audio_seconds=audio_seconds, elapsed_seconds=elapsed_seconds)
+
+
+def record_transcribe_failure(audio_path: Path, exc: Exception, elapsed_seconds: float) -> TranscriptionOutcome:
+    log(f"failed to process {audio_path.name}: {exc}")
+    get_job_store().record_failure(audio_path.stem, f"transcribe: {exc}")
+    return TranscriptionOutcome(ok=False, elapsed_seconds=elapsed_seconds)
+
+
+def transcribe_file(
+    audio_path: Path,
+    backend,
+    transcribe_fn: Callable[..., tuple[str, float, LanguageDetection | None]] | None = None,
+    fingerprints: FingerprintIndex | None = None,
+) -> TranscriptionOutcome:
     transcript_path = transcript_output_path(audio_path)
+    if not claim_audio_file(audio_path):
+        log(f"skipping {audio_path.name} (claimed by another worker)")
+        return TranscriptionOutcome(ok=True)
+    started = time.monotonic()
     try:
-        if transcript_path.exists() and transcript_path.stat().st_size > 0:
-            log(f"skipping {audio_path.name} (transcript exists)")
-            move_to_finished(audio_path)
-            return
+        if not audio_path.exists():
+            return TranscriptionOutcome(ok=True)
+        decoded = decode_pending_audio(audio_path, transcript_path, fingerprints)
+        if decoded is None:
+            return TranscriptionOutcome(ok=True)
+        audio = decoded.audio
 
-        log(f"transcribing {audio_path.name}...")
-        result = model.transcribe(str(audio_path))
-        transcript_path.write_text((result.get("text") or "").strip(), encoding="utf-8")
-        move_to_finished(audio_path)
+        checkpoint = open_checkpoint(transcript_path, audio_path.name, len(audio))
+        if checkpoint is not None and checkpoint.resume_sample > 0:
+            log(
+                f"resuming {audio_path.name} at {checkpoint.resume_sample / SAMPLE_RATE:.0f}s "
+                f"({len(checkpoint.segments)} segments checkpointed)"
+            )
+        else:
+            log(f"transcribing {audio_path.name}...")
+        transcribe_started = time.perf_counter()
+        if transcribe_fn is None:
+            text, audio_seconds, detection = transcribe_whole(audio_path, backend, audio, checkpoint)
+        else:
+            text, audio_seconds, detection = transcribe_fn(audio_path, audio, checkpoint=checkpoint)
+        transcribe_seconds = time.perf_counter() - transcribe_started
+        return finish_transcript(
+            audio_path,
+            transcript_path,
+            decoded,
+            text,
+            audio_seconds,
+            detection,
+            transcribe_seconds,
+            time.monotonic() - started,
+            fingerprints,
+        )
     except Exception as exc:
-        log(f"failed to process {audio_path.name}: {exc}")
+        return record_transcribe_failure(audio_path, exc, time.monotonic() - started)
+    finally:
+        release_audio_file(audio_path)
 
 
-def main() -> None:
-    ensure_output_dirs()
-    model = whisper.load_model("small")
+def transcribe_batch(
+    audio_paths: list[Path],
+    *,
+    detect: Callable[[np.ndarray], LanguageDetection | None],
+    transcribe_windows: Callable[[list[np.ndarray], LanguageDetection | None], list[str]],
+    process_one: Callable[[Path], TranscriptionOutcome],
+    batch_size: int,
+    max_file_seconds: float,
+    fingerprints: FingerprintIndex | None = None,
+) -> list[TranscriptionOutcome]:
+    # short files are cut into 30 s windows and the windows of all of them go to the model
+    # batch_size at a time; longer files take the regular path once the batch is done
+    outcomes: dict[Path, TranscriptionOutcome] = {}
+    claimed: list[Path] = []
+    long_files: list[Path] = []
+    batched: list[tuple[Path, DecodedAudio, float, LanguageDetection | None, list[tuple[int, int]]]] = []
+    try:
+        for audio_path in audio_paths:
+            if not claim_audio_file(audio_path):
+                log(f"skipping {audio_path.name} (claimed by another worker)")
+                outcomes[audio_path] = TranscriptionOutcome(ok=True)
+                continue
+            claimed.append(audio_path)
+            started = time.monotonic()
+            try:
+                if not audio_path.exists():
+                    outcomes[audio_path] = TranscriptionOutcome(ok=True)
+                    continue
+                decoded = decode_pending_audio(audio_path, transcript_output_path(audio_path), fingerprints)
+                if decoded is None:
+                    outcomes[audio_path] = TranscriptionOutcome(ok=True)
+                    continue
+                if len(decoded.audio) > max_file_seconds * SAMPLE_RATE:
+                    long_files.append(audio_path)
+                    continue
+                detection = detect(decoded.audio)
+                ranges = [
+                    (start, end)
+                    for start, end in split_on_silence(decoded.audio, WINDOW_SECONDS)
+                    if end > start
+                ]
+                batched.append((audio_path, decoded, time.monotonic() - started, detection, ranges))
+            except Exception as exc:
+                outcomes[audio_path] = record_transcribe_failure(audio_path, exc, time.monotonic() - started)
+
+        # one model call per batch_size windows of the same route (model and language)
+        groups: dict[tuple[str, str] | None, list[tuple[int, int]]] = {}
+        for file_index, (_, _, _, detection, ranges) in enumerate(batched):
+            key = None if detection is None else (detection.model, detection.language)
+            groups.setdefault(key, []).extend((file_index, window_index) for window_index in range(len(ranges)))
+        texts = [[""] * len(ranges) for *_, ranges in batched]
+        calls = 0
+        # a failed call fails only the files with windows in it; their later windows are dropped
+        failures: dict[int, Exception] = {}
+        transcribe_started = time.perf_counter()
+        if batched:
+            log(f"transcribing {len(batched)} files as one batch ({sum(map(len, texts))} windows)...")
+        for windows in groups.values():
+            for offset in range(0, len(windows), batch_size):
+                part = [
+                    (file_index, window_index)
+                    for file_index, window_index in windows[offset : offset + batch_size]
+                    if file_index not in failures
+                ]
+                if not part:
+                    continue
+                detection = batched[part[0][0]][3]
+                calls += 1
+                try:
+                    results = transcribe_windows(
+                        [
+                            batched[file_index][1].audio[slice(*batched[file_index][4][window_index])]
+                            for file_index, window_index in part
+                        ],
+                        detection,
+                    )
+                except Exception as exc:
+                    for file_index, _ in part:
+                        failures[file_index] = exc
+                    continue
+                for (file_index, window_index), text in zip(part, results):
+                    texts[file_index][window_index] = text
+        batch_seconds = time.perf_counter() - transcribe_started
+
+        # every file in the batch waited for the whole batch; each is charged its share of it
+        batch_audio_seconds = sum(len(decoded.audio) for _, decoded, *_ in batched) / SAMPLE_RATE
+        for file_index, ((audio_path, decoded, prepare_seconds, detection, ranges), file_texts) in enumerate(
+            zip(batched, texts)
+        ):
+            audio_seconds = len(decoded.audio) / SAMPLE_RATE
+            transcribe_seconds = batch_seconds * audio_seconds / batch_audio_seconds if batch_audio_seconds else 0.0
+            elapsed_seconds = prepare_seconds + transcribe_seconds
+            if file_index in failures:
+                outcomes[audio_path] = record_transcribe_failure(audio_path, failures[file_index], elapsed_seconds)
+                continue
+            try:
+                outcomes[audio_path] = finish_transcript(
+                    audio_path,
+                    transcript_output_path(audio_path),
+                    decoded,
+                    join_chunk_texts(file_texts),
+                    audio_seconds,
+                    detection,
+                    transcribe_seconds,
+                    elapsed_seconds,
+                    fingerprints,
+                    batch_files=len(batched),
+                    batch_calls=calls,
+                )
+            except Exception as exc:
+                outcomes[audio_path] = record_transcribe_failure(audio_path, exc, elapsed_seconds)
+    finally:
+        for audio_path in claimed:
+            release_audio_file(audio_path)
+    for audio_path in long_files:
+        outcomes[audio_path] = process_one(audio_path)
+    return [outcomes[audio_path] for audio_path in audio_paths]
+
+
+def open_fingerprint_index() -> FingerprintIndex | None:
+    if not get_dedupe_enabled():
+        return None
+    return FingerprintIndex(FINGERPRINT_INDEX_PATH)
+
+
+_worker_backend = None
+_worker_fingerprints: FingerprintIndex | None = None
+
+
+def _init_worker(config: BackendConfig, threads: int) -> None:
+    global _worker_backend, _worker_fingerprints
+    _worker_backend = load_backend(config, threads)
+    _worker_fingerprints = open_fingerprint_index()
+
+
+def _transcribe_in_worker(audio_path: Path) -> TranscriptionOutcome:
+    return transcribe_file(audio_path, _worker_backend, fingerprints=_worker_fingerprints)
+
+
+def _transcribe_chunk_in_worker(audio, detection: LanguageDetection | None = None) -> str:
+    return _worker_backend.transcribe(audio, detection)
+
+
+def _transcribe_cached_range_in_worker(
+    cache_path: str,
+    sample_range: tuple[int, int],
+    detection: LanguageDetection | None = None,
+) -> str:
+    start, end = sample_range
+    return _worker_backend.transcribe(open_pcm(Path(cache_path))[start:end], detection)
+
+
+def _transcribe_windows_in_worker(windows, detection: LanguageDetection | None = None) -> list[str]:
+    return _worker_backend.transcribe_batch(windows, detection)
+
+
+def _transcribe_in_pool(pool: ProcessPoolExecutor, audio_path: Path) -> TranscriptionOutcome:
+    return pool.submit(_transcribe_in_worker, audio_path).result()
+
+
+def _detect_route_in_worker(audio) -> LanguageDetection | None:
+    return detect_route(_worker_backend, audio)
+
+
+def create_worker_pool(config: BackendConfig, workers: int, threads: int) -> ProcessPoolExecutor:
+    log(f"starting {workers} transcription workers ({threads} threads each)")
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(config, threads),
+    )
+
+
+def report_throughput(outcomes: list[TranscriptionOutcome], wall_seconds: float, workers: int) -> None:
+    rtf = realtime_factor(outcomes, wall_seconds)
+    if rtf <= 0:
+        return
+    if workers <= 1:
+        save_serial_realtime_factor(rtf)
+        log(f"throughput: {rtf:.2f}x realtime")
+        return
+    serial_rtf = load_serial_realtime_factor()
+    busy_seconds = sum(outcome.elapsed_seconds for outcome in outcomes)
+    message = (
+        f"throughput: {rtf:.2f}x realtime with {workers} workers "
+        f"(worker utilisation {busy_seconds / (wall_seconds * workers):.0%})"
+    )
+    if serial_rtf > 0:
+        message += f"; speedup over serial: {rtf / serial_rtf:.2f}x"
+    else:
+        message += "; run once with TRANSCRIBE_WORKERS=1 to record a serial baseline"
+    log(message)
+
+
+def stable_audio_files(previous_sizes: dict[Path, int]) -> tuple[list[Path], dict[Path, int]]:
+    ready: list[Path] = []
+    sizes: dict[Path, int] = {}
     for audio_path in iter_audio_files():
-        transcribe_file(audio_path, model)
-    log("done.")
+        try:
+            size = audio_path.stat().st_size
+        except FileNotFoundError:
+            continue
+        sizes[audio_path] = size
+        if size > 0 and previous_sizes.get(audio_path) == size:
+            ready.append(audio_path)
+    return ready, sizes
+
+
+def watch(
+    process_one: Callable[[Path], TranscriptionOutcome],
+    poll_seconds: float,
+    idle_exit_seconds: float,
+    executor: Executor | None = None,
+    process_batch: Callable[[list[Path]], list[TranscriptionOutcome]] | None = None,
+    batch_files: int = 1,
+) -> None:
+    log(f"watching {AUDIO_DIR}/ for new audio (poll every {poll_seconds}s)")
+    sizes: dict[Path, int] = {}
+    failed: dict[Path, int] = {}
+    # a batch is one future shared by its files; the index picks each file's outcome
+    in_flight: dict[Path, tuple[Future, int, int | None]] = {}
+    idle_since = time.monotonic()
+    while True:
+        ready, sizes = stable_audio_files(sizes)
+        # failed files are retried only once they change on disk (e.g. re-downloaded)
+        ready = [
+            path
+            for path in ready
+            if path not in in_flight and failed.get(path) != sizes[path]
+        ]
+        finished: list[tuple[Path, int, TranscriptionOutcome]] = []
+        batches = (
+            [ready[start : start + batch_files] for start in range(0, len(ready), batch_files)]
+            if process_batch is not None
+            else []
+        )
+        if executor is None:
+            if process_batch is None:
+                for audio_path in ready:
+                    finished.append((audio_path, sizes[audio_path], process_one(audio_path)))
+            for batch in batches:
+                finished.extend(zip(batch, (sizes[path] for path in batch), process_batch(batch)))
+        else:
+            if process_batch is None:
+                for audio_path in ready:
+                    future = executor.submit(process_one, audio_path)
+                    in_flight[audio_path] = (future, sizes[audio_path], None)
+            for batch in batches:
+                future = executor.submit(process_batch, batch)
+                for index, audio_path in enumerate(batch):
+                    in_flight[audio_path] = (future, sizes[audio_path], index)
+            for audio_path, (future, size, index) in list(in_flight.items()):
+                if future.done():
+                    del in_flight[audio_path]
+                    outcome = future.result() if index is None else future.result()[index]
+                    finished.append((audio_path, size, outcome))
+        for audio_path, size, outcome in finished:
+            if outcome.ok:
+                failed.pop(audio_path, None)
+            else:
+                failed[audio_path] = size
+
+        failed = {path: size for path, size in failed.items() if path in sizes}
+        pending = [path for path in sizes if failed.get(path) != sizes[path]]
+        if ready or pending or in_flight:
+            idle_since = time.monotonic()
+        elif idle_exit_seconds > 0 and time.monotonic() - idle_since >= idle_exit_seconds:
+            log(f"no new audio for {idle_exit_seconds:g}s; exiting watch mode")
+            return
+        if executor is not None or not ready:
+            time.sleep(poll_seconds)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Transcribe audio files in audios/ with Whisper.")
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep the model loaded and transcribe new files as they land in audios/",
+    )
+    parser.add_argument(
+        "--idle-exit",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="in watch mode, exit after this many seconds without pending audio (0 = never)",
+    )
+    return parser.parse_args(argv)
+
+
+def _holding(lock: threading.Lock, fn: Callable[[Path], TranscriptionOutcome]) -> Callable[[Path], TranscriptionOutcome]:
+    def run(audio_path: Path) -> TranscriptionOutcome:
+        with lock:
+            return fn(audio_path)
+
+    return run
+
+
+@dataclass
+class TranscriptionRuntime:
+    process_one: Callable[[Path], TranscriptionOutcome]
+    executor: Executor | None
+    pool: ProcessPoolExecutor | None
+    fingerprints: FingerprintIndex | None
+    workers: int
+    # in-process model (serial runs only) and the lock every user of it holds
+    backend: object | None = None
+    backend_lock: threading.Lock | None = None
+    detect_language: bool = False
+    window_executor: ThreadPoolExecutor | None = None
+    # windows per model call; 1 keeps one transcribe() call per file
+    batch_size: int = 1
+    # files gathered and decoded together before their windows are split into calls
+    batch_files: int = 1
+    batch_max_file_seconds: float = 0.0
+
+    def _run_on_backend(self, fn: Callable, *args):
+        with self.backend_lock:
+            return fn(*args)
+
+    def detect(self, audio) -> LanguageDetection | None:
+        # without language routes there is nothing to detect, so no need to wait for the model
+        if not self.detect_language:
+            return None
+        if self.pool is None:
+            return self._run_on_backend(detect_route, self.backend, audio)
+        return self.pool.submit(_detect_route_in_worker, np.array(audio[:LANGUAGE_DETECTION_SAMPLES])).result()
+
+    def submit_window(self, audio, detection: LanguageDetection | None) -> Future:
+        # a slice of audio that is not a file (streamed input): pool workers take it like a
+        # chunk; a serial run queues it behind whatever holds the model
+        if self.pool is not None:
+            return self.pool.submit(_transcribe_chunk_in_worker, audio, detection)
+        if self.window_executor is None:
+            self.window_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcribe-window")
+        return self.window_executor.submit(self._run_on_backend, self.backend.transcribe, audio, detection)
+
+    def transcribe_windows(self, windows: list, detection: LanguageDetection | None) -> list[str]:
+        if self.pool is not None:
+            return self.pool.submit(_transcribe_windows_in_worker, windows, detection).result()
+        return self._run_on_backend(self.backend.transcribe_batch, windows, detection)
+
+    def process_batch(self, audio_paths: list[Path]) -> list[TranscriptionOutcome]:
+        # decoding runs outside the model lock; only the model calls take turns
+        return transcribe_batch(
+            audio_paths,
+            detect=self.detect,
+            transcribe_windows=self.transcribe_windows,
+            process_one=self.process_one,
+            batch_size=self.batch_size,
+            max_file_seconds=self.batch_max_file_seconds,
+            fingerprints=self.fingerprints,
+        )
+
+    def close(self) -> None:
+        if self.window_executor is not None:
+            self.window_executor.shutdown(cancel_futures=True)
+        if self.executor is not None and self.executor is not self.pool:
+            self.executor.shutdown(cancel_futures=True)
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+        if self.fingerprints is not None:
+            self.fingerprints.close()
+
+
+def start_transcription_runtime() -> TranscriptionRuntime:
+    ensure_output_dirs()
+    prune_pcm_cache(iter_audio_files(), PCM_CACHE_MAX_AGE_SECONDS)
+    workers = get_transcribe_workers()
+    chunk_seconds = get_chunk_seconds()
+    batch_size = get_batch_size()
+    config = load_backend_config()
+    if config.language_routes is None:
+        log(f"transcription backend: {config.engine} ({config.model_name})")
+    else:
+        routes = config.language_routes
+        rules = ", ".join(f"{language}={model}" for language, model in routes.models)
+        log(f"transcription backend: {config.engine} ({rules}, otherwise {routes.default_model})")
+    pool = None
+    backend = None
+    if workers > 1:
+        pool = create_worker_pool(config, workers, get_threads_per_worker(workers))
+    else:
+        backend = load_backend(config)
+    # pool workers open their own index; files handled in this process need one here
+    fingerprints = open_fingerprint_index() if pool is None or chunk_seconds > 0 or batch_size > 1 else None
+
+    # chunked files are split in this process and their chunks fanned out to the pool;
+    # a few threads keep several files in flight so short files still fill the workers
+    executor: Executor | None = pool
+    process_one: Callable[[Path], TranscriptionOutcome]
+    if chunk_seconds > 0:
+        log(f"chunked mode: chunks of at most {chunk_seconds:g}s")
+        if pool is not None:
+            executor = ThreadPoolExecutor(max_workers=workers)
+        chunked_fn = partial(
+            transcribe_chunked,
+            backend=backend,
+            pool=pool,
+            chunk_seconds=chunk_seconds,
+            workers=workers,
+            detect_language=config.language_routes is not None,
+        )
+        process_one = partial(
+            transcribe_file,
+            backend=backend,
+            transcribe_fn=chunked_fn,
+            fingerprints=fingerprints,
+        )
+    elif pool is not None:
+        process_one = _transcribe_in_worker
+        if batch_size > 1:
+            # batches are gathered and decoded in this process, like chunked files; a file too
+            # long to batch still goes whole to a worker
+            executor = ThreadPoolExecutor(max_workers=workers)
+            process_one = partial(_transcribe_in_pool, pool)
+    else:
+        process_one = partial(transcribe_file, backend=backend, fingerprints=fingerprints)
+    batch_files = get_batch_files(batch_size)
+    batch_max_file_seconds = get_batch_max_file_seconds()
+    if batch_size > 1:
+        log(
+            f"batched mode: up to {batch_files} files per batch, {batch_size} windows per model call, "
+            f"files up to {batch_max_file_seconds:g}s"
+        )
+    backend_lock = None
+    if backend is not None:
+        backend_lock = threading.Lock()
+        process_one = _holding(backend_lock, process_one)
+    return TranscriptionRuntime(
+        process_one,
+        executor,
+        pool,
+        fingerprints,
+        workers,
+        backend=backend,
+        backend_lock=backend_lock,
+        detect_language=config.language_routes is not None,
+        batch_size=batch_size,
+        batch_files=batch_files,
+        batch_max_file_seconds=batch_max_file_seconds,
+    )
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    runtime = start_transcription_runtime()
+    process_one = runtime.process_one
+    executor = runtime.executor
+    try:
+        if args.watch:
+            try:
+                watch(
+                    process_one,
+                    get_watch_poll_seconds(),
+                    args.idle_exit,
+                    executor,
+                    runtime.process_batch if runtime.batch_size > 1 else None,
+                    runtime.batch_files,
+                )
+            except KeyboardInterrupt:
+                log("stopping watch mode")
+            return
+
+        started = time.monotonic()
+        audio_paths = iter_audio_files()
+        if runtime.batch_size > 1:
+            batches = [
+                audio_paths[start : start + runtime.batch_files]
+                for start in range(0, len(audio_paths), runtime.batch_files)
+            ]
+            run = executor.map if executor is not None else map
+            outcomes = [outcome for batch in run(runtime.process_batch, batches) for outcome in batch]
+        elif executor is not None:
+            outcomes = list(executor.map(process_one, audio_paths))
+        else:
+            outcomes = [process_one(audio_path) for audio_path in audio_paths]
+        report_throughput(outcomes, time.monotonic() - started, runtime.workers)
+        log("done.")
+    finally:
+        runtime.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import os
+import time
+import zlib
+from dataclasses import replace
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+
+import metrics
+from audio_chunks import SAMPLE_RATE
+from pcm_cache import load_cached_pcm
+from transcribe_helpers import (
+    BackendConfig,
+    LanguageDetection,
+    LanguageRoutes,
+    TranscriptSegment,
+    get_pcm_cache_enabled,
+    load_backend_config,
+)
+
+# Whisper's encoder sees 30 s at a time; it identifies the language from the first window
+WINDOW_SECONDS = 30
+LANGUAGE_DETECTION_SAMPLES = WINDOW_SECONDS * SAMPLE_RATE
+# openai-whisper transcribe()'s defaults for giving up on a greedy decode
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+
+def _compression_ratio(text: str) -> float:
+    data = text.encode("utf-8")
+    return len(data) / len(zlib.compress(data)) if data else 0.0
+
+
+def _batched_text(text: str, avg_logprob: float, no_speech_prob: float, compression_ratio: float) -> str | None:
+    # silence comes back empty, as transcribe() skips it; None means the greedy pass looped or
+    # guessed, and the window is redone on its own with the engine's temperature fallback
+    if no_speech_prob > NO_SPEECH_THRESHOLD and avg_logprob < LOGPROB_THRESHOLD:
+        return ""
+    if compression_ratio > COMPRESSION_RATIO_THRESHOLD or avg_logprob < LOGPROB_THRESHOLD:
+        return None
+    return text.strip()
+
+
+class WhisperBackend:
+    # openai-whisper on PyTorch; fp32 on CPU
+    name = "whisper"
+    lazy_segments = False
+
+    def __init__(self, model) -> None:
+        self._model = model
+
+    @classmethod
+    def load(cls, config: BackendConfig, threads: int) -> WhisperBackend:
+        import torch
+        import whisper
+
+        if threads > 0:
+            torch.set_num_threads(threads)
+        return cls(whisper.load_model(config.model_name))
+
+    @staticmethod
+    def load_audio(audio_path: Path) -> np.ndarray:
+        import whisper
+
+        return whisper.load_audio(str(audio_path))
+
+    def detect_language(self, audio: np.ndarray) -> tuple[str, float]:
+        import whisper
+
+        segment = whisper.pad_or_trim(audio[:LANGUAGE_DETECTION_SAMPLES])
+        mel = whisper.log_mel_spectrogram(segment, n_mels=self._model.dims.n_mels).to(self._model.device)
+        _, probabilities = self._model.detect_language(mel)
+        language = max(probabilities, key=probabilities.get)
+        return language, float(probabilities[language])
+
+    def transcribe(self, audio: np.ndarray, language: str | None = None) -> str:
+        return (self._model.transcribe(audio, language=language).get("text") or "").strip()
+
+    def transcribe_segments(
+        self,
+        audio: np.ndarray,
+        language: str | None = None,
+        initial_prompt: str | None = None,
+    ) -> Iterator[TranscriptSegment]:
+        # openai-whisper hands its segments back only once the whole input is decoded
+        result = self._model.transcribe(audio, language=language, initial_prompt=initial_prompt)
+        for segment in result.get("segments") or []:
+            yield TranscriptSegment(float(segment["start"]), float(segment["end"]), segment["text"])
+
+    def transcribe_batch(self, windows: list[np.ndarray], language: str | None = None) -> list[str]:
+        # windows of at most 30 s, from one file or many: one encoder and one decoder pass
+        # for all of them instead of a transcribe() call each
+        import torch
+        import whisper
+
+        mel = torch.stack(
+            [
+                whisper.log_mel_spectrogram(whisper.pad_or_trim(window), n_mels=self._model.dims.n_mels)
+                for window in windows
+            ]
+        ).to(self._model.device)
+        options = whisper.DecodingOptions(
+            language=language,
+            without_timestamps=True,
+            fp16=self._model.device.type != "cpu",
+        )
+        texts = []
+        for window, result in zip(windows, whisper.decode(self._model, mel, options)):
+            text = _batched_text(result.text, result.avg_logprob, result.no_speech_prob, result.compression_ratio)
+            texts.append(self.transcribe(window, language) if text is None else text)
+        return texts
+
+
+class CTranslate2Backend:
+    # faster-whisper: the same Whisper checkpoints converted to CTranslate2, int8 on CPU by default
+    name = "ctranslate2"
+    lazy_segments = True
+
+    def __init__(self, model) -> None:
+        self._model = model
+
+    @classmethod
+    def load(cls, config: BackendConfig, threads: int) -> CTranslate2Backend:
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError as exc:
+            raise RuntimeError(
+                "TRANSCRIBE_BACKEND=ctranslate2 needs faster-whisper (pip install faster-whisper)"
+            ) from exc
+
+        return cls(
+            WhisperModel(
+                config.model_name,
+                device="cpu",
+                compute_type=config.compute_type,
+                cpu_threads=threads or (os.cpu_count() or 0),
+            )
+        )
+
+    @staticmethod
+    def load_audio(audio_path: Path) -> np.ndarray:
+        from faster_whisper import decode_audio
+
+        return decode_audio(str(audio_path), sampling_rate=SAMPLE_RATE)
+
+    def detect_language(self, audio: np.ndarray) -> tuple[str, float]:
+        # faster-whisper detects eagerly and decodes lazily: leaving the segments unread costs
+        # only the encoder pass over the first window
+        _, info = self._model.transcribe(audio[:LANGUAGE_DETECTION_SAMPLES], beam_size=1)
+        return info.language, float(info.language_probability)
+
+    def transcribe(self, audio: np.ndarray, language: str | None = None) -> str:
+        # greedy decoding with temperature fallback, like openai-whisper's transcribe(); whisper's
+        # "text" is also its segment texts joined and stripped
+        segments, _ = self._model.transcribe(audio, language=language, beam_size=1)
+        return "".join(segment.text for segment in segments).strip()
+
+    def transcribe_segments(
+        self,
+        audio: np.ndarray,
+        language: str | None = None,
+        initial_prompt: str | None = None,
+    ) -> Iterator[TranscriptSegment]:
+        # segments are decoded lazily, so each one can be checkpointed as soon as it exists
+        segments, _ = self._model.transcribe(audio, language=language, beam_size=1, initial_prompt=initial_prompt)
+        for segment in segments:
+            yield TranscriptSegment(float(segment.start), float(segment.end), segment.text)
+
+    def transcribe_batch(self, windows: list[np.ndarray], language: str | None = None) -> list[str]:
+        # faster-whisper only batches the windows of one file; the CTranslate2 model under it
+        # takes any stack of mel windows, so several files share each encoder and decoder pass
+        from faster_whisper.tokenizer import Tokenizer
+
+        extractor = self._model.feature_extractor
+        features = np.stack(
+            [
+                extractor(np.pad(window, (0, max(0, extractor.n_samples - len(window)))))[:, : extractor.nb_max_frames]
+                for window in windows
+            ]
+        )
+        encoder_output = self._model.encode(features)
+        multilingual = self._model.model.is_multilingual
+        if language is None and multilingual:
+            # best "<|xx|>" token per window
+            languages = [scores[0][0][2:-2] for scores in self._model.model.detect_language(encoder_output)]
+        else:
+            languages = [language or "en"] * len(windows)
+        tokenizers = {
+            code: Tokenizer(self._model.hf_tokenizer, multilingual, task="transcribe", language=code)
+            for code in set(languages)
+        }
+        results = self._model.model.generate(
+            encoder_output,
+            [[*tokenizers[code].sot_sequence, tokenizers[code].no_timestamps] for code in languages],
+            beam_size=1,
+            max_length=self._model.max_length,
+            return_scores=True,
+            return_no_speech_prob=True,
+            suppress_blank=True,
+            suppress_tokens=[-1],
+        )
+        texts = []
+        for window, code, result in zip(windows, languages, results):
+            tokens = result.sequences_ids[0]
+            text = tokenizers[code].decode(tokens)
+            # generate() scores the sequence per token; whisper averages over tokens + 1
+            avg_logprob = result.scores[0] * len(tokens) / (len(tokens) + 1)
+            batched = _batched_text(text, avg_logprob, result.no_speech_prob, _compression_ratio(text))
+            texts.append(self.transcribe(window, code) if batched is None else batched)
+        return texts
+
+
+BACKENDS = {backend.name: backend for backend in (WhisperBackend, CTranslate2Backend)}
+
+
+class RoutedBackend:
+    # one warm model per route; the multilingual default also does the detection
+    def __init__(self, routes: LanguageRoutes, backends: dict[str, object]) -> None:
+        self._routes = routes
+        self._backends = backends
+
+    def detect(self, audio: np.ndarray) -> LanguageDetection:
+        language, probability = self._backends[self._routes.default_model].detect_language(audio)
+        return LanguageDetection(language, probability, self._routes.model_for(language, probability))
+
+    def transcribe(self, audio: np.ndarray, detection: LanguageDetection | None = None) -> str:
+        if detection is None:
+            detection = self.detect(audio)
+        # passing the language on skips the model's own detection (and keeps every chunk of a
+        # file in the same language)
+        return self._backends[detection.model].transcribe(audio, detection.language)
+
+    def transcribe_segments(
+        self,
+        audio: np.ndarray,
+        detection: LanguageDetection | None = None,
+        initial_prompt: str | None = None,
+    ) -> Iterator[TranscriptSegment]:
+        if detection is None:
+            detection = self.detect(audio)
+        return self._backends[detection.model].transcribe_segments(audio, detection.language, initial_prompt)
+
+    def engine_for(self, detection: LanguageDetection | None):
+        return self._backends[self._routes.default_model if detection is None else detection.model]
+
+    def transcribe_batch(self, windows: list[np.ndarray], detection: LanguageDetection | None = None) -> list[str]:
+        # callers batch windows per detection, so one batch is one model and one language
+        if detection is None:
+            return self._backends[self._routes.default_model].transcribe_batch(windows)
+        return self._backends[detection.model].transcribe_batch(windows, detection.language)
+
+
+def decodes_lazily(backend, detection: LanguageDetection | None) -> bool:
+    # whether transcribe_segments() yields each segment as soon as it is decoded
+    engine = backend.engine_for(detection) if isinstance(backend, RoutedBackend) else backend
+    return engine.lazy_segments
+
+
+def detect_route(backend, audio: np.ndarray) -> LanguageDetection | None:
+    # single-model backends transcribe in whatever language the model itself detects
+    return backend.detect(audio) if isinstance(backend, RoutedBackend) else None
+
+
+def _load_engine(config: BackendConfig, model_name: str, threads: int):
+    started = time.perf_counter()
+    backend = BACKENDS[config.engine].load(replace(config, model_name=model_name), threads)
+    metrics.record(
+        "transcribe_model_load",
+        backend=config.engine,
+        model=model_name,
+        seconds=time.perf_counter() - started,
+    )
+    return backend
+
+
+def load_backend(config: BackendConfig, threads: int = 0):
+    routes = config.language_routes
+    if routes is None:
+        return _load_engine(config, config.model_name, threads)
+    return RoutedBackend(
+        routes,
+        {model_name: _load_engine(config, model_name, threads) for model_name in routes.model_names},
+    )
+
+
+def decode_audio(audio_path: Path) -> np.ndarray:
+    # decode with the configured engine's own loader, so the ctranslate2 path never imports torch
+    load_audio = BACKENDS[load_backend_config().engine].load_audio
+    if not get_pcm_cache_enabled():
+        return load_audio(audio_path)
+    return load_cached_pcm(audio_path, load_audio)
@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+
+def _human_timestamp() -> str:
+    return datetime.now().astimezone().strftime("%Y-%m-%d %H:%M:%S %z")
+
+
+def log(*args: object, **kwargs: object) -> None:
+    print(f"[{_human_timestamp()}]", *args, **kwargs)
+
+
+AUDIO_DIR = Path("audios")
+FINISHED_DIR = Path("finished")
+TRANSCRIPTIONS_DIR = Path("transcriptions")
+ARCHIVE_TRANSCRIPTIONS_DIR = TRANSCRIPTIONS_DIR / "archive"
+# yt-dlp keeps the native stream: opus/webm/m4a from YouTube, mp3 and others from elsewhere
+AUDIO_SUFFIXES = (".mp3", ".wav", ".m4a", ".flac", ".ogg", ".opus", ".webm", ".aac")
+WHISPER_MODEL_NAME = "small"
+TRANSCRIBE_BACKEND_NAMES = ("whisper", "ctranslate2")
+DEFAULT_TRANSCRIBE_BACKEND = "whisper"
+DEFAULT_COMPUTE_TYPE = "int8"
+DEFAULT_LANGUAGE_ROUTES = "auto"
+DEFAULT_LANGUAGE_MIN_PROBABILITY = 0.5
+# multilingual sizes that have an English-only ".en" sibling
+ENGLISH_ONLY_VARIANTS = ("tiny", "base", "small", "medium")
+LANGUAGE_SIDECAR_SUFFIX = ".lang.json"
+PARTIAL_TRANSCRIPT_SUFFIX = ".partial.jsonl"
+STATE_DIR = Path(".state")
+THROUGHPUT_STATE_PATH = STATE_DIR / "transcribe_throughput.json"
+FINGERPRINT_INDEX_PATH = STATE_DIR / "audio_fingerprints.sqlite3"
+PCM_CACHE_DIR = STATE_DIR / "pcm"
+# streamed audio is written here while it downloads, then moved to finished/
+STREAM_DIR = STATE_DIR / "streams"
+
+DEFAULT_WATCH_POLL_SECONDS = 0.5
+DEFAULT_TRANSCRIBE_WORKERS = 1
+DEFAULT_THREADS_PER_WORKER = 0
+DEFAULT_CHUNK_SECONDS = 0
+DEFAULT_DEDUPE = 1
+DEFAULT_PCM_CACHE = 1
+# about 18 hours of 16 kHz float32 audio
+DEFAULT_PCM_CACHE_MAX_MB = 4096
+DEFAULT_CHECKPOINT_SECONDS = 300
+DEFAULT_BATCH_SIZE = 1
+DEFAULT_BATCH_MAX_FILE_SECONDS = 120.0
+PCM_CACHE_MAX_AGE_SECONDS = 24 * 3600
+
+
+@dataclass(frozen=True)
+class TranscriptionOutcome:
+    ok: bool
+    audio_seconds: float = 0.0
+    elapsed_seconds: float = 0.0
+
+
+@dataclass(frozen=True)
+class LanguageRoutes:
+    default_model: str
+    models: tuple[tuple[str, str], ...]
+    min_probability: float
+
+    def model_for(self, language: str, probability: float = 1.0) -> str:
+        # unsure detections go to the multilingual default rather than a specialised model
+        if probability < self.min_probability:
+            return self.default_model
+        return dict(self.models).get(language, self.default_model)
+
+    @property
+    def model_names(self) -> list[str]:
+        return list(dict.fromkeys([self.default_model, *(model for _, model in self.models)]))
+
+
+@dataclass(frozen=True)
+class BackendConfig:
+    engine: str
+    model_name: str
+    compute_type: str
+    language_routes: LanguageRoutes | None = None
+
+
+@dataclass(frozen=True)
+class LanguageDetection:
+    language: str
+    probability: float
+    model: str
+
+
+@dataclass(frozen=True)
+class TranscriptSegment:
+    # seconds from the start of the audio that was passed to the model
+    start: float
+    end: float
+    text: str
+
+
+def is_audio_file(path: Path) -> bool:
+    # yt-dlp's ffmpeg postprocessor writes "<title>.temp.<ext>" before renaming.
+    return path.suffix.lower() in AUDIO_SUFFIXES and not path.stem.endswith(".temp")
+
+
+def realtime_factor(outcomes: list[TranscriptionOutcome], wall_seconds: float) -> float:
+    audio_seconds = sum(outcome.audio_seconds for outcome in outcomes if outcome.ok)
+    if wall_seconds <= 0 or audio_seconds <= 0:
+        return 0.0
+    return audio_seconds / wall_seconds
+
+
+def load_serial_realtime_factor() -> float:
+    try:
+        data = json.loads(THROUGHPUT_STATE_PATH.read_text(encoding="utf-8"))
+        return float(data.get("serial_realtime_factor", 0.0))
+    except Exception:
+        return 0.0
+
+
+def save_serial_realtime_factor(value: float) -> None:
+    THROUGHPUT_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    THROUGHPUT_STATE_PATH.write_text(
+        json.dumps({"serial_realtime_factor": value}, ensure_ascii=True, indent=2) + "\n",
+        encoding="utf-8",
+    )
+
+
+def get_watch_poll_seconds() -> float:
+    return get_positive_float_env(
+        "TRANSCRIBE_WATCH_POLL_SECONDS",
+        DEFAULT_WATCH_POLL_SECONDS,
+    )
+
+
+def get_positive_float_env(name: str, default: float) -> float:
+    raw = os.getenv(name, str(default))
+    try:
+        value = float(raw)
+    except ValueError:
+        log(f"invalid {name}={raw!r}; using {default}")
+        return default
+    if value <= 0:
+        log(f"{name} must be > 0 (got {raw!r}); using {default}")
+        return default
+    return value
+
+
+def get_transcribe_workers() -> int:
+    return get_positive_int_env("TRANSCRIBE_WORKERS", DEFAULT_TRANSCRIBE_WORKERS)
+
+
+def get_threads_per_worker(workers: int) -> int:
+    threads = get_non_negative_int_env(
+        "TRANSCRIBE_THREADS_PER_WORKER",
+        DEFAULT_THREADS_PER_WORKER,
+    )
+    if threads == 0:
+        return max(1, (os.cpu_count() or 1) // workers)
+    return threads
+
+
+def get_chunk_seconds() -> int:
+    return get_non_negative_int_env("TRANSCRIBE_CHUNK_SECONDS", DEFAULT_CHUNK_SECONDS)
+
+
+def get_dedupe_enabled() -> bool:
+    return get_non_negative_int_env("TRANSCRIBE_DEDUPE", DEFAULT_DEDUPE) > 0
+
+
+def get_pcm_cache_enabled() -> bool:
+    return get_non_negative_int_env("TRANSCRIBE_PCM_CACHE", DEFAULT_PCM_CACHE) > 0
+
+
+def get_pcm_cache_max_mb() -> int:
+    return get_positive_int_env("TRANSCRIBE_PCM_CACHE_MAX_MB", DEFAULT_PCM_CACHE_MAX_MB)
+
+
+def get_checkpoint_seconds() -> int:
+    return get_non_negative_int_env("TRANSCRIBE_CHECKPOINT_SECONDS", DEFAULT_CHECKPOINT_SECONDS)
+
+
+def get_batch_size() -> int:
+    return get_positive_int_env("TRANSCRIBE_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+
+
+def get_batch_files(batch_size: int) -> int:
+    # files gathered per batch; their windows are then split into calls of batch_size
+    return get_positive_int_env("TRANSCRIBE_BATCH_FILES", batch_size)
+
+
+def get_batch_max_file_seconds() -> float:
+    return get_positive_float_env("TRANSCRIBE_BATCH_MAX_FILE_SECONDS", DEFAULT_BATCH_MAX_FILE_SECONDS)
+
+
+def load_backend_config() -> BackendConfig:
+    engine = os.getenv("TRANSCRIBE_BACKEND", DEFAULT_TRANSCRIBE_BACKEND).strip().lower()
+    if engine not in TRANSCRIBE_BACKEND_NAMES:
+        log(f"invalid TRANSCRIBE_BACKEND={engine!r}; using {DEFAULT_TRANSCRIBE_BACKEND}")
+        engine = DEFAULT_TRANSCRIBE_BACKEND
+    model_name = os.getenv("WHISPER_MODEL", WHISPER_MODEL_NAME).strip() or WHISPER_MODEL_NAME
+    return BackendConfig(
+        engine=engine,
+        model_name=model_name,
+        compute_type=os.getenv("TRANSCRIBE_COMPUTE_TYPE", DEFAULT_COMPUTE_TYPE).strip() or DEFAULT_COMPUTE_TYPE,
+        language_routes=load_language_routes(model_name),
+    )
+
+
+def load_language_routes(model_name: str) -> LanguageRoutes | None:
+    # "auto": English to the ".en" sibling of WHISPER_MODEL; "off": one model, no detection;
+    # otherwise "lang=model" pairs, with "*=model" naming the multilingual default
+    raw = os.getenv("TRANSCRIBE_LANGUAGE_ROUTES", DEFAULT_LANGUAGE_ROUTES).strip()
+    if raw.lower() in {"", "off", "none", "0"}:
+        return None
+    default_model = model_name
+    models: dict[str, str] = {}
+    if raw.lower() == "auto":
+        if model_name not in ENGLISH_ONLY_VARIANTS:
+            return None
+        models["en"] = f"{model_name}.en"
+    else:
+        for rule in raw.split(","):
+            language, separator, target = (part.strip() for part in rule.partition("="))
+            if not separator or not language or not target:
+                log(f"ignoring invalid TRANSCRIBE_LANGUAGE_ROUTES rule {rule.strip()!r}")
+                continue
+            if language == "*":
+                default_model = target
+            else:
+                models[language.lower()] = target
+    if default_model.endswith(".en"):
+        log(f"language routing needs a multilingual default model (got {default_model!r}); routing disabled")
+        return None
+    if not models:
+        return None
+    return LanguageRoutes(
+        default_model=default_model,
+        models=tuple(sorted(models.items())),
+        min_probability=get_probability_env(
+            "TRANSCRIBE_LANGUAGE_MIN_PROBABILITY",
+            DEFAULT_LANGUAGE_MIN_PROBABILITY,
+        ),
+    )
+
+
+def language_sidecar_path(transcript_path: Path) -> Path:
+    return transcript_path.with_name(f"{transcript_path.stem}{LANGUAGE_SIDECAR_SUFFIX}")
+
+
+def partial_transcript_path(transcript_path: Path) -> Path:
+    # hidden like the lock file, so nothing that globs "*.txt" mistakes it for a transcript
+    return transcript_path.with_name(f".{transcript_path.stem}{PARTIAL_TRANSCRIPT_SUFFIX}")
+
+
+def get_probability_env(name: str, default: float) -> float:
+    raw = os.getenv(name, str(default))
+    try:
+        value = float(raw)
+    except ValueError:
+        log(f"invalid {name}={raw!r}; using {default}")
+        return default
+    if not 0.0 <= value <= 1.0:
+        log(f"{name} must be between 0 and 1 (got {raw!r}); using {default}")
+        return default
+    return value
+
+
+def get_positive_int_env(name: str, default: int) -> int:
+    raw = os.getenv(name, str(default))
+    try:
+        value = int(raw)
+    except ValueError:
+        log(f"invalid {name}={raw!r}; using {default}")
+        return default
+    if value <= 0:
+        log(f"{name} must be > 0 (got {raw!r}); using {default}")
+        return default
+    return value
+
+
+def get_non_negative_int_env(name: str, default: int) -> int:
+    raw = os.getenv(name, str(default))
+    try:
+        value = int(raw)
+    except ValueError:
+        log(f"invalid {name}={raw!r}; using {default}")
+        return default
+    if value < 0:
+        log(f"{name} must be >= 0 (got {raw!r}); using {default}")
+        return default
+    return value
+
+
+def get_non_negative_float_env(name: str, default: float) -> float:
+    raw = os.getenv(name, str(default))
+    try:
+        value = float(raw)
+    except ValueError:
+        log(f"invalid {name}={raw!r}; using {default}")
+        return default
+    if value < 0:
+        log(f"{name} must be >= 0 (got {raw!r}); using {default}")
+        return default
+    return value
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+
+from audio_chunks import SAMPLE_RATE, join_chunk_texts
+from transcribe_helpers import TranscriptSegment, get_checkpoint_seconds, log, partial_transcript_path
+
+# whisper keeps at most 223 prompt tokens anyway; this is comfortably more than that in characters
+PROMPT_CHARS = 1000
+
+
+class TranscriptCheckpoint:
+    # ".<stem>.partial.jsonl": a header naming the audio, then one line per finished segment
+    # and one "done" line per finished window, in seconds from the start of the file; every
+    # append is fsynced, so a killed worker loses at most the segment it was decoding
+    def __init__(self, path: Path, audio_name: str, samples: int, window_seconds: float) -> None:
+        self.path = path
+        self.window_seconds = window_seconds
+        self.segments: list[TranscriptSegment] = []
+        self._header = {"audio": audio_name, "samples": samples}
+        self._samples = samples
+        self._done_seconds = 0.0
+        self._load()
+
+    @property
+    def resume_sample(self) -> int:
+        return min(self._samples, round(self._done_seconds * SAMPLE_RATE))
+
+    def _load(self) -> None:
+        try:
+            raw = self.path.read_bytes()
+        except FileNotFoundError:
+            return
+        records: list[dict[str, object]] = []
+        valid_bytes = 0
+        # only newline-terminated lines are complete; a crash mid-append leaves a torn tail
+        for line in raw.split(b"\n")[:-1]:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            valid_bytes += len(line) + 1
+        if not records or records[0] != self._header:
+            if records:
+                log(f"discarding {self.path.name} (written for different audio)")
+            self.discard()
+            return
+        try:
+            for record in records[1:]:
+                if "text" in record:
+                    segment = TranscriptSegment(float(record["start"]), float(record["end"]), str(record["text"]))
+                    self.segments.append(segment)
+                    self._done_seconds = max(self._done_seconds, segment.end)
+                else:
+                    self._done_seconds = max(self._done_seconds, float(record["done"]))
+        except (KeyError, TypeError, ValueError) as exc:
+            log(f"discarding unreadable {self.path.name}: {exc}")
+            self.segments = []
+            self._done_seconds = 0.0
+            self.discard()
+            return
+        if valid_bytes < len(raw):
+            with self.path.open("r+b") as file:
+                file.truncate(valid_bytes)
+
+    def _write(self, record: dict[str, object]) -> None:
+        lines = [record]
+        if not self.path.exists():
+            lines.insert(0, self._header)
+        with self.path.open("a", encoding="utf-8") as file:
+            file.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def append(self, segment: TranscriptSegment) -> None:
+        self._write({"start": round(segment.start, 3), "end": round(segment.end, 3), "text": segment.text})
+        self.segments.append(segment)
+        self._done_seconds = max(self._done_seconds, segment.end)
+
+    def complete_through(self, seconds: float) -> None:
+        # a window can end in silence after its last segment; resume after the window, not the segment
+        self._write({"done": round(seconds, 3)})
+        self._done_seconds = max(self._done_seconds, seconds)
+
+    def text(self) -> str:
+        return join_chunk_texts([segment.text for segment in self.segments])
+
+    def prompt(self) -> str | None:
+        # the text so far, to carry the decoder's context across a window or a resume
+        text = self.text()
+        if len(text) > PROMPT_CHARS:
+            text = text[-PROMPT_CHARS:].split(" ", 1)[-1]
+        return text or None
+
+    def discard(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+def open_checkpoint(transcript_path: Path, audio_name: str, samples: int) -> TranscriptCheckpoint | None:
+    # a file that fits in one window has nothing to resume from
+    window_seconds = get_checkpoint_seconds()
+    if window_seconds <= 0 or samples <= window_seconds * SAMPLE_RATE:
+        return None
+    return TranscriptCheckpoint(partial_transcript_path(transcript_path), audio_name, samples, window_seconds)
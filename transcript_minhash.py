@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from summarize_helpers import (
+    ARCHIVE_TRANSCRIPTIONS_DIR,
+    SUMMARIES_DIR,
+    TRANSCRIPT_MINHASH_PATH,
+    TRANSCRIPTIONS_DIR,
+    get_near_duplicate_threshold,
+    log,
+)
+
+SHINGLE_WORDS = 3
+MINHASH_PERMUTATIONS = 128
+# 32 bands of 4 rows: pairs above ~0.5 similarity share at least one bucket almost always,
+# pairs below ~0.2 almost never
+LSH_BANDS = 32
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+# shingles hashed per numpy pass, so hour-long transcripts stay within a few MB
+SHINGLE_BLOCK = 4096
+SIGNATURE_CACHE_SIZE = 256
+_WORD_RE = re.compile(r"\w+")
+_SHINGLE_MULTIPLIER = np.uint64(0x100000001B3)
+# multiply-shift hashes, one per permutation; the fixed seed keeps stored signatures
+# comparable across runs
+_rng = np.random.default_rng(0x7A5C)
+_A = _rng.integers(1, 1 << 63, MINHASH_PERMUTATIONS, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 1 << 63, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def shingle_hashes(text: str) -> np.ndarray:
+    # overlapping word triples, folded to 32 bits: punctuation, case and line breaks do not matter
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        return np.empty(0, dtype=np.uint64)
+    word_hashes = np.fromiter((zlib.crc32(word.encode("utf-8")) for word in words), dtype=np.uint64, count=len(words))
+    count = len(words) - SHINGLE_WORDS + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(SHINGLE_WORDS):
+        hashes = hashes * _SHINGLE_MULTIPLIER + word_hashes[offset : offset + count]
+    return np.unique((hashes >> np.uint64(32)) ^ (hashes & np.uint64(0xFFFFFFFF)))
+
+
+def minhash_signature(text: str) -> np.ndarray | None:
+    hashes = shingle_hashes(text)
+    if len(hashes) == 0:
+        return None
+    signature = np.full(MINHASH_PERMUTATIONS, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(hashes), SHINGLE_BLOCK):
+        block = hashes[start : start + SHINGLE_BLOCK]
+        values = (_A[:, None] * block[None, :] + _B[:, None]) >> np.uint64(32)
+        signature = np.minimum(signature, values.min(axis=1))
+    return signature
+
+
+@lru_cache(maxsize=SIGNATURE_CACHE_SIZE)
+def _file_signature(path: str, mtime_ns: int) -> np.ndarray | None:
+    return minhash_signature(Path(path).read_text(encoding="utf-8"))
+
+
+def file_signature(path: Path) -> np.ndarray | None:
+    # keyed by mtime: the lookup before a request and the add after its summary share one pass
+    return _file_signature(str(path), path.stat().st_mtime_ns)
+
+
+def estimated_similarity(left: np.ndarray, right: np.ndarray) -> float:
+    # the share of agreeing minimums estimates the Jaccard similarity of the shingle sets
+    return float(np.mean(left == right))
+
+
+def _band_buckets(signature: np.ndarray) -> list[int]:
+    return [
+        int.from_bytes(
+            hashlib.blake2b(signature[band * LSH_ROWS : (band + 1) * LSH_ROWS].tobytes(), digest_size=8).digest(),
+            "big",
+            signed=True,
+        )
+        for band in range(LSH_BANDS)
+    ]
+
+
+class TranscriptIndex:
+    def __init__(self, path: Path, threshold: float) -> None:
+        self.threshold = threshold
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS transcripts (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE,
+                signature BLOB NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS bands (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                transcript_id INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS bands_bucket ON bands (band, bucket);
+            CREATE INDEX IF NOT EXISTS bands_transcript ON bands (transcript_id);
+            """
+        )
+
+    def add(self, name: str, transcript_path: Path) -> None:
+        signature = file_signature(transcript_path)
+        if signature is None:
+            return
+        with self._lock, self._db:
+            self._insert(name, signature)
+
+    def _insert(self, name: str, signature: np.ndarray) -> None:
+        # a re-summarized transcript replaces its earlier entry
+        self._db.execute(
+            "DELETE FROM bands WHERE transcript_id IN (SELECT id FROM transcripts WHERE name = ?)",
+            (name,),
+        )
+        self._db.execute("DELETE FROM transcripts WHERE name = ?", (name,))
+        cursor = self._db.execute(
+            "INSERT INTO transcripts (name, signature, created_at) VALUES (?, ?, ?)",
+            (name, signature.tobytes(), time.time()),
+        )
+        self._db.executemany(
+            "INSERT INTO bands (band, bucket, transcript_id) VALUES (?, ?, ?)",
+            ((band, bucket, cursor.lastrowid) for band, bucket in enumerate(_band_buckets(signature))),
+        )
+
+    def find_similar(self, transcript_path: Path) -> list[tuple[str, float]]:
+        # only transcripts sharing a band bucket are compared, so a lookup costs one index
+        # probe per band however large the archive grows
+        signature = file_signature(transcript_path)
+        if signature is None:
+            return []
+        candidates: dict[str, bytes] = {}
+        with self._lock:
+            for band, bucket in enumerate(_band_buckets(signature)):
+                for name, stored in self._db.execute(
+                    "SELECT transcripts.name, transcripts.signature FROM bands "
+                    "JOIN transcripts ON transcripts.id = bands.transcript_id "
+                    "WHERE bands.band = ? AND bands.bucket = ?",
+                    (band, bucket),
+                ):
+                    candidates[name] = stored
+        ranked = sorted(
+            (
+                (estimated_similarity(signature, np.frombuffer(stored, dtype=np.uint64)), name)
+                for name, stored in candidates.items()
+            ),
+            reverse=True,
+        )
+        return [(name, similarity) for similarity, name in ranked if similarity >= self.threshold]
+
+    def sync(self) -> int:
+        # transcripts summarized before the index existed (or while it was turned off), added
+        # in one transaction
+        with self._lock, self._db:
+            known = {name for (name,) in self._db.execute("SELECT name FROM transcripts")}
+            added = 0
+            for directory in (TRANSCRIPTIONS_DIR, ARCHIVE_TRANSCRIPTIONS_DIR):
+                if not directory.is_dir():
+                    continue
+                for path in sorted(directory.glob("*.txt")):
+                    if path.stem in known or not (SUMMARIES_DIR / f"{path.stem}.md").is_file():
+                        continue
+                    try:
+                        signature = minhash_signature(path.read_text(encoding="utf-8"))
+                    except OSError:
+                        continue
+                    if signature is None:
+                        continue
+                    self._insert(path.stem, signature)
+                    known.add(path.stem)
+                    added += 1
+        return added
+
+    def close(self) -> None:
+        self._db.close()
+
+
+_indexes: dict[Path, TranscriptIndex | None] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_transcript_index() -> TranscriptIndex | None:
+    # one per process and working directory, like the job store; None when turned off
+    path = TRANSCRIPT_MINHASH_PATH.resolve()
+    with _indexes_lock:
+        if path not in _indexes:
+            threshold = get_near_duplicate_threshold()
+            index = None
+            if threshold > 0:
+                index = TranscriptIndex(path, threshold)
+                added = index.sync()
+                if added:
+                    log(f"near-duplicate index: added {added} summarized transcripts")
+            _indexes[path] = index
+        return _indexes[path]
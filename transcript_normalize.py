@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+
+from summarize_helpers import NormalizeConfig, estimate_tokens
+
+_WORD_CHARS_RE = re.compile(r"[^\w']+")
+_TERMINAL_PUNCTUATION = ".!?"
+# filler words are English ("um", "er"); elsewhere they can be real words: German "er" is "he"
+FILLER_LANGUAGES = frozenset({"en"})
+# a single repeated word is only collapsed from this many copies: "no no" and "bye bye"
+# are real speech, "the the the" is a disfluency or a decoding loop
+_MIN_UNIGRAM_REPEATS = 3
+
+
+@dataclass(frozen=True)
+class NormalizedTranscript:
+    text: str
+    tokens_before: int
+    tokens_after: int
+
+    @property
+    def tokens_saved(self) -> int:
+        return max(0, self.tokens_before - self.tokens_after)
+
+
+def _word_key(token: str) -> str:
+    return _WORD_CHARS_RE.sub("", token).lower()
+
+
+def remove_filler(tokens: list[str], filler_words: frozenset[str]) -> list[str]:
+    kept: list[str] = []
+    for token in tokens:
+        if _word_key(token) not in filler_words:
+            kept.append(token)
+            continue
+        # "so it works, uh." keeps its full stop on the previous word
+        ending = token[-1:]
+        if ending and ending in _TERMINAL_PUNCTUATION and kept and kept[-1][-1:] not in _TERMINAL_PUNCTUATION:
+            kept[-1] = kept[-1].rstrip(",;:") + ending
+    return kept
+
+
+def collapse_repeats(tokens: list[str], max_ngram: int) -> list[str]:
+    # keep one copy of any run of back-to-back identical n-grams ("thank you. thank you. ...");
+    # at each position the n covering the most tokens wins, so whole looped sentences collapse
+    keys = [_word_key(token) for token in tokens]
+    kept: list[str] = []
+    index = 0
+    while index < len(tokens):
+        best_size = 0
+        best_span = 0
+        for size in range(1, max_ngram + 1):
+            if index + 2 * size > len(tokens):
+                break
+            window = keys[index:index + size]
+            if not any(window):
+                continue
+            repeats = 1
+            while keys[index + repeats * size:index + (repeats + 1) * size] == window:
+                repeats += 1
+            if repeats < (_MIN_UNIGRAM_REPEATS if size == 1 else 2):
+                continue
+            if repeats * size > best_span:
+                best_size, best_span = size, repeats * size
+        if best_size:
+            copy = tokens[index:index + best_size]
+            # the last copy carries the punctuation that ended the run
+            copy[-1] = tokens[index + best_span - 1]
+            kept.extend(copy)
+            index += best_span
+        else:
+            kept.append(tokens[index])
+            index += 1
+    return kept
+
+
+def normalize_transcript(text: str, config: NormalizeConfig, language: str | None = None) -> NormalizedTranscript:
+    # language is the detected one from the transcript's sidecar; None when nothing was detected
+    tokens_before = estimate_tokens(text)
+    tokens = text.split()
+    if config.filler_words and (language is None or language in FILLER_LANGUAGES):
+        tokens = remove_filler(tokens, config.filler_words)
+    if config.max_ngram > 0:
+        tokens = collapse_repeats(tokens, config.max_ngram)
+    # joining on single spaces is the whitespace squeeze
+    normalized = " ".join(tokens)
+    return NormalizedTranscript(normalized, tokens_before, estimate_tokens(normalized))